@@ -23,17 +23,15 @@ from __future__ import division
 from __future__ import print_function
 
 import re
-import sys
-import unicodedata
 
 # pylint: disable=g-bad-import-order
-import six
 from absl import app as absl_app
 from absl import flags
 import tensorflow as tf
 # pylint: enable=g-bad-import-order
 
 from official.transformer.utils import metrics
+from official.transformer.utils import unicode_tables
 from official.utils.flags import core as flags_core
 
 
@@ -47,11 +45,18 @@ class UnicodeRegex(object):
     self.symbol_re = re.compile("([" + self.property_chars("S") + "])")
 
   def property_chars(self, prefix):
-    return "".join(six.unichr(x) for x in range(sys.maxunicode)
-                   if unicodedata.category(six.unichr(x)).startswith(prefix))
+    return unicode_tables.get_chars(prefix)
 
 
-uregex = UnicodeRegex()
+_uregex = None
+
+
+def _get_uregex():
+  """Return the UnicodeRegex, which is compiled when it is first used."""
+  global _uregex
+  if _uregex is None:
+    _uregex = UnicodeRegex()
+  return _uregex
 
 
 def bleu_tokenize(string):
@@ -78,6 +83,7 @@ def bleu_tokenize(string):
   Returns:
     a list of tokens
   """
+  uregex = _get_uregex()
   string = uregex.nondigit_punct_re.sub(r"\1 \2 ", string)
   string = uregex.punct_nondigit_re.sub(r" \1 \2", string)
   string = uregex.symbol_re.sub(r" \1 ", string)
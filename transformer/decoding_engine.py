@@ -0,0 +1,364 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Generate responses with continuous batching.
+
+A Translator decodes a batch of requests until its longest response is
+finished, so requests received in the meantime wait for the whole batch. A
+DecodingEngine decodes one step at a time in a fixed pool of slots (see
+model/slot_decoder.py). Between two steps, the slots of finished responses are
+refilled with newly received requests, so a request only waits for a free slot.
+
+The engine supports the decoding methods that generate a single sequence per
+latent sample: greedy, top_k and nucleus. Requests are either translated
+synchronously, like with a Translator, or submitted with a callback.
+
+The encoder states of recent inputs are kept in an EncoderCache. A request
+whose input is cached is not encoded again, and its responses are decoded from
+new latent samples of the cached prior.
+
+The slots have a fixed shape: inputs are padded to max_input_length before
+they are encoded, and every step attends over max_input_length encoder
+positions in each slot, whatever the length of its input. The cost of a step
+therefore grows with max_input_length rather than with the actual inputs, so
+it should be set to the longest expected input.
+
+Example:
+  engine = DecodingEngine(transformer3.Transformer, params, model_dir,
+                          subtokenizer, num_slots=64)
+  engine.warm_up()
+  response = engine.translate("how are you?")
+  engine.shutdown()
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import threading
+
+# pylint: disable=g-bad-import-order
+import numpy as np
+from six.moves import queue
+import tensorflow as tf
+# pylint: enable=g-bad-import-order
+
+from official.transformer import translate
+from official.transformer.model import slot_decoder
+from official.transformer.utils import encoder_cache
+from official.transformer.utils import inference_checkpoint
+from official.transformer.utils import tokenizer
+
+_NUM_SLOTS = 32
+
+
+class _Request(object):
+  """An encoded input, and the sequences decoded for its latent samples."""
+
+  def __init__(self, ids, num_samples, callback=None):
+    self.ids = ids
+    self.outputs = [[] for _ in range(num_samples)]
+    self.log_probs = [0.] * num_samples
+    self.num_unfinished = num_samples
+    self.error = None
+    self.callback = callback
+    self.done = threading.Event()
+
+  def finish(self, error=None):
+    self.error = error
+    self.done.set()
+    if self.callback is not None:
+      self.callback(self)
+
+
+class DecodingEngine(object):
+  """Generates responses in a fixed pool of slots, refilled between steps.
+
+  Requests from several threads are queued, and a worker thread decodes them.
+  Each request takes a slot for each latent sample, and its responses are
+  returned once all of them are finished.
+  """
+
+  # The engine batches the requests itself, so they should be submitted as soon
+  # as they are received.
+  continuous_batching = True
+
+  def __init__(self, model_class, params, model_dir, subtokenizer,
+               num_slots=_NUM_SLOTS, max_input_length=None, seed=None,
+               encoder_cache_size=encoder_cache.MAX_ENTRIES):
+    """Build the decoding graph and restore the latest checkpoint.
+
+    Args:
+      model_class: Transformer class of the checkpoint, e.g.
+        transformer3.Transformer for the models of transformer_main.
+      params: hyperparameter object of the model. params["decoding_method"] must
+        be one of greedy, top_k and nucleus.
+      model_dir: directory containing the model checkpoints.
+      subtokenizer: Subtokenizer object for encoding and decoding source and
+        translated strings.
+      num_slots: number of sequences decoded together.
+      max_input_length: maximum length of the encoded inputs. Longer inputs are
+        truncated, and shorter ones are padded to it, so it sets the cost of
+        every step. Defaults to params["max_length"].
+      seed: (optional) random seed of the graph and of the sampling methods.
+      encoder_cache_size: number of encoder states cached. 0 disables the
+        cache.
+
+    Raises:
+      ValueError: if there is no checkpoint in model_dir, if the decoding method
+        is not supported, or if there are fewer slots than latent samples.
+    """
+    self.subtokenizer = subtokenizer
+    self.num_slots = num_slots
+    self.max_input_length = max_input_length or params["max_length"]
+    self.num_latent_samples = params["num_latent_samples"] or 1
+    self.encoder_cache = encoder_cache.EncoderCache(encoder_cache_size)
+    if num_slots < self.num_latent_samples:
+      raise ValueError("A request takes %d slots, but there are only %d." %
+                       (self.num_latent_samples, num_slots))
+
+    checkpoint_path = tf.train.latest_checkpoint(model_dir)
+    if checkpoint_path is None:
+      raise ValueError("No checkpoint found in %s." % model_dir)
+
+    self._graph = tf.Graph()
+    with self._graph.as_default():
+      tf.set_random_seed(seed)
+      # Use the variable scope of transformer_main.model_fn, so that the
+      # checkpoint variables are restored.
+      with tf.variable_scope("model"):
+        self._decoder = slot_decoder.SlotDecoder(
+            model_class(params, False), num_slots, self.max_input_length,
+            seed=seed)
+      self._session = tf.Session()
+      inference_checkpoint.Saver().restore(self._session, checkpoint_path)
+      self._session.run(tf.local_variables_initializer())
+    self._graph.finalize()
+    tf.logging.info("Restored model from %s." % checkpoint_path)
+
+    # Request and latent sample index decoded in each slot, or None.
+    self._slots = [None] * num_slots
+    self.num_steps = 0
+    self._num_busy_slot_steps = 0
+
+    self._queue = queue.Queue()
+    self._worker = threading.Thread(target=self._run_worker)
+    self._worker.daemon = True
+    self._worker.start()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.shutdown()
+
+  @property
+  def slot_utilization(self):
+    """Fraction of the slots that were decoding a response, over all steps."""
+    if not self.num_steps:
+      return 0.
+    return self._num_busy_slot_steps / (self.num_steps * self.num_slots)
+
+  def warm_up(self):
+    """Translate a dummy request, so that the first requests are not slowed."""
+    self.translate("hello")
+
+  def translate(self, txt):
+    """Translate a single string, waiting for the translation.
+
+    May be called from several threads at the same time.
+    """
+    return "\t".join(self.translate_batch([txt], all_responses=True)[0])
+
+  def translate_batch(self, txts, all_responses=False):
+    """Translate a list of strings, returning the translations in order.
+
+    Args:
+      txts: list of strings to translate.
+      all_responses: If true, the translation of each string is the list of the
+        responses generated for each latent sample. Otherwise, the responses
+        are separated by tabs, as in translate.py.
+
+    Returns:
+      List of translations.
+    """
+    requests = self._submit([self._encode(txt) for txt in txts])
+    translations = []
+    for request in requests:
+      request.done.wait()
+      if request.error is not None:
+        raise request.error
+      translations.append(self._decode(request))
+    if all_responses:
+      return translations
+    return ["\t".join(responses) for responses in translations]
+
+  def submit(self, txt, callback):
+    """Queue a string to translate, without waiting for the translation.
+
+    Args:
+      txt: string to translate.
+      callback: function called by the worker thread with the list of responses
+        to txt and None once they are generated, or with None and the exception
+        if the translation failed.
+    """
+    def request_callback(request):
+      if request.error is not None:
+        callback(None, request.error)
+      else:
+        callback(self._decode(request), None)
+    self._submit([self._encode(txt)], request_callback)
+
+  def decode_ids(self, inputs):
+    """Decode encoded inputs, waiting for the outputs.
+
+    Args:
+      inputs: list of encoded inputs, as lists of ids ending with EOS.
+
+    Returns:
+      List of the outputs of each input, with an output for each latent sample.
+      The outputs are tuples of the decoded ids, ending with EOS unless the
+      maximum length was reached, and their log probability.
+    """
+    requests = self._submit(inputs)
+    outputs = []
+    for request in requests:
+      request.done.wait()
+      if request.error is not None:
+        raise request.error
+      outputs.append(list(zip(request.outputs, request.log_probs)))
+    return outputs
+
+  def shutdown(self):
+    """Decode the queued requests, then stop the worker and the session."""
+    if self._worker is None:
+      return
+    self._queue.put(None)
+    self._worker.join()
+    self._worker = None
+    self._session.close()
+
+  def _encode(self, txt):
+    ids = translate._encode_and_add_eos(txt, self.subtokenizer)  # pylint: disable=protected-access
+    if len(ids) > self.max_input_length:
+      ids = ids[:self.max_input_length - 1] + [tokenizer.EOS_ID]
+    return ids
+
+  def _decode(self, request):
+    return [translate._trim_and_decode(ids, self.subtokenizer)  # pylint: disable=protected-access
+            for ids in request.outputs]
+
+  def _submit(self, inputs, callback=None):
+    if self._worker is None:
+      raise RuntimeError("DecodingEngine has been shut down.")
+    requests = [_Request(ids, self.num_latent_samples, callback)
+                for ids in inputs]
+    self._queue.put(requests)
+    return requests
+
+  def _run_worker(self):
+    """Decode the queued requests until shutdown is called."""
+    pending = collections.deque()
+    stopped = False
+    while True:
+      busy = any(slot is not None for slot in self._slots)
+      if stopped and not busy and not pending:
+        break
+      # Only wait for requests if there is nothing to decode.
+      try:
+        requests = self._queue.get(block=not (stopped or busy or pending))
+        while True:
+          if requests is None:
+            stopped = True
+          else:
+            pending.extend(requests)
+          requests = self._queue.get_nowait()
+      except queue.Empty:
+        pass
+
+      self._fill_slots(pending)
+      if any(slot is not None for slot in self._slots):
+        self._step()
+
+  def _fill_slots(self, pending):
+    """Start decoding pending requests in the free slots."""
+    free_slots = [i for i, slot in enumerate(self._slots) if slot is None]
+    num_requests = min(len(pending),
+                       len(free_slots) // self.num_latent_samples)
+    if not num_requests:
+      return
+    requests = [pending.popleft() for _ in range(num_requests)]
+    slots = free_slots[:num_requests * self.num_latent_samples]
+
+    try:
+      states = self._get_encoder_states(requests)
+      feed_dict = {self._decoder.slots: slots}
+      for name, placeholder in self._decoder.encoder_state_inputs.items():
+        feed_dict[placeholder] = np.stack([state[name] for state in states])
+      self._session.run(self._decoder.insert_op, feed_dict=feed_dict)
+    except Exception as e:  # pylint: disable=broad-except
+      for request in requests:
+        request.finish(e)
+      return
+
+    # The latent samples of each input are decoded in consecutive slots.
+    for i, slot in enumerate(slots):
+      self._slots[slot] = (requests[i // self.num_latent_samples],
+                           i % self.num_latent_samples)
+
+  def _get_encoder_states(self, requests):
+    """Return the encoder state of each request, encoding the uncached inputs.
+
+    The states are dictionaries of numpy arrays, padded to max_input_length.
+    """
+    states = [self.encoder_cache.get(request.ids) for request in requests]
+    misses = [i for i, state in enumerate(states) if state is None]
+    if misses:
+      inputs = np.full([len(misses), max(len(requests[i].ids) for i in misses)],
+                       tokenizer.PAD_ID, dtype=np.int64)
+      for row, i in enumerate(misses):
+        inputs[row, :len(requests[i].ids)] = requests[i].ids
+      outputs = self._session.run(
+          self._decoder.encoder_state,
+          feed_dict={self._decoder.inputs: inputs})
+      for row, i in enumerate(misses):
+        states[i] = {name: value[row] for name, value in outputs.items()}
+        self.encoder_cache.put(requests[i].ids, states[i])
+    return states
+
+  def _step(self):
+    """Decode the next ID of every slot, and finish the done requests."""
+    try:
+      outputs = self._session.run(self._decoder.step_outputs)
+    except Exception as e:  # pylint: disable=broad-except
+      requests = set(slot[0] for slot in self._slots if slot is not None)
+      self._slots = [None] * self.num_slots
+      for request in requests:
+        request.finish(e)
+      return
+
+    self.num_steps += 1
+    for i, slot in enumerate(self._slots):
+      if slot is None:
+        continue
+      self._num_busy_slot_steps += 1
+      request, sample = slot
+      request.outputs[sample].append(int(outputs["ids"][i]))
+      if outputs["finished"][i]:
+        self._slots[i] = None
+        request.log_probs[sample] = float(outputs["log_probs"][i])
+        request.num_unfinished -= 1
+        if not request.num_unfinished:
+          request.finish()
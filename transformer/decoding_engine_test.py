@@ -0,0 +1,148 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Test the DecodingEngine against the greedy decoding of predict."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import copy
+import os
+
+import tensorflow as tf  # pylint: disable=g-bad-import-order
+
+from official.transformer import decoding_engine
+from official.transformer.model import model_params
+from official.transformer.model import transformer3
+from official.transformer.utils import tokenizer
+
+
+class _MeanLatentTransformer(transformer3.Transformer):
+  """Transformer whose latent samples are the mean of the prior.
+
+  The responses are deterministic, so that they can be compared between
+  graphs.
+  """
+
+  def encode(self, inputs, src_attention_bias, targets=None,
+             tgt_attention_bias=None):
+    outputs = super(_MeanLatentTransformer, self).encode(
+        inputs, src_attention_bias, targets, tgt_attention_bias)
+    encoder_outputs, _, prior_mu = outputs[:3]
+    num_latent_samples = self.params["num_latent_samples"] or 1
+    latent_sample = tf.reshape(
+        tf.tile(prior_mu, [1, num_latent_samples]),
+        [-1, self.params["latent_size"]])
+    return (encoder_outputs, latent_sample) + outputs[2:]
+
+  def encode_source(self, inputs):
+    # Set the standard deviation of the prior to 0, so that sample_latent
+    # returns the mean.
+    encoder_state = super(_MeanLatentTransformer, self).encode_source(inputs)
+    prior_logvar = encoder_state["prior_logvar"]
+    encoder_state["prior_logvar"] = (
+        tf.zeros_like(prior_logvar) if self.params["use_std"] else
+        tf.fill(tf.shape(prior_logvar), -1e9))
+    return encoder_state
+
+
+class DecodingEngineTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(DecodingEngineTest, self).setUp()
+    temp_dir = self.get_temp_dir()
+    vocab_file = os.path.join(temp_dir, "vocab")
+    with tf.gfile.Open(vocab_file, "w") as f:
+      for subtoken in ["hello_", "how_", "are_", "you_"]:
+        f.write("'%s'\n" % subtoken)
+    self.subtokenizer = tokenizer.Subtokenizer(vocab_file)
+
+    self.params = copy.deepcopy(model_params.BASE_PARAMS)
+    self.params.update(
+        vocab_size=self.subtokenizer.vocab_size, hidden_size=16,
+        num_hidden_layers=2, num_heads=2, filter_size=32, latent_size=8,
+        extra_decode_length=4, decoding_method="greedy", num_latent_samples=2)
+    self.inputs = [[2, 3, 1], [4, 1], [5, 4, 3, 2, 1], [3, 1], [2, 5, 1]]
+
+    self.model_dir = os.path.join(temp_dir, "model")
+    with tf.Graph().as_default():
+      inputs = tf.placeholder(tf.int64, [None, None])
+      with tf.variable_scope("model"):
+        predictions = _MeanLatentTransformer(self.params, False)(inputs)[0]
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        tf.train.Saver().save(sess, os.path.join(self.model_dir, "model.ckpt"))
+        # Decode each input alone, so that its maximum length does not depend
+        # on the other inputs.
+        self.expected = [
+            sess.run(predictions, feed_dict={inputs: [ids]})
+            for ids in self.inputs]
+
+  def _init_engine(self, **kwargs):
+    return decoding_engine.DecodingEngine(
+        _MeanLatentTransformer, self.params, self.model_dir, self.subtokenizer,
+        **kwargs)
+
+  def test_decode_ids(self):
+    # With 4 slots, at most 2 inputs are decoded at once, and the slots are
+    # refilled as the responses finish.
+    with self._init_engine(num_slots=4, max_input_length=6) as engine:
+      outputs = engine.decode_ids(self.inputs)
+      self.assertGreater(engine.slot_utilization, 0.)
+
+    for expected, input_outputs in zip(self.expected, outputs):
+      self.assertEqual(2, len(input_outputs))
+      for sample, (ids, log_prob) in enumerate(input_outputs):
+        expected_ids = expected["outputs"][0, sample]
+        self.assertAllEqual(expected_ids[:len(ids)], ids)
+        self.assertFalse(expected_ids[len(ids):].any())
+        self.assertAllClose(expected["scores"][0, sample], log_prob)
+
+  def test_encoder_cache(self):
+    with self._init_engine(num_slots=4, max_input_length=6) as engine:
+      outputs = engine.decode_ids(self.inputs[:2])
+      # The cached encoder states give the same outputs.
+      self.assertEqual(outputs, engine.decode_ids(self.inputs[:2]))
+      self.assertEqual(2, engine.encoder_cache.hits)
+      self.assertEqual(2, len(engine.encoder_cache))
+
+    with self._init_engine(encoder_cache_size=0) as engine:
+      engine.decode_ids(self.inputs[:2] * 2)
+      self.assertEqual(0, engine.encoder_cache.hits)
+
+  def test_translate(self):
+    with self._init_engine(num_slots=3) as engine:
+      engine.warm_up()
+      translations = engine.translate_batch(
+          ["hello", "how are you"], all_responses=True)
+      self.assertEqual([2, 2], [len(responses) for responses in translations])
+      self.assertEqual("\t".join(translations[0]), engine.translate("hello"))
+
+  def test_invalid_params(self):
+    with self.assertRaises(ValueError):
+      self._init_engine(num_slots=1)
+    self.params["decoding_method"] = "beam_search"
+    with self.assertRaises(ValueError):
+      self._init_engine()
+
+  def test_shutdown(self):
+    engine = self._init_engine()
+    engine.shutdown()
+    with self.assertRaises(RuntimeError):
+      engine.translate("hello")
+
+
+if __name__ == "__main__":
+  tf.test.main()
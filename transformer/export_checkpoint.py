@@ -0,0 +1,140 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Export the latest checkpoint of a model as a slim inference checkpoint.
+
+The training checkpoints of --model_dir hold the LazyAdamOptimizer slots of
+every variable, and the variables that prediction never reads: the target
+encoder, the recognition network and, unless the vocabulary shortlist is used,
+the bag-of-words decoder. This tool builds the prediction graph of
+transformer_main.model_fn, and writes the variables of the graph to a
+checkpoint in --export_dir (see utils/inference_checkpoint.py). With
+--checkpoint_dtype=float16, the floating-point variables are stored in half
+precision, and cast back to float32 when the checkpoint is restored.
+
+--export_dir is then used as the --model_dir of translate.py, server.py or
+retrieval_index.py, which load it faster and with less memory.
+
+Example:
+  python export_checkpoint.py --model_dir=/tmp/transformer_model \
+      --vocab_file=/tmp/data/vocab.txt --param_set=big \
+      --export_dir=/tmp/transformer_inference --checkpoint_dtype=float16
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+# pylint: disable=g-bad-import-order
+from absl import app as absl_app
+from absl import flags
+import tensorflow as tf
+# pylint: enable=g-bad-import-order
+
+from official.transformer.utils import inference_checkpoint
+from official.utils.flags import core as flags_core
+
+
+def get_prediction_variable_names(model_fn, params):
+  """Return the names of the variables of the prediction graph of model_fn."""
+  with tf.Graph().as_default():
+    # The global step is restored by the estimator.
+    tf.train.get_or_create_global_step()
+    inputs = tf.placeholder(tf.int64, [None, None], name="inputs")
+    model_fn(inputs, None, tf.estimator.ModeKeys.PREDICT, params)
+    return [variable.op.name for variable in tf.global_variables()]
+
+
+def export_checkpoint(model_fn, params, model_dir, export_dir, dtype=None):
+  """Export the latest checkpoint of model_dir as an inference checkpoint.
+
+  Args:
+    model_fn: Model function of the estimator, e.g. transformer_main.model_fn.
+    params: hyperparameter object passed to model_fn. The variables that are
+      only used with some parameters, e.g. the bag-of-words decoder of the
+      vocabulary shortlist, are exported if the parameters use them.
+    model_dir: directory containing the model checkpoints.
+    export_dir: directory in which the inference checkpoint is written.
+    dtype: (optional) type in which the floating-point variables are stored,
+      one of inference_checkpoint.DTYPES.
+
+  Returns:
+    The path of the inference checkpoint.
+
+  Raises:
+    ValueError: if there is no checkpoint in model_dir.
+  """
+  checkpoint_path = tf.train.latest_checkpoint(model_dir)
+  if checkpoint_path is None:
+    raise ValueError("No checkpoint found in %s." % model_dir)
+  var_names = get_prediction_variable_names(model_fn, params)
+  return inference_checkpoint.write_checkpoint(
+      checkpoint_path, export_dir, var_names, dtype=dtype)
+
+
+def main(unused_argv):
+  from official.transformer import transformer_main
+
+  tf.logging.set_verbosity(tf.logging.INFO)
+
+  params = transformer_main.PARAMS_MAP[FLAGS.param_set]
+  with tf.gfile.Open(FLAGS.vocab_file) as f:
+    params["vocab_size"] = len(f.readlines())
+  params["vocab_shortlist_size"] = FLAGS.vocab_shortlist_size
+
+  output_path = export_checkpoint(
+      transformer_main.model_fn, params, FLAGS.model_dir, FLAGS.export_dir,
+      dtype=FLAGS.checkpoint_dtype)
+  tf.logging.info("Exported the inference checkpoint %s." % output_path)
+
+
+def define_export_checkpoint_flags():
+  """Define flags used for the checkpoint export script."""
+  flags.DEFINE_string(
+      name="model_dir", short_name="md", default="/tmp/transformer_model",
+      help=flags_core.help_wrap(
+          "Directory containing Transformer model checkpoints."))
+  flags.DEFINE_enum(
+      name="param_set", short_name="mp", default="big",
+      enum_values=["base", "big"],
+      help=flags_core.help_wrap(
+          "Parameter set of the model in --model_dir."))
+  flags.DEFINE_string(
+      name="vocab_file", short_name="vf", default=None,
+      help=flags_core.help_wrap("Path to subtoken vocabulary file."))
+  flags.mark_flag_as_required("vocab_file")
+  flags.DEFINE_string(
+      name="export_dir", default=None,
+      help=flags_core.help_wrap(
+          "Directory in which the inference checkpoint is written."))
+  flags.mark_flag_as_required("export_dir")
+  flags.DEFINE_enum(
+      name="checkpoint_dtype", default="float32",
+      enum_values=inference_checkpoint.DTYPES,
+      help=flags_core.help_wrap(
+          "Type in which the floating-point variables are stored. float16 "
+          "halves the size of the checkpoint, and the variables are cast back "
+          "to float32 when they are restored."))
+  flags.DEFINE_integer(
+      name="vocab_shortlist_size", short_name="vss", default=0,
+      help=flags_core.help_wrap(
+          "Set to the --vocab_shortlist_size the checkpoint will be used "
+          "with. If positive, the bag-of-words decoder selecting the "
+          "shortlist is exported."))
+
+
+if __name__ == "__main__":
+  define_export_checkpoint_flags()
+  FLAGS = flags.FLAGS
+  absl_app.run(main)
@@ -19,6 +19,7 @@ from __future__ import division
 from __future__ import print_function
 
 import tensorflow as tf
+from tensorflow.python.ops import inplace_ops
 
 
 class Attention(tf.layers.Layer):
@@ -90,37 +91,44 @@ class Attention(tf.layers.Layer):
       x: a tensor with shape [batch_size, length_x, hidden_size]
       y: a tensor with shape [batch_size, length_y, hidden_size]
       bias: attention bias that will be added to the result of the dot product.
-      cache: (Used during prediction) dictionary with tensors containing results
-        of previous attentions. The dictionary must have the items:
-            {"k": tensor with shape [batch_size, i, key_channels],
-             "v": tensor with shape [batch_size, i, value_channels]}
-        where i is the current decoded length.
+      cache: (Used during prediction) dictionary storing the keys and values of
+        y, already projected and split into heads:
+            {"k": tensor with shape [batch_size, num_heads, length_y, depth],
+             "v": tensor with shape [batch_size, num_heads, length_y, depth]}
+        where depth is hidden_size/num_heads. If the dictionary is empty, the
+        keys and values are computed from y and stored in it. Otherwise y is
+        not used, and only x is projected.
 
     Returns:
       Attention layer output with shape [batch_size, length_x, hidden_size]
     """
-    # Linearly project the query (q), key (k) and value (v) using different
-    # learned projections. This is in preparation of splitting them into
-    # multiple heads. Multi-head attention uses multiple queries, keys, and
-    # values rather than regular attention (which uses a single q, k, v).
-    q = self.q_dense_layer(x)
-    k = self.k_dense_layer(y)
-    v = self.v_dense_layer(y)
+    if cache:
+      k = cache["k"]
+      v = cache["v"]
+    else:
+      # Linearly project the keys (k) and values (v), and split them into heads.
+      k = self.split_heads(self.k_dense_layer(y))
+      v = self.split_heads(self.v_dense_layer(y))
 
-    if cache is not None:
-      # Combine cached keys and values with new keys and values.
-      k = tf.concat([cache["k"], k], axis=1)
-      v = tf.concat([cache["v"], v], axis=1)
+      if cache is not None:
+        cache["k"] = k
+        cache["v"] = v
 
-      # Update cache
-      cache["k"] = k
-      cache["v"] = v
+    q = self.split_heads(self.q_dense_layer(x))
+    return self.dot_product_attention(q, k, v, bias)
 
-    # Split q, k, v into heads.
-    q = self.split_heads(q)
-    k = self.split_heads(k)
-    v = self.split_heads(v)
+  def dot_product_attention(self, q, k, v, bias):
+    """Calculate dot product attention over q, k and v split into heads.
 
+    Args:
+      q: a tensor with shape [batch_size, num_heads, length_q, depth]
+      k: a tensor with shape [batch_size, num_heads, length_kv, depth]
+      v: a tensor with shape [batch_size, num_heads, length_kv, depth]
+      bias: attention bias that will be added to the result of the dot product.
+
+    Returns:
+      Attention layer output with shape [batch_size, length_q, hidden_size]
+    """
     # Scale q to prevent the dot product between q and k from growing too large.
     depth = (self.hidden_size // self.num_heads)
     q *= depth ** -0.5
@@ -144,5 +152,102 @@ class Attention(tf.layers.Layer):
 class SelfAttention(Attention):
   """Multiheaded self-attention layer."""
 
-  def call(self, x, bias, cache=None):
-    return super(SelfAttention, self).call(x, x, bias, cache)
+  def call(self, x, bias, cache=None, decode_step=None):
+    """Apply self-attention mechanism to x.
+
+    The cache tensors are updated in place, so they must not be constants (see
+    zeros_cache), and the tensors passed in must not be used after this call.
+
+    Args:
+      x: a tensor with shape [batch_size, length_x, hidden_size]
+      bias: attention bias that will be added to the result of the dot product.
+      cache: (Used during prediction) dictionary with tensors containing the
+        keys and values of the decoded positions, split into heads. The
+        dictionary must have the items:
+            {"k": tensor with shape [batch_size, num_heads, max_length, depth],
+             "v": tensor with shape [batch_size, num_heads, max_length, depth]}
+        where max_length is the maximum decoded length, and depth is
+        hidden_size/num_heads.
+      decode_step: (Used with cache) integer index of x in the decoded sequence,
+        or int tensor with shape [batch_size] holding the index of each batch
+        item. x must have length 1. Its keys and values are written to the
+        cache at this index, and bias must mask all positions after it. With a
+        single index, only the positions up to it are attended to.
+
+    Returns:
+      Attention layer output with shape [batch_size, length_x, hidden_size]
+    """
+    # Linearly project the query (q), key (k) and value (v) using different
+    # learned projections, and split them into multiple heads. Multi-head
+    # attention uses multiple queries, keys, and values rather than regular
+    # attention (which uses a single q, k, v).
+    q = self.split_heads(self.q_dense_layer(x))
+    k = self.split_heads(self.k_dense_layer(x))
+    v = self.split_heads(self.v_dense_layer(x))
+
+    if cache is not None:
+      # Write the new keys and values to the cache at decode_step, in place.
+      k = _update_cache(cache["k"], k, decode_step)
+      v = _update_cache(cache["v"], v, decode_step)
+
+      # Update cache
+      cache["k"] = k
+      cache["v"] = v
+
+      if tf.convert_to_tensor(decode_step).shape.ndims == 0:
+        # All the batch items are at the same step, so only attend to the
+        # decoded positions instead of the whole cache.
+        k = k[:, :, :decode_step + 1]
+        v = v[:, :, :decode_step + 1]
+        bias = bias[..., :decode_step + 1]
+
+    return self.dot_product_attention(q, k, v, bias)
+
+
+def zeros_cache(shape):
+  """Return a zero tensor to cache the keys or values of SelfAttention.
+
+  Unlike tf.zeros, the tensor is never a constant shared between runs, so
+  SelfAttention can update it in place.
+
+  Args:
+    shape: [batch_size, num_heads, max_length, depth]
+
+  Returns:
+    float32 tensor with the given shape, filled with 0s.
+  """
+  return inplace_ops.empty(shape, tf.float32, init=True)
+
+
+def _update_cache(cache_values, new_values, decode_step):
+  """Write the keys or values of a decoding step to the cache, in place.
+
+  The cache is viewed as rows of depth values, and only the rows of the new
+  values are written, instead of copying the whole cache. Each position of the
+  cache is written once, and a step only reads the positions up to its own, so
+  the positions read by a step are never written by a later one.
+
+  Args:
+    cache_values: tensor with shape [batch_size, num_heads, max_length, depth]
+    new_values: tensor with shape [batch_size, num_heads, 1, depth]
+    decode_step: integer index of the new values in the decoded sequence, or
+      int tensor with shape [batch_size] holding the index of each batch item.
+
+  Returns:
+    cache_values, updated with new_values at decode_step. It shares its buffer
+    with cache_values.
+  """
+  shape = tf.shape(cache_values)
+  batch_size, num_heads, max_length, depth = tf.unstack(shape)
+
+  # Index of the row of each batch item and head at its decode step.
+  steps = tf.to_int32(decode_step) + tf.zeros([batch_size], tf.int32)
+  steps = tf.reshape(tf.tile(tf.expand_dims(steps, 1), [1, num_heads]), [-1])
+  rows = tf.range(batch_size * num_heads) * max_length + steps
+
+  updated = inplace_ops.alias_inplace_update(
+      tf.reshape(cache_values, [-1, depth]), rows,
+      tf.reshape(new_values, [-1, depth]))
+  updated = tf.reshape(updated, shape)
+  updated.set_shape(cache_values.shape)
+  return updated
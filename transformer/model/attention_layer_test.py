@@ -0,0 +1,151 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Test attention layers."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+import tensorflow as tf  # pylint: disable=g-bad-import-order
+
+from official.transformer.model import attention_layer
+from official.transformer.model import model_utils
+
+
+class SelfAttentionTest(tf.test.TestCase):
+
+  def _test_cache_matches_full_sequence(self, get_decode_step):
+    batch_size, length, hidden_size, num_heads = 2, 4, 8, 2
+    x = tf.random_normal([batch_size, length, hidden_size], seed=1)
+    bias = model_utils.get_decoder_self_attention_bias(length)
+    layer = attention_layer.SelfAttention(hidden_size, num_heads, 0., False)
+    outputs = layer(x, bias)
+
+    depth = hidden_size // num_heads
+    cache = {
+        "k": attention_layer.zeros_cache(
+            [batch_size, num_heads, length, depth]),
+        "v": attention_layer.zeros_cache(
+            [batch_size, num_heads, length, depth])}
+    step_outputs = []
+    for i in range(length):
+      step_outputs.append(layer(
+          x[:, i:i + 1], bias[:, :, i:i + 1, :], cache=cache,
+          decode_step=get_decode_step(i)))
+    step_outputs = tf.concat(step_outputs, axis=1)
+
+    with self.test_session() as sess:
+      sess.run(tf.global_variables_initializer())
+      outputs, step_outputs = sess.run((outputs, step_outputs))
+
+    self.assertAllClose(outputs, step_outputs)
+
+  def test_cache_matches_full_sequence(self):
+    self._test_cache_matches_full_sequence(lambda i: i)
+
+  def test_cache_matches_full_sequence_tensor_step(self):
+    self._test_cache_matches_full_sequence(tf.constant)
+
+  def test_cache_matches_full_sequence_batch_steps(self):
+    self._test_cache_matches_full_sequence(lambda i: tf.fill([2], i))
+
+
+def _concat_self_attention(layer, x, bias, cache):
+  """Self-attention step growing the cache by one position with tf.concat.
+
+  This is how SelfAttention cached the keys and values before the cache was
+  preallocated, kept as the baseline of SelfAttentionCacheBenchmark.
+  """
+  k = tf.concat([cache["k"], layer.k_dense_layer(x)], axis=1)
+  v = tf.concat([cache["v"], layer.v_dense_layer(x)], axis=1)
+  cache["k"] = k
+  cache["v"] = v
+  q = layer.split_heads(layer.q_dense_layer(x))
+  return layer.dot_product_attention(
+      q, layer.split_heads(k), layer.split_heads(v), bias)
+
+
+class SelfAttentionCacheBenchmark(tf.test.Benchmark):
+  """Compare the preallocated cache to one grown with tf.concat.
+
+  The preallocated cache holds max_length positions whatever the number of
+  decoded steps, as when short responses are decoded with a maximum length set
+  by the input length.
+
+  Run with:
+    python attention_layer_test.py --benchmarks=.
+  """
+
+  def _benchmark_decoding(self, name, num_steps, preallocated, batch_size=32,
+                          hidden_size=512, num_heads=8, max_length=256,
+                          num_iters=10):
+    with tf.Graph().as_default(), tf.Session() as sess:
+      layer = attention_layer.SelfAttention(hidden_size, num_heads, 0., False)
+      x = tf.random_normal([batch_size, 1, hidden_size], seed=1)
+      bias = model_utils.get_decoder_self_attention_bias(max_length)
+      layer(x, bias[:, :, :1, :1])  # Create the variables outside the loop.
+
+      if preallocated:
+        shape = [batch_size, num_heads, max_length, hidden_size // num_heads]
+        cache = {"k": attention_layer.zeros_cache(shape),
+                 "v": attention_layer.zeros_cache(shape)}
+        cache_shape = tf.TensorShape(shape)
+      else:
+        cache = {"k": tf.zeros([batch_size, 0, hidden_size]),
+                 "v": tf.zeros([batch_size, 0, hidden_size])}
+        cache_shape = tf.TensorShape([batch_size, None, hidden_size])
+
+      def step(i, outputs, cache):
+        if preallocated:
+          outputs += layer(x, bias[:, :, i:i + 1, :], cache=cache,
+                           decode_step=i)
+        else:
+          outputs += _concat_self_attention(
+              layer, x, bias[:, :, i:i + 1, :i + 1], cache)
+        return i + 1, outputs, cache
+
+      _, outputs, _ = tf.while_loop(
+          lambda i, *_: i < num_steps, step,
+          [tf.constant(0), tf.zeros_like(x), cache],
+          shape_invariants=[tf.TensorShape([]), x.shape,
+                            {"k": cache_shape, "v": cache_shape}],
+          back_prop=False)
+      sess.run(tf.global_variables_initializer())
+
+      sess.run(outputs)  # Warm up
+      start = time.time()
+      for _ in range(num_iters):
+        sess.run(outputs)
+      wall_time = (time.time() - start) / num_iters
+
+    self.report_benchmark(name=name, iters=num_iters, wall_time=wall_time)
+
+  def benchmark_preallocated_short(self):
+    self._benchmark_decoding("preallocated_16_steps", 16, True)
+
+  def benchmark_concat_short(self):
+    self._benchmark_decoding("concat_16_steps", 16, False)
+
+  def benchmark_preallocated_long(self):
+    self._benchmark_decoding("preallocated_256_steps", 256, True)
+
+  def benchmark_concat_long(self):
+    self._benchmark_decoding("concat_256_steps", 256, False)
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -55,12 +55,29 @@ class _StateKeys(object):
   # True -> finished sequence, False -> filler. Shape [batch_size, beam_size]
   FINISHED_FLAGS = "FINISHED_FLAGS"
 
+  # The batch items whose top finished sequences can no longer change are
+  # removed from the alive and finished values above, so the search only runs
+  # over the remaining items. The batch_size of those values is the number of
+  # remaining items.
+
+  # Indices of the remaining batch items in the original batch.
+  # Shape [batch_size]
+  BATCH_IDS = "BATCH_IDS"
+  # Top finished sequences of the removed batch items, in the original batch
+  # order. Shape [original batch_size, beam_size, max_decode_length + 1].
+  # Sequences of the remaining batch items are filled with 0s.
+  DONE_SEQ = "DONE_SEQ"
+  # Scores of the sequences in DONE_SEQ.
+  # Shape [original batch_size, beam_size]
+  DONE_SCORES = "DONE_SCORES"
+
 
 class SequenceBeamSearch(object):
   """Implementation of beam search loop."""
 
   def __init__(self, symbols_to_logits_fn, vocab_size, batch_size,
-               beam_size, alpha, max_decode_length, eos_id):
+               beam_size, alpha, max_decode_length, eos_id,
+               shortlist_key=None):
     self.symbols_to_logits_fn = symbols_to_logits_fn
     self.vocab_size = vocab_size
     self.batch_size = batch_size
@@ -68,6 +85,7 @@ class SequenceBeamSearch(object):
     self.alpha = alpha
     self.max_decode_length = max_decode_length
     self.eos_id = eos_id
+    self.shortlist_key = shortlist_key
 
   def search(self, initial_ids, initial_cache):
     """Beam search for sequences with highest scores."""
@@ -78,6 +96,7 @@ class SequenceBeamSearch(object):
         shape_invariants=[state_shapes], parallel_iterations=1, back_prop=False)
     finished_state = finished_state[0]
 
+    i = finished_state[_StateKeys.CUR_INDEX]
     alive_seq = finished_state[_StateKeys.ALIVE_SEQ]
     alive_log_probs = finished_state[_StateKeys.ALIVE_LOG_PROBS]
     finished_seq = finished_state[_StateKeys.FINISHED_SEQ]
@@ -91,7 +110,13 @@ class SequenceBeamSearch(object):
         tf.reduce_any(finished_flags, 1), finished_seq, alive_seq)
     finished_scores = tf.where(
         tf.reduce_any(finished_flags, 1), finished_scores, alive_log_probs)
-    return finished_seq, finished_scores
+
+    # Put the sequences of the remaining batch items with those of the items
+    # removed during the search, and remove the padding after the last index.
+    done_seq, done_scores = self._add_done_batch_items(
+        finished_state, finished_state[_StateKeys.BATCH_IDS], finished_seq,
+        finished_scores)
+    return done_seq[:, :, :i + 1], done_scores
 
   def _create_initial_state(self, initial_ids, initial_cache):
     """Return initial state dictionary and its shape invariants.
@@ -140,7 +165,12 @@ class SequenceBeamSearch(object):
         _StateKeys.ALIVE_CACHE: alive_cache,
         _StateKeys.FINISHED_SEQ: finished_seq,
         _StateKeys.FINISHED_SCORES: finished_scores,
-        _StateKeys.FINISHED_FLAGS: finished_flags
+        _StateKeys.FINISHED_FLAGS: finished_flags,
+        _StateKeys.BATCH_IDS: tf.range(self.batch_size),
+        _StateKeys.DONE_SEQ: tf.zeros(
+            [self.batch_size, self.beam_size, self.max_decode_length + 1],
+            tf.int32),
+        _StateKeys.DONE_SCORES: tf.zeros([self.batch_size, self.beam_size])
     }
 
     # Create state invariants for each value in the state dictionary. Each
@@ -153,10 +183,13 @@ class SequenceBeamSearch(object):
         _StateKeys.ALIVE_SEQ: tf.TensorShape([None, self.beam_size, None]),
         _StateKeys.ALIVE_LOG_PROBS: tf.TensorShape([None, self.beam_size]),
         _StateKeys.ALIVE_CACHE: nest.map_structure(
-            _get_shape_keep_last_dim, alive_cache),
+            _get_shape_keep_inner_dims, alive_cache),
         _StateKeys.FINISHED_SEQ: tf.TensorShape([None, self.beam_size, None]),
         _StateKeys.FINISHED_SCORES: tf.TensorShape([None, self.beam_size]),
-        _StateKeys.FINISHED_FLAGS: tf.TensorShape([None, self.beam_size])
+        _StateKeys.FINISHED_FLAGS: tf.TensorShape([None, self.beam_size]),
+        _StateKeys.BATCH_IDS: tf.TensorShape([None]),
+        _StateKeys.DONE_SEQ: tf.TensorShape([None, self.beam_size, None]),
+        _StateKeys.DONE_SCORES: tf.TensorShape([None, self.beam_size])
     }
 
     return state, state_shape_invariants
@@ -166,9 +199,9 @@ class SequenceBeamSearch(object):
 
     The loops should terminate when
       1) when decode length has been reached, or
-      2) when the worst score in the finished sequences is better than the best
-         score in the alive sequences (i.e. the finished sequences are provably
-         unchanging)
+      2) when the search has finished for all batch items. A batch item is
+         removed from the state when its top finished sequences are provably
+         unchanging (see _finished_batch_items).
 
     Args:
       state: A dictionary with the current loop state.
@@ -178,12 +211,33 @@ class SequenceBeamSearch(object):
       terminate.
     """
     i = state[_StateKeys.CUR_INDEX]
-    alive_log_probs = state[_StateKeys.ALIVE_LOG_PROBS]
-    finished_scores = state[_StateKeys.FINISHED_SCORES]
-    finished_flags = state[_StateKeys.FINISHED_FLAGS]
+    batch_ids = state[_StateKeys.BATCH_IDS]
 
     not_at_max_decode_length = tf.less(i, self.max_decode_length)
+    return tf.logical_and(
+        not_at_max_decode_length,
+        tf.greater(tf.size(batch_ids), 0)
+    )
+
+  def _finished_batch_items(self, alive_log_probs, finished_scores,
+                            finished_flags):
+    """Return whether the search has finished for each batch item.
 
+    The search for a batch item has finished when the worst score in its
+    finished sequences is better than the best score in its alive sequences
+    (i.e. the finished sequences are provably unchanging).
+
+    Args:
+      alive_log_probs: Log probabilities of the alive sequences, sorted in
+        decreasing order. float32 tensor with shape [batch_size, beam_size]
+      finished_scores: Scores of the finished sequences.
+        float32 tensor with shape [batch_size, beam_size]
+      finished_flags: Finished flags of the finished sequences.
+        bool tensor with shape [batch_size, beam_size]
+
+    Returns:
+      Bool tensor with shape [batch_size].
+    """
     # Calculate largest length penalty (the larger penalty, the better score).
     max_length_norm = _length_normalization(self.alpha, self.max_decode_length)
     # Get the best possible scores from alive sequences.
@@ -198,14 +252,7 @@ class SequenceBeamSearch(object):
     finished_batches = tf.reduce_any(finished_flags, 1)
     lowest_finished_scores += (1. - tf.to_float(finished_batches)) * -INF
 
-    worst_finished_score_better_than_best_alive_score = tf.reduce_all(
-        tf.greater(lowest_finished_scores, best_alive_scores)
-    )
-
-    return tf.logical_and(
-        not_at_max_decode_length,
-        tf.logical_not(worst_finished_score_better_than_best_alive_score)
-    )
+    return tf.greater(lowest_finished_scores, best_alive_scores)
 
   def _search_step(self, state):
     """Beam search loop body.
@@ -226,8 +273,10 @@ class SequenceBeamSearch(object):
     """
     # Grow alive sequences by one token.
     new_seq, new_log_probs, new_cache = self._grow_alive_seq(state)
-    # Collect top beam_size alive sequences
-    alive_state = self._get_new_alive_state(new_seq, new_log_probs, new_cache)
+    # Collect top beam_size alive sequences. Their cache is gathered together
+    # with the removal of the finished batch items.
+    alive_state, alive_beam_indices = self._get_new_alive_state(
+        new_seq, new_log_probs)
 
     # Combine newly finished sequences with existing finished sequences, and
     # collect the top k scoring sequences.
@@ -237,6 +286,11 @@ class SequenceBeamSearch(object):
     new_state = {_StateKeys.CUR_INDEX: state[_StateKeys.CUR_INDEX] + 1}
     new_state.update(alive_state)
     new_state.update(finished_state)
+
+    # Remove the batch items whose search has finished, so the next steps only
+    # run over the remaining items.
+    new_state.update(self._remove_finished_batch_items(
+        state, new_state, new_cache, alive_beam_indices))
     return [new_state]
 
   def _grow_alive_seq(self, state):
@@ -258,6 +312,7 @@ class SequenceBeamSearch(object):
     alive_seq = state[_StateKeys.ALIVE_SEQ]
     alive_log_probs = state[_StateKeys.ALIVE_LOG_PROBS]
     alive_cache = state[_StateKeys.ALIVE_CACHE]
+    batch_size = tf.shape(alive_seq)[0]
 
     beams_to_keep = 2 * self.beam_size
 
@@ -269,39 +324,35 @@ class SequenceBeamSearch(object):
     flat_logits, flat_cache = self.symbols_to_logits_fn(flat_ids, i, flat_cache)
 
     # Unflatten logits to shape [batch_size, beam_size, vocab_size]
-    logits = _unflatten_beam_dim(flat_logits, self.batch_size, self.beam_size)
+    logits = _unflatten_beam_dim(flat_logits, batch_size, self.beam_size)
     new_cache = nest.map_structure(
-        lambda t: _unflatten_beam_dim(t, self.batch_size, self.beam_size),
+        lambda t: _unflatten_beam_dim(t, batch_size, self.beam_size),
         flat_cache)
 
-    # Convert logits to normalized log probs
-    candidate_log_probs = _log_prob_from_logits(logits)
-
-    # Calculate new log probabilities if each of the alive sequences were
-    # extended # by the the candidate IDs.
-    # Shape [batch_size, beam_size, vocab_size]
-    log_probs = candidate_log_probs + tf.expand_dims(alive_log_probs, axis=2)
-
     # Each batch item has beam_size * vocab_size candidate sequences. For each
     # batch item, get the k candidates with the highest log probabilities.
-    flat_log_probs = tf.reshape(log_probs,
-                                [-1, self.beam_size * self.vocab_size])
-    topk_log_probs, topk_indices = tf.nn.top_k(flat_log_probs, k=beams_to_keep)
+    topk_log_probs, topk_beam_indices, topk_ids = _get_topk_candidates(
+        logits, alive_log_probs, beams_to_keep)
+
+    if self.shortlist_key is not None:
+      # Map the indices into the shortlists of the beams to token IDs.
+      shortlist_ids = new_cache[self.shortlist_key]
+      topk_ids = tf.gather_nd(
+          shortlist_ids, tf.stack([_get_batch_pos(topk_ids), topk_beam_indices,
+                                   topk_ids], axis=2))
 
     # Extract the alive sequences that generate the highest log probabilities
     # after being extended.
-    topk_beam_indices = topk_indices // self.vocab_size
     topk_seq, new_cache = _gather_beams(
-        [alive_seq, new_cache], topk_beam_indices, self.batch_size,
+        [alive_seq, new_cache], topk_beam_indices, batch_size,
         beams_to_keep)
 
     # Append the most probable IDs to the topk sequences
-    topk_ids = topk_indices % self.vocab_size
     topk_ids = tf.expand_dims(topk_ids, axis=2)
     topk_seq = tf.concat([topk_seq, topk_ids], axis=2)
     return topk_seq, topk_log_probs, new_cache
 
-  def _get_new_alive_state(self, new_seq, new_log_probs, new_cache):
+  def _get_new_alive_state(self, new_seq, new_log_probs):
     """Gather the top k sequences that are still alive.
 
     Args:
@@ -309,27 +360,29 @@ class SequenceBeamSearch(object):
         int32 tensor with shape [batch_size, 2 * beam_size, cur_index + 1]
       new_log_probs: Log probabilities of new sequences
         float32 tensor with shape [batch_size, beam_size]
-      new_cache: Dict of cached values for each sequence.
 
     Returns:
-      Dictionary with alive keys from _StateKeys:
-        {Top beam_size sequences that are still alive (don't end with eos_id)
-         Log probabilities of top alive sequences
-         Dict cache storing decoder states for top alive sequences}
+      Tuple of
+      (Dictionary with alive keys from _StateKeys:
+         {Top beam_size sequences that are still alive (don't end with eos_id)
+          Log probabilities of top alive sequences},
+       Indices of the top alive sequences in new_seq, which are used to gather
+         their cache. int32 tensor with shape [batch_size, beam_size])
     """
+    batch_size = tf.shape(new_seq)[0]
+
     # To prevent finished sequences from being considered, set log probs to -INF
     new_finished_flags = tf.equal(new_seq[:, :, -1], self.eos_id)
     new_log_probs += tf.to_float(new_finished_flags) * -INF
 
-    top_alive_seq, top_alive_log_probs, top_alive_cache = _gather_topk_beams(
-        [new_seq, new_log_probs, new_cache], new_log_probs, self.batch_size,
-        self.beam_size)
+    _, topk_indexes = tf.nn.top_k(new_log_probs, k=self.beam_size)
+    top_alive_seq, top_alive_log_probs = _gather_beams(
+        [new_seq, new_log_probs], topk_indexes, batch_size, self.beam_size)
 
     return {
         _StateKeys.ALIVE_SEQ: top_alive_seq,
-        _StateKeys.ALIVE_LOG_PROBS: top_alive_log_probs,
-        _StateKeys.ALIVE_CACHE: top_alive_cache
-    }
+        _StateKeys.ALIVE_LOG_PROBS: top_alive_log_probs
+    }, topk_indexes
 
   def _get_new_finished_state(self, state, new_seq, new_log_probs):
     """Combine new and old finished sequences, and gather the top k sequences.
@@ -351,12 +404,13 @@ class SequenceBeamSearch(object):
     finished_seq = state[_StateKeys.FINISHED_SEQ]
     finished_scores = state[_StateKeys.FINISHED_SCORES]
     finished_flags = state[_StateKeys.FINISHED_FLAGS]
+    batch_size = tf.shape(finished_seq)[0]
 
     # First append a column of 0-ids to finished_seq to increment the length.
     # New shape of finished_seq: [batch_size, beam_size, i + 1]
     finished_seq = tf.concat(
         [finished_seq,
-         tf.zeros([self.batch_size, self.beam_size, 1], tf.int32)], axis=2)
+         tf.zeros([batch_size, self.beam_size, 1], tf.int32)], axis=2)
 
     # Calculate new seq scores from log probabilities.
     length_norm = _length_normalization(self.alpha, i + 1)
@@ -374,7 +428,7 @@ class SequenceBeamSearch(object):
     # Return the finished sequences with the best scores.
     top_finished_seq, top_finished_scores, top_finished_flags = (
         _gather_topk_beams([finished_seq, finished_scores, finished_flags],
-                           finished_scores, self.batch_size, self.beam_size))
+                           finished_scores, batch_size, self.beam_size))
 
     return {
         _StateKeys.FINISHED_SEQ: top_finished_seq,
@@ -382,10 +436,86 @@ class SequenceBeamSearch(object):
         _StateKeys.FINISHED_FLAGS: top_finished_flags
     }
 
+  def _remove_finished_batch_items(self, state, new_state, new_cache,
+                                   alive_beam_indices):
+    """Move the batch items whose search has finished out of the loop state.
+
+    The top finished sequences of those items are stored in the done sequences
+    in their original batch order, and the items are removed from the alive and
+    finished values. The cache of the top alive sequences is gathered for the
+    remaining items only.
+
+    Args:
+      state: A dictionary with the current loop state.
+      new_state: A dictionary with the new alive and finished values.
+      new_cache: Dict of cached values for each of the 2 * beam_size sequences
+        grown from the alive sequences.
+      alive_beam_indices: Indices of the top alive sequences in new_cache.
+        int32 tensor with shape [batch_size, beam_size]
+
+    Returns:
+      Dictionary with the alive, finished and done keys from _StateKeys.
+    """
+    batch_ids = state[_StateKeys.BATCH_IDS]
+    finished = self._finished_batch_items(
+        new_state[_StateKeys.ALIVE_LOG_PROBS],
+        new_state[_StateKeys.FINISHED_SCORES],
+        new_state[_StateKeys.FINISHED_FLAGS])
+    finished_indices = tf.to_int32(tf.where(finished)[:, 0])
+    remaining_indices = tf.to_int32(tf.where(tf.logical_not(finished))[:, 0])
+
+    done_seq, done_scores = self._add_done_batch_items(
+        state, tf.gather(batch_ids, finished_indices),
+        tf.gather(new_state[_StateKeys.FINISHED_SEQ], finished_indices),
+        tf.gather(new_state[_StateKeys.FINISHED_SCORES], finished_indices))
+
+    remaining_state = {
+        _StateKeys.BATCH_IDS: tf.gather(batch_ids, remaining_indices),
+        _StateKeys.DONE_SEQ: done_seq,
+        _StateKeys.DONE_SCORES: done_scores,
+        _StateKeys.ALIVE_CACHE: _gather_batch_beams(
+            new_cache, remaining_indices,
+            tf.gather(alive_beam_indices, remaining_indices))
+    }
+    for key in (_StateKeys.ALIVE_SEQ, _StateKeys.ALIVE_LOG_PROBS,
+                _StateKeys.FINISHED_SEQ, _StateKeys.FINISHED_SCORES,
+                _StateKeys.FINISHED_FLAGS):
+      remaining_state[key] = tf.gather(new_state[key], remaining_indices)
+    return remaining_state
+
+  def _add_done_batch_items(self, state, batch_ids, seq, scores):
+    """Add sequences of batch items to the done sequences of the state.
+
+    Args:
+      state: A dictionary with the current loop state.
+      batch_ids: Indices of the batch items in the original batch.
+        int32 tensor with shape [num_items]
+      seq: Top sequences of the batch items.
+        int32 tensor with shape [num_items, beam_size, length]
+      scores: Scores of the sequences.
+        float32 tensor with shape [num_items, beam_size]
+
+    Returns:
+      Tuple of
+      (Done sequences [original batch_size, beam_size, max_decode_length + 1],
+       Done scores [original batch_size, beam_size])
+    """
+    done_seq = state[_StateKeys.DONE_SEQ]
+    done_scores = state[_StateKeys.DONE_SCORES]
+
+    # Pad the sequences to the length of the done sequences. Each batch item is
+    # only added once, so its done values are still 0s and can be added to.
+    seq = tf.pad(seq, [[0, 0], [0, 0],
+                       [0, tf.shape(done_seq)[2] - tf.shape(seq)[2]]])
+    indices = tf.expand_dims(batch_ids, axis=1)
+    done_seq += tf.scatter_nd(indices, seq, tf.shape(done_seq))
+    done_scores += tf.scatter_nd(indices, scores, tf.shape(done_scores))
+    return done_seq, done_scores
+
 
 def sequence_beam_search(
     symbols_to_logits_fn, initial_ids, initial_cache, vocab_size, beam_size,
-    alpha, max_decode_length, eos_id):
+    alpha, max_decode_length, eos_id, shortlist_key=None):
   """Search for sequence of subtoken ids with the largest probability.
 
   Args:
@@ -405,6 +535,10 @@ def sequence_beam_search(
     alpha: float defining the strength of length normalization
     max_decode_length: maximum length to decoded sequence
     eos_id: int id of eos token, used to determine when a sequence has finished
+    shortlist_key: (optional) key of a cache entry holding a shortlist of token
+      IDs for each batch item, int32 tensor with shape [batch_size, vocab_size].
+      If set, the logits returned by symbols_to_logits_fn are those of the
+      shortlisted IDs, and vocab_size is the size of the shortlists.
 
   Returns:
     Top decoded sequences [batch_size, beam_size, max_decode_length]
@@ -412,7 +546,8 @@ def sequence_beam_search(
   """
   batch_size = tf.shape(initial_ids)[0]
   sbs = SequenceBeamSearch(symbols_to_logits_fn, vocab_size, batch_size,
-                           beam_size, alpha, max_decode_length, eos_id)
+                           beam_size, alpha, max_decode_length, eos_id,
+                           shortlist_key)
   return sbs.search(initial_ids, initial_cache)
 
 
@@ -420,6 +555,78 @@ def _log_prob_from_logits(logits):
   return logits - tf.reduce_logsumexp(logits, axis=2, keep_dims=True)
 
 
+def _get_topk_candidates(logits, alive_log_probs, k):
+  """Get the k most probable extensions of the alive sequences.
+
+  The candidates are selected in two stages. Within a beam, the order of the
+  log probabilities of the extensions is that of the logits, so the top k
+  candidates over all beams are among the top k IDs of each beam. Those are
+  selected first, and only their logits are normalized and merged across the
+  beams, instead of the log probabilities of the whole vocabulary. The result
+  is the same as that of _get_topk_candidates_full_vocab, including the order
+  of ties.
+
+  Args:
+    logits: float32 tensor with shape [batch_size, beam_size, vocab_size]
+    alive_log_probs: Log probabilities of the alive sequences.
+      float32 tensor with shape [batch_size, beam_size]
+    k: int number of candidates to select for each batch item.
+
+  Returns:
+    Tuple of
+    (Log probabilities of the candidates [batch_size, k],
+     Indices of the beams extended by the candidates [batch_size, k],
+     IDs extending the beams [batch_size, k])
+  """
+  beam_size = tf.shape(logits)[1]
+  beam_k = min(k, logits.shape[2].value or k)
+
+  # Select the top IDs of each beam. Their log probabilities are normalized by
+  # the logsumexp of the full logits, like _log_prob_from_logits.
+  beam_topk_logits, beam_topk_ids = tf.nn.top_k(logits, k=beam_k)
+  beam_topk_log_probs = beam_topk_logits - tf.reduce_logsumexp(
+      logits, axis=2, keep_dims=True)
+  log_probs = beam_topk_log_probs + tf.expand_dims(alive_log_probs, axis=2)
+
+  # Merge the beam_size * beam_k candidates of each batch item.
+  flat_log_probs = tf.reshape(log_probs, [-1, beam_size * beam_k])
+  topk_log_probs, topk_indices = tf.nn.top_k(flat_log_probs, k=k)
+  topk_beam_indices = topk_indices // beam_k
+  topk_ids = tf.gather_nd(
+      beam_topk_ids, tf.stack([_get_batch_pos(topk_indices), topk_beam_indices,
+                               topk_indices % beam_k], axis=2))
+  return topk_log_probs, topk_beam_indices, topk_ids
+
+
+def _get_topk_candidates_full_vocab(logits, alive_log_probs, k):
+  """Get the k most probable extensions of the alive sequences.
+
+  Reference for _get_topk_candidates, which normalizes the logits of the whole
+  vocabulary and selects the candidates among all beam_size * vocab_size
+  extensions at once.
+  """
+  vocab_size = tf.shape(logits)[2]
+
+  # Convert logits to normalized log probs
+  candidate_log_probs = _log_prob_from_logits(logits)
+
+  # Calculate new log probabilities if each of the alive sequences were
+  # extended # by the the candidate IDs.
+  # Shape [batch_size, beam_size, vocab_size]
+  log_probs = candidate_log_probs + tf.expand_dims(alive_log_probs, axis=2)
+
+  flat_log_probs = tf.reshape(log_probs, [-1, tf.shape(logits)[1] * vocab_size])
+  topk_log_probs, topk_indices = tf.nn.top_k(flat_log_probs, k=k)
+  return topk_log_probs, topk_indices // vocab_size, topk_indices % vocab_size
+
+
+def _get_batch_pos(indices):
+  """Return batch position of each element in indices [batch_size, k]."""
+  batch_size = tf.shape(indices)[0]
+  k = tf.shape(indices)[1]
+  return tf.reshape(tf.range(batch_size * k) // k, [batch_size, k])
+
+
 def _length_normalization(alpha, length):
   """Return length normalization factor."""
   return tf.pow(((5. + tf.to_float(length)) / 6.), alpha)
@@ -467,6 +674,22 @@ def _get_shape_keep_last_dim(tensor):
   return tf.TensorShape(shape_list)
 
 
+def _get_shape_keep_inner_dims(tensor):
+  """Return shape of tensor with unknown batch and beam dimensions.
+
+  The values in the cache keep their shapes across decoding steps, so the
+  statically known inner dimensions are kept in the shape invariant.
+
+  Args:
+    tensor: Tensor of shape [batch_size, beam_size, ...]
+
+  Returns:
+    TensorShape [None, None, ...]
+  """
+  shape = tensor.get_shape().as_list()
+  return tf.TensorShape([None, None] + shape[2:])
+
+
 def _flatten_beam_dim(tensor):
   """Reshapes first two dimensions in to single dimension.
 
@@ -535,6 +758,29 @@ def _gather_beams(nested, beam_indices, batch_size, new_beam_size):
       lambda state: tf.gather_nd(state, coordinates), nested)
 
 
+def _gather_batch_beams(nested, batch_indices, beam_indices):
+  """Gather beams of a subset of the batch items from nested structure.
+
+  Args:
+    nested: Nested structure (tensor, list, tuple or dict) containing tensors
+      with shape [batch_size, beam_size, ...].
+    batch_indices: int32 tensor with shape [new_batch_size]. Indices of the
+      batch items to gather.
+    beam_indices: int32 tensor with shape [new_batch_size, new_beam_size]. The
+      beams to gather for each of the batch items.
+
+  Returns:
+    Nested structure containing tensors with shape
+      [new_batch_size, new_beam_size, ...]
+  """
+  batch_pos = tf.tile(tf.expand_dims(batch_indices, axis=1),
+                      [1, tf.shape(beam_indices)[1]])
+  coordinates = tf.stack([batch_pos, beam_indices], axis=2)
+
+  return nest.map_structure(
+      lambda state: tf.gather_nd(state, coordinates), nested)
+
+
 def _gather_topk_beams(nested, score_or_log_prob, batch_size, beam_size):
   """Gather top beams from nested structure."""
   _, topk_indexes = tf.nn.top_k(score_or_log_prob, k=beam_size)
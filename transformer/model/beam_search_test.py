@@ -18,6 +18,9 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import time
+
+import numpy as np
 import tensorflow as tf  # pylint: disable=g-bad-import-order
 
 from official.transformer.model import beam_search
@@ -48,6 +51,13 @@ class BeamSearchHelperTests(tf.test.TestCase):
     self.assertAllEqual([None, None, None, 5],
                         shape.as_list())
 
+  def test_get_shape_keep_inner_dims(self):
+    y = tf.placeholder(dtype=tf.int32, shape=[])
+    x = tf.ones([7, 3, 2, y, 5])
+    shape = beam_search._get_shape_keep_inner_dims(x)
+    self.assertAllEqual([None, None, 2, None, 5],
+                        shape.as_list())
+
   def test_flatten_beam_dim(self):
     x = tf.ones([7, 4, 2, 5])
     x = beam_search._flatten_beam_dim(x)
@@ -96,6 +106,131 @@ class BeamSearchHelperTests(tf.test.TestCase):
                           [20, 21, 22, 23]]],
                         y)
 
+  def test_gather_batch_beams(self):
+    x = tf.reshape(tf.range(24), [2, 3, 4])
+
+    y = beam_search._gather_batch_beams(x, [1], [[0, 2]])
+    with self.test_session() as sess:
+      y = sess.run(y)
+
+    self.assertAllEqual([[[12, 13, 14, 15],
+                          [20, 21, 22, 23]]],
+                        y)
+
+  def test_get_topk_candidates(self):
+    np.random.seed(0)
+    # Rounded logits, so that the candidates include ties.
+    logits = tf.constant(np.round(np.random.randn(5, 3, 20)), dtype=tf.float32)
+    alive_log_probs = tf.constant(
+        np.round(np.random.randn(5, 3)), dtype=tf.float32)
+
+    candidates = beam_search._get_topk_candidates(logits, alive_log_probs, 6)
+    expected_candidates = beam_search._get_topk_candidates_full_vocab(
+        logits, alive_log_probs, 6)
+    with self.test_session() as sess:
+      candidates, expected_candidates = sess.run(
+          (candidates, expected_candidates))
+
+    self.assertAllClose(expected_candidates[0], candidates[0])
+    self.assertAllEqual(expected_candidates[1], candidates[1])
+    self.assertAllEqual(expected_candidates[2], candidates[2])
+
+
+class SequenceBeamSearchTest(tf.test.TestCase):
+
+  def test_batch_items_finish_separately(self):
+    eos_id = 1
+    # 3 -> EOS and 0 -> 2 -> 3 -> EOS are much more probable than other IDs.
+    transition_logits = np.zeros([4, 4])
+    transition_logits[0, 2] = 10.
+    transition_logits[2, 3] = 10.
+    transition_logits[3, eos_id] = 10.
+    transition_logits = tf.constant(transition_logits, dtype=tf.float32)
+
+    def symbols_to_logits_fn(ids, i, cache):
+      del i  # Unused
+      cache["last_ids"] = ids[:, -1]
+      return tf.gather(transition_logits, cache["last_ids"]), cache
+
+    initial_ids = tf.constant([3, 0])
+    decoded_ids, scores = beam_search.sequence_beam_search(
+        symbols_to_logits_fn, initial_ids, {"last_ids": initial_ids},
+        vocab_size=4, beam_size=2, alpha=0.6, max_decode_length=10,
+        eos_id=eos_id)
+    with self.test_session() as sess:
+      decoded_ids, scores = sess.run((decoded_ids, scores))
+
+    # The first batch item finishes after one step and is removed from the
+    # search. Its sequences are padded to the length of the second item's.
+    self.assertEqual(2, decoded_ids.shape[0])
+    self.assertEqual(2, decoded_ids.shape[1])
+    self.assertAllEqual([3, eos_id], decoded_ids[0, 0, :2])
+    self.assertFalse(decoded_ids[0, 0, 2:].any())
+    self.assertAllEqual([0, 2, 3, eos_id], decoded_ids[1, 0, :4])
+    self.assertAllEqual([2, 2], scores.shape)
+    self.assertGreater(scores[0, 0], scores[0, 1])
+
+  def test_shortlist(self):
+    eos_id = 1
+    # The logits are those of the shortlist [5, 7, eos_id]. 0 -> 5 -> 7 -> EOS
+    # is much more probable than other sequences.
+    shortlist_ids = tf.constant([[5, 7, eos_id]])
+    transition_logits = np.zeros([8, 3])
+    transition_logits[0, 0] = 10.
+    transition_logits[5, 1] = 10.
+    transition_logits[7, 2] = 10.
+    transition_logits = tf.constant(transition_logits, dtype=tf.float32)
+
+    def symbols_to_logits_fn(ids, i, cache):
+      del i  # Unused
+      return tf.gather(transition_logits, ids[:, -1]), cache
+
+    initial_ids = tf.constant([0])
+    decoded_ids, scores = beam_search.sequence_beam_search(
+        symbols_to_logits_fn, initial_ids, {"shortlist": shortlist_ids},
+        vocab_size=3, beam_size=2, alpha=0.6, max_decode_length=10,
+        eos_id=eos_id, shortlist_key="shortlist")
+    with self.test_session() as sess:
+      decoded_ids, scores = sess.run((decoded_ids, scores))
+
+    self.assertAllEqual([0, 5, 7, eos_id], decoded_ids[0, 0, :4])
+    self.assertGreater(scores[0, 0], scores[0, 1])
+
+
+class TopkCandidatesBenchmark(tf.test.Benchmark):
+  """Compare the two-stage candidate selection to the full vocabulary one.
+
+  Run with:
+    python beam_search_test.py --benchmarks=.
+  """
+
+  def _benchmark_candidates(self, name, candidates_fn, batch_size=32,
+                            beam_size=4, vocab_size=32000, num_iters=20):
+    with tf.Graph().as_default(), tf.Session() as sess:
+      logits = tf.Variable(
+          tf.random_normal([batch_size, beam_size, vocab_size], seed=1))
+      alive_log_probs = tf.Variable(
+          tf.random_normal([batch_size, beam_size], seed=2))
+      candidates = tf.group(
+          *candidates_fn(logits, alive_log_probs, 2 * beam_size))
+      sess.run(tf.global_variables_initializer())
+
+      sess.run(candidates)  # Warm up
+      start = time.time()
+      for _ in range(num_iters):
+        sess.run(candidates)
+      wall_time = (time.time() - start) / num_iters
+
+    self.report_benchmark(name=name, iters=num_iters, wall_time=wall_time)
+
+  def benchmark_two_stage(self):
+    self._benchmark_candidates(
+        "two_stage", beam_search._get_topk_candidates)
+
+  def benchmark_full_vocab(self):
+    self._benchmark_candidates(
+        "full_vocab", beam_search._get_topk_candidates_full_vocab)
+
 
 if __name__ == "__main__":
   tf.test.main()
@@ -111,3 +111,19 @@ class EmbeddingSharedWeights(tf.layers.Layer):
 
 
 
+
+  def shortlist_linear(self, x, shortlist_ids):
+    """Computes logits of the tokens in a shortlist of each batch item.
+
+    Only the rows of the shared weights of the shortlisted tokens are
+    multiplied with x, instead of the whole [vocab_size, hidden_size] matrix.
+
+    Args:
+      x: A float32 tensor with shape [batch_size, length, hidden_size]
+      shortlist_ids: An int32 tensor with shape [batch_size, shortlist_size]
+    Returns:
+      float32 tensor with shape [batch_size, length, shortlist_size].
+    """
+    with tf.name_scope("presoftmax_linear"):
+      weights = tf.gather(self.shared_weights, shortlist_ids)
+      return tf.matmul(x, weights, transpose_b=True)
@@ -102,3 +102,164 @@ class FeedFowardNetwork(tf.layers.Layer):
         )
         output = tf.reshape(output, [batch_size, length, self.output_size])
     return output
+
+
+class LatentFeedFowardNetwork(object):
+  """Normalized feedforward network over inputs concatenated with a latent.
+
+  Computes the same outputs as layer normalization followed by a
+  FeedFowardNetwork applied to tf.concat([x, latent_sample], axis=-1), where
+  latent_sample is tiled along the length of x, and creates the same variables.
+  The latent sample is never tiled: its contribution to the normalization
+  statistics and to the filter layer is computed once per example and added to
+  the projection of x.
+  """
+
+  def __init__(self, hidden_size, latent_size, filter_size, relu_dropout, train,
+               output_size=None, epsilon=1e-6):
+    self.hidden_size = hidden_size
+    self.latent_size = latent_size
+    self.filter_size = filter_size
+    self.output_size = output_size if output_size else self.hidden_size
+    self.relu_dropout = relu_dropout
+    self.train = train
+    self.epsilon = epsilon
+    # Projections of the layer norm weights computed when a cache was filled,
+    # keyed by the filter kernel variable.
+    self._weight_projections = {}
+
+  def _get_variables(self):
+    """Get the variables of the layer normalization and dense layers.
+
+    The variable scopes match those of a LayerNormalization and a
+    FeedFowardNetwork called in the current scope, so checkpoints can be shared.
+    """
+    input_size = self.hidden_size + self.latent_size
+    with tf.variable_scope("layer_normalization"):
+      scale = tf.get_variable("layer_norm_scale", [input_size],
+                              initializer=tf.ones_initializer())
+      bias = tf.get_variable("layer_norm_bias", [input_size],
+                             initializer=tf.zeros_initializer())
+    with tf.variable_scope("feed_foward_network"):
+      with tf.variable_scope("filter_layer"):
+        filter_kernel = tf.get_variable(
+            "kernel", [input_size, self.filter_size])
+        filter_bias = tf.get_variable(
+            "bias", [self.filter_size], initializer=tf.zeros_initializer())
+      with tf.variable_scope("output_layer"):
+        output_kernel = tf.get_variable(
+            "kernel", [self.filter_size, self.output_size])
+        output_bias = tf.get_variable(
+            "bias", [self.output_size], initializer=tf.zeros_initializer())
+    return scale, bias, filter_kernel, filter_bias, output_kernel, output_bias
+
+  def _project_weights(self, latent_scale, latent_bias, latent_kernel,
+                       filter_bias):
+    """Return the projections of the latent layer norm weights.
+
+    The normalized latent sample is
+      (latent_sample - mean) * rstd * latent_scale + latent_bias,
+    so its projection through the filter layer is split into the per-example
+    projection and two projections of the layer norm weights, which are the
+    same for every example.
+
+    Returns:
+      The projections of latent_scale, and of latent_bias plus filter_bias.
+      float tensors with shape [1, filter_size]
+    """
+    scale_projection = tf.matmul(
+        tf.expand_dims(latent_scale, axis=0), latent_kernel)
+    bias_projection = tf.matmul(
+        tf.expand_dims(latent_bias, axis=0), latent_kernel) + filter_bias
+    return scale_projection, bias_projection
+
+  def __call__(self, x, latent_sample, cache=None):
+    """Return outputs of the feedforward network.
+
+    Args:
+      x: tensor with shape [batch_size, length, hidden_size]
+      latent_sample: tensor with shape [batch_size, latent_size]
+      cache: (Used during prediction) dictionary storing the terms that only
+        depend on the latent sample:
+            {"sum": tensor with shape [batch_size, 1],
+             "square_sum": tensor with shape [batch_size, 1],
+             "projection": tensor with shape [batch_size, filter_size]}
+        If the dictionary is empty, the terms are computed from latent_sample
+        and stored in it. Otherwise latent_sample is not used. The projections
+        of the layer norm weights do not depend on the inputs, so they are not
+        cached: those computed when the cache is filled are reused by the
+        later calls, e.g. in a decoding loop, instead of being gathered with
+        the cache by beam search.
+
+    Returns:
+      Output of the feedforward network.
+      tensor with shape [batch_size, length, output_size]
+    """
+    (scale, bias, filter_kernel, filter_bias, output_kernel,
+     output_bias) = self._get_variables()
+    x_scale, latent_scale = tf.split(
+        scale, [self.hidden_size, self.latent_size])
+    x_bias, latent_bias = tf.split(bias, [self.hidden_size, self.latent_size])
+    x_kernel, latent_kernel = tf.split(
+        filter_kernel, [self.hidden_size, self.latent_size])
+
+    weight_projections = None
+    if cache:
+      latent_terms = cache
+      weight_projections = self._weight_projections.get(filter_kernel)
+    else:
+      with tf.name_scope("latent_terms"):
+        latent_terms = {
+            "sum": tf.reduce_sum(latent_sample, axis=-1, keepdims=True),
+            "square_sum": tf.reduce_sum(
+                tf.square(latent_sample), axis=-1, keepdims=True),
+            "projection": tf.matmul(latent_sample * latent_scale,
+                                    latent_kernel)}
+        if cache is not None:
+          # Keep the weight projections for the calls reading the cache.
+          weight_projections = self._project_weights(
+              latent_scale, latent_bias, latent_kernel, filter_bias)
+          self._weight_projections[filter_kernel] = weight_projections
+      if cache is not None:
+        cache.update(latent_terms)
+    if weight_projections is None:
+      weight_projections = self._project_weights(
+          latent_scale, latent_bias, latent_kernel, filter_bias)
+
+    # Expand the latent terms to [batch_size, 1, channels], so they broadcast
+    # along the length of x.
+    latent_sum = tf.expand_dims(latent_terms["sum"], axis=1)
+    latent_square_sum = tf.expand_dims(latent_terms["square_sum"], axis=1)
+    latent_projection = tf.expand_dims(latent_terms["projection"], axis=1)
+    # The projections of the layer norm weights have shape [1, filter_size],
+    # and broadcast along the batch and the length of x.
+    latent_scale_projection, latent_bias_projection = weight_projections
+
+    with tf.name_scope("layer_normalization"):
+      # Mean and variance over the concatenation of x and the latent sample.
+      # The latent sum of squared deviations is expanded, as the mean differs
+      # for each position.
+      input_size = float(self.hidden_size + self.latent_size)
+      mean = (tf.reduce_sum(x, axis=[-1], keepdims=True) +
+              latent_sum) / input_size
+      x_centered = x - mean
+      variance = (
+          tf.reduce_sum(tf.square(x_centered), axis=[-1], keepdims=True) +
+          latent_square_sum - 2 * mean * latent_sum +
+          self.latent_size * tf.square(mean)) / input_size
+      rstd = tf.rsqrt(variance + self.epsilon)
+      norm_x = x_centered * rstd * x_scale + x_bias
+
+    with tf.name_scope("filter_layer"):
+      # The bias projection includes the bias of the filter layer.
+      output = tf.tensordot(norm_x, x_kernel, axes=1)
+      output += rstd * (latent_projection - mean * latent_scale_projection)
+      output += latent_bias_projection
+      output = tf.nn.relu(output)
+
+    if self.train:
+      output = tf.nn.dropout(output, 1.0 - self.relu_dropout)
+
+    with tf.name_scope("output_layer"):
+      output = tf.tensordot(output, output_kernel, axes=1) + output_bias
+    return output
@@ -0,0 +1,100 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Test feedforward network layers."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf  # pylint: disable=g-bad-import-order
+
+from official.transformer.model import ffn_layer
+from official.transformer.model import transformer3
+
+HIDDEN_SIZE = 8
+LATENT_SIZE = 6
+FILTER_SIZE = 16
+
+
+class LatentFeedFowardNetworkTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(LatentFeedFowardNetworkTest, self).setUp()
+    np.random.seed(0)
+    self.x = tf.constant(np.random.randn(3, 5, HIDDEN_SIZE), dtype=tf.float32)
+    self.latent_sample = tf.constant(
+        np.random.randn(3, LATENT_SIZE), dtype=tf.float32)
+
+  def _randomize_variables(self, sess):
+    for var in tf.global_variables():
+      shape = var.shape.as_list()
+      sess.run(var.assign(np.random.randn(*shape).astype(np.float32)))
+
+  def _concat_outputs(self):
+    """Return outputs of the unfused layers on the tiled latent sample."""
+    latent_sample_tiled = tf.tile(tf.expand_dims(self.latent_sample, axis=1),
+                                  [1, tf.shape(self.x)[1], 1])
+    inputs = tf.concat([self.x, latent_sample_tiled], axis=-1)
+    with tf.variable_scope("ffn", reuse=True):
+      layer_norm = transformer3.LayerNormalization(HIDDEN_SIZE + LATENT_SIZE)
+      feed_forward_network = ffn_layer.FeedFowardNetwork(
+          HIDDEN_SIZE + LATENT_SIZE, FILTER_SIZE, 0., False, False,
+          output_size=HIDDEN_SIZE)
+      return feed_forward_network(layer_norm(inputs))
+
+  def test_matches_concat_outputs(self):
+    with tf.variable_scope("ffn"):
+      latent_ffn = ffn_layer.LatentFeedFowardNetwork(
+          HIDDEN_SIZE, LATENT_SIZE, FILTER_SIZE, 0., False,
+          output_size=HIDDEN_SIZE)
+      outputs = latent_ffn(self.x, self.latent_sample)
+    expected_outputs = self._concat_outputs()
+
+    with self.test_session() as sess:
+      sess.run(tf.global_variables_initializer())
+      self._randomize_variables(sess)
+      outputs, expected_outputs = sess.run((outputs, expected_outputs))
+
+    self.assertEqual((3, 5, HIDDEN_SIZE), outputs.shape)
+    self.assertAllClose(expected_outputs, outputs, rtol=1e-4, atol=1e-4)
+
+  def test_cache(self):
+    cache = {}
+    with tf.variable_scope("ffn"):
+      latent_ffn = ffn_layer.LatentFeedFowardNetwork(
+          HIDDEN_SIZE, LATENT_SIZE, FILTER_SIZE, 0., False,
+          output_size=HIDDEN_SIZE)
+      outputs = latent_ffn(self.x, self.latent_sample, cache=cache)
+    with tf.variable_scope("ffn", reuse=True):
+      cached_outputs = latent_ffn(self.x[:, :1], None, cache=cache)
+      # A layer that did not fill the cache projects the layer norm weights.
+      new_layer_outputs = ffn_layer.LatentFeedFowardNetwork(
+          HIDDEN_SIZE, LATENT_SIZE, FILTER_SIZE, 0., False,
+          output_size=HIDDEN_SIZE)(self.x[:, :1], None, cache=cache)
+
+    self.assertEqual(set(["sum", "square_sum", "projection"]), set(cache))
+    with self.test_session() as sess:
+      sess.run(tf.global_variables_initializer())
+      self._randomize_variables(sess)
+      outputs, cached_outputs, new_layer_outputs = sess.run(
+          (outputs, cached_outputs, new_layer_outputs))
+
+    self.assertAllClose(outputs[:, :1], cached_outputs)
+    self.assertAllClose(outputs[:, :1], new_layer_outputs)
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -57,6 +57,21 @@ BASE_PARAMS = defaultdict(
     extra_decode_length=50,
     beam_size=4,
     alpha=0.6,  # used to calculate length normalization in beam search
+    num_latent_samples=1,  # Number of responses generated for each input.
+    # Decoding method: "beam_search", or one of "greedy", "top_k" and "nucleus"
+    # to decode a single sequence without beams.
+    decoding_method="beam_search",
+    sampling_top_k=40,  # Number of most probable IDs sampled from by "top_k".
+    sampling_top_p=0.9,  # Probability mass sampled from by "nucleus".
+    # Number of tokens in the vocabulary shortlist that the bag-of-words head
+    # selects for each input. The decoder computes the logits of the whole
+    # vocabulary if it is 0.
+    vocab_shortlist_size=0,
+    shortlist_source_tokens=True,  # Always shortlist the tokens of the input.
+    # Also return the sequences and scores of all beams of beam search.
+    return_n_best=False,
+    # Subtoken vocabulary used to decode the exported translations in the graph.
+    export_vocab_file=None,
 
     # TPU specific parameters
     use_tpu=False,
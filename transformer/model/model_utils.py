@@ -108,3 +108,55 @@ def get_padding_bias(x):
     attention_bias = tf.expand_dims(
         tf.expand_dims(attention_bias, axis=1), axis=1)
   return attention_bias
+
+
+def repeat_batch_elements(x, num_repeats):
+  """Repeat each element of x num_repeats times along the batch dimension.
+
+  Args:
+    x: tensor with shape [batch_size, ...]
+    num_repeats: int number of times each batch element is repeated.
+
+  Returns:
+    Tensor with shape [batch_size * num_repeats, ...], where the copies of each
+    batch element are consecutive.
+  """
+  with tf.name_scope("repeat_batch_elements"):
+    # Use the statically known dimensions where possible, so they are kept in
+    # the shape of the result.
+    shape = x.shape.as_list()
+    dynamic_shape = tf.shape(x)
+    shape = [dynamic_shape[i] if dim is None else dim
+             for i, dim in enumerate(shape)]
+
+    x = tf.expand_dims(x, axis=1)
+    tile_dims = [1] * len(x.shape)
+    tile_dims[1] = num_repeats
+    x = tf.tile(x, tile_dims)
+    return tf.reshape(x, [shape[0] * num_repeats] + shape[1:])
+
+
+def sample_latent(mu, logvar, num_samples=1, use_std=False):
+  """Draw latent samples from the Gaussian prior returned by Transformer.encode.
+
+  Draws the same samples as the latent variable layers of the Transformer.
+
+  Args:
+    mu: tensor with shape [batch_size, latent_size]
+    logvar: tensor with shape [batch_size, latent_size]. If use_std is set, it
+      holds the standard deviations instead of the log variances.
+    num_samples: int number of samples drawn for each batch element.
+    use_std: whether logvar holds standard deviations, as when the model
+      parameter use_std is set.
+
+  Returns:
+    Tensor with shape [batch_size * num_samples, latent_size], where the samples
+    of each batch element are consecutive.
+  """
+  with tf.name_scope("sample_latent"):
+    std = logvar if use_std else tf.exp(0.5 * logvar)
+    if num_samples > 1:
+      mu = repeat_batch_elements(mu, num_samples)
+      std = repeat_batch_elements(std, num_samples)
+    epsilon = tf.random_normal(tf.shape(std), name="epsilon")
+    return mu + std * epsilon
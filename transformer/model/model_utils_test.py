@@ -63,6 +63,23 @@ class ModelUtilsTest(tf.test.TestCase):
                            [0, 0, 0, 0, 0]]]],
                         bias)
 
+  def test_repeat_batch_elements(self):
+    x = tf.constant([[1, 2], [3, 4]])
+    x = model_utils.repeat_batch_elements(x, 3)
+    with self.test_session() as sess:
+      x = sess.run(x)
+
+    self.assertAllEqual([[1, 2], [1, 2], [1, 2], [3, 4], [3, 4], [3, 4]], x)
+
+  def test_sample_latent(self):
+    mu = tf.constant([[1., 2.], [3., 4.]])
+    samples = model_utils.sample_latent(mu, tf.zeros([2, 2]), 2, use_std=True)
+    with self.test_session() as sess:
+      samples = sess.run(samples)
+
+    # With standard deviations of 0, the samples are the means.
+    self.assertAllEqual([[1, 2], [1, 2], [3, 4], [3, 4]], samples)
+
 
 if __name__ == "__main__":
   tf.test.main()
@@ -0,0 +1,255 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Greedy and sampling decoders, as alternatives to beam search.
+
+A single sequence is decoded for each batch item, so unlike beam search there
+are no beams to select and the decoder cache never has to be gathered.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+from tensorflow.python.util import nest
+
+# Default value for INF
+INF = 1. * 1e7
+
+GREEDY = "greedy"
+TOP_K = "top_k"
+NUCLEUS = "nucleus"
+SAMPLING_METHODS = (GREEDY, TOP_K, NUCLEUS)
+
+
+class _StateKeys(object):
+  """Keys to dictionary storing the state of the sampling loop."""
+
+  # Variable storing the loop index.
+  CUR_INDEX = "CUR_INDEX"
+
+  # Decoded sequences, with shape [batch_size, CUR_INDEX + 1]. Sequences that
+  # have finished are padded with 0s.
+  SEQ = "SEQ"
+  # Log probabilities of the decoded sequences. Shape [batch_size]
+  LOG_PROBS = "LOG_PROBS"
+  # Flags indicating which sequences have generated the EOS token.
+  # Shape [batch_size]
+  FINISHED_FLAGS = "FINISHED_FLAGS"
+  # Dictionary of cached values passed to symbols_to_logits_fn.
+  CACHE = "CACHE"
+
+
+class SequenceSampler(object):
+  """Implementation of the greedy and sampling decoding loop."""
+
+  def __init__(self, symbols_to_logits_fn, vocab_size, method,
+               max_decode_length, eos_id, top_k=1, top_p=1., seed=None,
+               shortlist_key=None):
+    if method not in SAMPLING_METHODS:
+      raise ValueError("Sampling method must be one of %s, got %s." %
+                       (SAMPLING_METHODS, method))
+    self.symbols_to_logits_fn = symbols_to_logits_fn
+    self.vocab_size = vocab_size
+    self.method = method
+    self.max_decode_length = max_decode_length
+    self.eos_id = eos_id
+    self.top_k = top_k
+    self.top_p = top_p
+    self.seed = seed
+    self.shortlist_key = shortlist_key
+
+  def sample(self, initial_ids, initial_cache):
+    """Decode a sequence for each batch item."""
+    state, state_shapes = self._create_initial_state(initial_ids, initial_cache)
+
+    finished_state = tf.while_loop(
+        self._continue_sampling, self._sampling_step, loop_vars=[state],
+        shape_invariants=[state_shapes], parallel_iterations=1, back_prop=False)
+    finished_state = finished_state[0]
+    return (finished_state[_StateKeys.SEQ],
+            finished_state[_StateKeys.LOG_PROBS])
+
+  def _create_initial_state(self, initial_ids, initial_cache):
+    """Return initial state dictionary and its shape invariants."""
+    batch_size = tf.shape(initial_ids)[0]
+    state = {
+        _StateKeys.CUR_INDEX: tf.constant(0),
+        _StateKeys.SEQ: tf.expand_dims(initial_ids, axis=1),
+        _StateKeys.LOG_PROBS: tf.zeros([batch_size]),
+        _StateKeys.FINISHED_FLAGS: tf.zeros([batch_size], tf.bool),
+        _StateKeys.CACHE: initial_cache
+    }
+    state_shape_invariants = {
+        _StateKeys.CUR_INDEX: tf.TensorShape([]),
+        _StateKeys.SEQ: tf.TensorShape([None, None]),
+        _StateKeys.LOG_PROBS: tf.TensorShape([None]),
+        _StateKeys.FINISHED_FLAGS: tf.TensorShape([None]),
+        _StateKeys.CACHE: nest.map_structure(
+            _get_shape_keep_inner_dims, initial_cache)
+    }
+    return state, state_shape_invariants
+
+  def _continue_sampling(self, state):
+    """Continue until every sequence is finished or the maximum length."""
+    i = state[_StateKeys.CUR_INDEX]
+    finished_flags = state[_StateKeys.FINISHED_FLAGS]
+    return tf.logical_and(
+        tf.less(i, self.max_decode_length),
+        tf.logical_not(tf.reduce_all(finished_flags)))
+
+  def _sampling_step(self, state):
+    """Sampling loop body.
+
+    Extend each sequence by a single ID. Sequences that have already reached
+    the EOS token are extended with 0s, and their log probabilities are kept.
+
+    Args:
+      state: A dictionary with the current loop state.
+
+    Returns:
+      new state dictionary.
+    """
+    i = state[_StateKeys.CUR_INDEX]
+    seq = state[_StateKeys.SEQ]
+    log_probs = state[_StateKeys.LOG_PROBS]
+    finished_flags = state[_StateKeys.FINISHED_FLAGS]
+
+    logits, new_cache = self.symbols_to_logits_fn(
+        seq, i, state[_StateKeys.CACHE])
+    candidate_log_probs = logits - tf.reduce_logsumexp(
+        logits, axis=1, keepdims=True)
+
+    new_ids = sample_ids(logits, self.method, self.vocab_size, self.top_k,
+                         self.top_p, self.seed)
+    new_log_probs = _gather_ids(candidate_log_probs, new_ids)
+    if self.shortlist_key is not None:
+      # Map the indices into the shortlists to token IDs.
+      new_ids = _gather_ids(new_cache[self.shortlist_key], new_ids)
+
+    new_ids = tf.where(finished_flags, tf.zeros_like(new_ids), new_ids)
+    log_probs += tf.where(
+        finished_flags, tf.zeros_like(new_log_probs), new_log_probs)
+    finished_flags = tf.logical_or(
+        finished_flags, tf.equal(new_ids, self.eos_id))
+
+    return [{
+        _StateKeys.CUR_INDEX: i + 1,
+        _StateKeys.SEQ: tf.concat(
+            [seq, tf.expand_dims(new_ids, axis=1)], axis=1),
+        _StateKeys.LOG_PROBS: log_probs,
+        _StateKeys.FINISHED_FLAGS: finished_flags,
+        _StateKeys.CACHE: new_cache
+    }]
+
+
+def sequence_sample(
+    symbols_to_logits_fn, initial_ids, initial_cache, vocab_size, method,
+    max_decode_length, eos_id, top_k=1, top_p=1., seed=None,
+    shortlist_key=None):
+  """Decode a sequence for each batch item by greedy search or sampling.
+
+  Args:
+    symbols_to_logits_fn: A function that takes in ids, index, and cache as
+      arguments. The passed in arguments will have shape:
+        ids -> [batch_size, index + 1]
+        index -> [] (scalar)
+        cache -> nested dictionary of tensors [batch_size, ...]
+      The function must return logits and new cache.
+        logits -> [batch_size, vocab_size]
+        new cache -> same shape/structure as inputted cache
+    initial_ids: Starting ids for each batch item.
+      int32 tensor with shape [batch_size]
+    initial_cache: dict containing starting decoder variables information
+    vocab_size: int size of tokens
+    method: one of "greedy" (choose the most probable ID), "top_k" (sample
+      among the top_k most probable IDs) or "nucleus" (sample among the most
+      probable IDs with a total probability of top_p).
+    max_decode_length: maximum length to decoded sequence
+    eos_id: int id of eos token, used to determine when a sequence has finished
+    top_k: int number of IDs sampled from with the "top_k" method.
+    top_p: float probability mass sampled from with the "nucleus" method.
+    seed: (optional) int random seed.
+    shortlist_key: (optional) key of a cache entry holding a shortlist of token
+      IDs for each batch item, int32 tensor with shape [batch_size, vocab_size].
+      If set, the logits returned by symbols_to_logits_fn are those of the
+      shortlisted IDs, and vocab_size is the size of the shortlists.
+
+  Returns:
+    Decoded sequences [batch_size, decoded length + 1], starting with the
+      initial ids, and padded with 0s after EOS.
+    Log probabilities of the sequences [batch_size]
+  """
+  sampler = SequenceSampler(symbols_to_logits_fn, vocab_size, method,
+                            max_decode_length, eos_id, top_k, top_p, seed,
+                            shortlist_key)
+  return sampler.sample(initial_ids, initial_cache)
+
+
+def sample_ids(logits, method, vocab_size, top_k=1, top_p=1., seed=None):
+  """Choose the next ID of each sequence from its logits.
+
+  Args:
+    logits: float tensor with shape [batch_size, vocab_size]
+    method: one of "greedy", "top_k" and "nucleus".
+    vocab_size: int size of tokens
+    top_k: int number of IDs sampled from with the "top_k" method. All the IDs
+      are sampled from if top_k is larger than vocab_size.
+    top_p: float probability mass sampled from with the "nucleus" method.
+    seed: (optional) int random seed.
+
+  Returns:
+    int32 tensor with shape [batch_size]
+  """
+  if method == GREEDY:
+    return tf.argmax(logits, axis=1, output_type=tf.int32)
+
+  if method == TOP_K:
+    # Sample among the k IDs with the highest logits.
+    topk_logits, topk_ids = tf.nn.top_k(logits, k=min(top_k, vocab_size))
+  else:
+    # Sample among the smallest set of IDs whose probability is at least
+    # top_p. The IDs are sorted by decreasing probability, and an ID is kept
+    # if the IDs before it have a total probability less than top_p, so the
+    # most probable ID is always kept. Sorting all the logits makes each step
+    # cost about as much as a softmax over the vocabulary, more than the
+    # "top_k" method (see benchmark_nucleus in sampling_test.py).
+    topk_logits, topk_ids = tf.nn.top_k(logits, k=vocab_size)
+    cumulative_probs = tf.cumsum(
+        tf.nn.softmax(topk_logits), axis=1, exclusive=True)
+    topk_logits += tf.to_float(cumulative_probs >= top_p) * -INF
+
+  samples = tf.multinomial(topk_logits, 1, seed=seed, output_dtype=tf.int32)
+  return _gather_ids(topk_ids, tf.squeeze(samples, axis=1))
+
+
+def _gather_ids(params, ids):
+  """Gather one element from each row of params.
+
+  Args:
+    params: tensor with shape [batch_size, n]
+    ids: int32 tensor with shape [batch_size], indices into the rows of params.
+
+  Returns:
+    tensor with shape [batch_size]
+  """
+  batch_pos = tf.range(tf.shape(ids)[0])
+  return tf.gather_nd(params, tf.stack([batch_pos, ids], axis=1))
+
+
+def _get_shape_keep_inner_dims(tensor):
+  """Return shape of tensor with an unknown batch dimension."""
+  shape = tensor.get_shape().as_list()
+  return tf.TensorShape([None] + shape[1:])
@@ -0,0 +1,184 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Test greedy and sampling decoders, and compare their speed to beam search.
+
+Run the throughput comparison with:
+  python sampling_test.py --benchmarks=.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+import numpy as np
+import tensorflow as tf  # pylint: disable=g-bad-import-order
+
+from official.transformer.model import beam_search
+from official.transformer.model import sampling
+
+EOS_ID = 1
+
+
+def _transition_logits_fn(transition_logits):
+  """Return symbols_to_logits_fn whose logits only depend on the last ID."""
+  transition_logits = tf.constant(transition_logits, dtype=tf.float32)
+
+  def symbols_to_logits_fn(ids, i, cache):
+    del i  # Unused
+    cache["step"] += 1
+    return tf.gather(transition_logits, ids[:, -1]), cache
+  return symbols_to_logits_fn
+
+
+class SequenceSamplerTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(SequenceSamplerTest, self).setUp()
+    # 0 -> 2 -> 3 -> EOS, with the most probable ID given a larger logit.
+    transition_logits = np.zeros([4, 4])
+    transition_logits[0, 2] = 5.
+    transition_logits[2, 3] = 5.
+    transition_logits[3, EOS_ID] = 5.
+    transition_logits[1, 2] = 5.
+    self.symbols_to_logits_fn = _transition_logits_fn(transition_logits)
+
+  def _sample(self, initial_ids, method, **kwargs):
+    initial_ids = tf.constant(initial_ids, dtype=tf.int32)
+    cache = {"step": tf.zeros_like(initial_ids)}
+    return sampling.sequence_sample(
+        self.symbols_to_logits_fn, initial_ids, cache, vocab_size=4,
+        method=method, max_decode_length=10, eos_id=EOS_ID, **kwargs)
+
+  def test_greedy(self):
+    decoded_ids, log_probs = self._sample([0], sampling.GREEDY)
+    with self.test_session() as sess:
+      decoded_ids, log_probs = sess.run((decoded_ids, log_probs))
+
+    self.assertAllEqual([[0, 2, 3, EOS_ID]], decoded_ids)
+    expected_log_prob = 3 * (5. - np.log(np.exp(5.) + 3.))
+    self.assertAllClose([expected_log_prob], log_probs)
+
+  def test_finished_sequences_are_padded(self):
+    decoded_ids, log_probs = self._sample([0, 3], sampling.GREEDY)
+    with self.test_session() as sess:
+      decoded_ids, log_probs = sess.run((decoded_ids, log_probs))
+
+    self.assertAllEqual([[0, 2, 3, EOS_ID], [3, EOS_ID, 0, 0]], decoded_ids)
+    self.assertAllClose(log_probs[0], 3 * log_probs[1])
+
+  def test_top_k_one_is_greedy(self):
+    decoded_ids, _ = self._sample([0, 3], sampling.TOP_K, top_k=1)
+    with self.test_session() as sess:
+      decoded_ids = sess.run(decoded_ids)
+
+    self.assertAllEqual([[0, 2, 3, EOS_ID], [3, EOS_ID, 0, 0]], decoded_ids)
+
+  def test_small_nucleus_is_greedy(self):
+    decoded_ids, _ = self._sample([0, 3], sampling.NUCLEUS, top_p=0.01)
+    with self.test_session() as sess:
+      decoded_ids = sess.run(decoded_ids)
+
+    self.assertAllEqual([[0, 2, 3, EOS_ID], [3, EOS_ID, 0, 0]], decoded_ids)
+
+  def test_top_k_samples_from_top_ids(self):
+    decoded_ids, _ = self._sample([0] * 100, sampling.TOP_K, top_k=2, seed=1)
+    with self.test_session() as sess:
+      decoded_ids = sess.run(decoded_ids)
+
+    # The two largest logits after ID 0 are those of ID 2 and, with ties
+    # broken by the lower index, ID 0.
+    self.assertTrue(set(decoded_ids[:, 1]).issubset([0, 2]))
+
+  def test_top_k_larger_than_vocab_size(self):
+    # top_k is clamped to the vocabulary size, so all the IDs are sampled
+    # from, as with top_k equal to the vocabulary size.
+    decoded_ids, _ = self._sample([0] * 100, sampling.TOP_K, top_k=10, seed=1)
+    all_ids, _ = self._sample([0] * 100, sampling.TOP_K, top_k=4, seed=1)
+    with self.test_session() as sess:
+      decoded_ids, all_ids = sess.run((decoded_ids, all_ids))
+
+    self.assertAllEqual(all_ids, decoded_ids)
+
+  def test_invalid_method(self):
+    with self.assertRaises(ValueError):
+      self._sample([0], "beam")
+
+
+class SequenceSamplerBenchmark(tf.test.Benchmark):
+  """Compare the decoding throughput of beam search and the samplers."""
+
+  def _benchmark_decoder(self, name, decode_fn, batch_size=64, vocab_size=8192,
+                         hidden_size=256, max_decode_length=64, num_iters=5):
+    with tf.Graph().as_default(), tf.Session() as sess:
+      # A small recurrent model, so that the cost of a decoding step is
+      # comparable to that of the decoder bookkeeping.
+      embedding = tf.random_normal([vocab_size, hidden_size], seed=1)
+      softmax_weights = tf.random_normal([hidden_size, vocab_size], seed=2)
+
+      def symbols_to_logits_fn(ids, i, cache):
+        del i  # Unused
+        state = tf.tanh(cache["state"] + tf.gather(embedding, ids[:, -1]))
+        cache["state"] = state
+        return tf.matmul(state, softmax_weights), cache
+
+      initial_ids = tf.zeros([batch_size], dtype=tf.int32)
+      cache = {"state": tf.zeros([batch_size, hidden_size])}
+      # The model never favours EOS, so all decoders run max_decode_length
+      # steps.
+      decoded_ids = decode_fn(symbols_to_logits_fn, initial_ids, cache,
+                              vocab_size, max_decode_length)
+
+      sess.run(decoded_ids)  # Warm up
+      start = time.time()
+      for _ in range(num_iters):
+        sess.run(decoded_ids)
+      wall_time = (time.time() - start) / num_iters
+
+    self.report_benchmark(
+        name=name, iters=num_iters, wall_time=wall_time,
+        extras={"sequences_per_sec": batch_size / wall_time})
+
+  def benchmark_beam_search(self):
+    def decode_fn(symbols_to_logits_fn, initial_ids, cache, vocab_size,
+                  max_decode_length):
+      return beam_search.sequence_beam_search(
+          symbols_to_logits_fn, initial_ids, cache, vocab_size, beam_size=4,
+          alpha=0.6, max_decode_length=max_decode_length, eos_id=-1)[0]
+    self._benchmark_decoder("beam_search", decode_fn)
+
+  def _benchmark_sampler(self, method, **kwargs):
+    def decode_fn(symbols_to_logits_fn, initial_ids, cache, vocab_size,
+                  max_decode_length):
+      return sampling.sequence_sample(
+          symbols_to_logits_fn, initial_ids, cache, vocab_size, method,
+          max_decode_length, eos_id=-1, **kwargs)[0]
+    self._benchmark_decoder(method, decode_fn)
+
+  def benchmark_greedy(self):
+    self._benchmark_sampler(sampling.GREEDY)
+
+  def benchmark_top_k(self):
+    self._benchmark_sampler(sampling.TOP_K, top_k=40)
+
+  def benchmark_nucleus(self):
+    # Each step sorts the logits of the whole vocabulary, instead of finding
+    # the top_k largest ones, so this is slower than benchmark_top_k.
+    self._benchmark_sampler(sampling.NUCLEUS, top_p=0.9)
+
+
+if __name__ == "__main__":
+  tf.test.main()
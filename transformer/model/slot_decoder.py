@@ -0,0 +1,301 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Decode sequences in a fixed pool of slots, one step at a time.
+
+sequence_beam_search and sequence_sample decode a batch in a while loop, which
+runs until the longest sequence of the batch is finished. A SlotDecoder instead
+keeps the decoder state of num_slots sequences in variables, and builds ops
+that are run from Python:
+  encoder_state: encode new inputs with Transformer.encode_source.
+  insert_op: start decoding encoder states in the given slots.
+  step_outputs: decode the next ID of the sequence of every slot.
+Slots whose sequence is finished can be refilled between two steps, so new
+inputs never wait for the other sequences of a batch to finish (continuous
+batching).
+
+Each slot has its own position in the decoded sequence. The slots reuse the
+symbols_to_logits_fn and the decoder cache of the Transformer, with the
+positions passed as a vector. Since the encoder states are fed to insert_op,
+they can be cached for inputs that are decoded again.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+from tensorflow.python.util import nest
+
+from official.transformer.model import model_utils
+from official.transformer.model import sampling
+from official.transformer.utils.tokenizer import EOS_ID
+
+
+class _StateKeys(object):
+  """Keys to dictionary storing the decoding state of the slots."""
+
+  # Last decoded ID of each slot, fed to the next step. Shape [num_slots]
+  IDS = "IDS"
+  # Index of the next ID in the sequence of each slot. Shape [num_slots]
+  POSITIONS = "POSITIONS"
+  # Maximum length of the sequence of each slot. Shape [num_slots]
+  MAX_LENGTHS = "MAX_LENGTHS"
+  # Log probabilities of the decoded sequences. Shape [num_slots]
+  LOG_PROBS = "LOG_PROBS"
+  # Flags indicating which slots are finished or empty. Shape [num_slots]
+  FINISHED_FLAGS = "FINISHED_FLAGS"
+
+
+def _slot_variable(name, shape, dtype=tf.float32, value=0):
+  """Create a local variable filled with value, which is not checkpointed."""
+  return tf.Variable(
+      tf.fill(shape, tf.constant(value, dtype)), trainable=False,
+      collections=[tf.GraphKeys.LOCAL_VARIABLES], name=name)
+
+
+class SlotDecoder(object):
+  """Decodes a sequence in each of num_slots slots, one step at a time.
+
+  The slots are local variables, initialized by tf.local_variables_initializer.
+  All slots are empty initially, and a slot is reused once its sequence is
+  finished. A single sequence is decoded in each slot, with greedy search or
+  sampling. If several latent samples are drawn for each input, the sequence of
+  each sample is decoded in its own slot.
+  """
+
+  def __init__(self, model, num_slots, max_input_length, seed=None):
+    """Build the encode, insert and step ops in the current graph.
+
+    The ops must be built in the variable scope enclosing the Transformer, e.g.
+    "model" for transformer_main.model_fn.
+
+    Args:
+      model: Transformer model in prediction mode. Its parameters set the
+        decoding method, which is one of "greedy", "top_k" and "nucleus".
+      num_slots: int number of sequences decoded together.
+      max_input_length: int maximum length of the inputs. The sequences are
+        decoded for at most max_input_length + extra_decode_length steps.
+      seed: (optional) int random seed of the sampling methods.
+
+    Raises:
+      ValueError: if the decoding method is beam search, or if the model uses a
+        vocabulary shortlist.
+    """
+    params = model.params
+    if params["decoding_method"] not in sampling.SAMPLING_METHODS:
+      raise ValueError(
+          "A single sequence is decoded in each slot, so the decoding method "
+          "must be one of %s, got %s." %
+          (sampling.SAMPLING_METHODS, params["decoding_method"]))
+    if params["vocab_shortlist_size"]:
+      raise ValueError("Slots do not support the vocabulary shortlist.")
+
+    self.model = model
+    self.params = params
+    self.num_slots = num_slots
+    self.max_input_length = max_input_length
+    self.max_decode_length = max_input_length + params["extra_decode_length"]
+    self.num_latent_samples = params["num_latent_samples"] or 1
+    self.seed = seed
+
+    # Encoded inputs, padded with 0s, and their encoder state, padded to
+    # max_input_length.
+    self.inputs = tf.placeholder(tf.int64, [None, None], name="slot_inputs")
+    with tf.name_scope("encode"):
+      self.encoder_state = model.encode_source(tf.pad(
+          self.inputs,
+          [[0, 0], [0, max_input_length - tf.shape(self.inputs)[1]]]))
+
+    # Encoder states decoded by insert_op, and the slots they are decoded in.
+    # Each input takes num_latent_samples consecutive slots of self.slots.
+    self.encoder_state_inputs = {
+        "encoder_outputs": tf.placeholder(
+            tf.float32, [None, max_input_length, params["hidden_size"]],
+            name="encoder_outputs"),
+        "attention_bias": tf.placeholder(
+            tf.float32, [None, 1, 1, max_input_length], name="attention_bias"),
+        "prior_mu": tf.placeholder(
+            tf.float32, [None, params["latent_size"]], name="prior_mu"),
+        "prior_logvar": tf.placeholder(
+            tf.float32, [None, params["latent_size"]], name="prior_logvar"),
+    }
+    self.slots = tf.placeholder(tf.int32, [None], name="slots")
+
+    with tf.name_scope("slot_state"):
+      self._cache = self._create_cache()
+      self._state = {
+          _StateKeys.IDS: _slot_variable("ids", [num_slots], tf.int32),
+          _StateKeys.POSITIONS: _slot_variable(
+              "positions", [num_slots], tf.int32),
+          _StateKeys.MAX_LENGTHS: _slot_variable(
+              "max_lengths", [num_slots], tf.int32),
+          _StateKeys.LOG_PROBS: _slot_variable("log_probs", [num_slots]),
+          _StateKeys.FINISHED_FLAGS: _slot_variable(
+              "finished_flags", [num_slots], tf.bool, True),
+      }
+
+    self.insert_op = self._build_insert_op()
+    # Dictionary of the new ID, log probability and finished flag of each slot.
+    self.step_outputs = self._build_step()
+
+  def _create_cache(self):
+    """Create the decoder cache of the slots, with the structure of predict."""
+    num_heads = self.params["num_heads"]
+    depth = self.params["hidden_size"] // num_heads
+
+    def attention_values(length):
+      return {
+          "k": _slot_variable("k", [self.num_slots, num_heads, length, depth]),
+          "v": _slot_variable("v", [self.num_slots, num_heads, length, depth]),
+      }
+
+    cache = {}
+    for layer in range(self.params["num_hidden_layers"]):
+      layer_name = "layer_%d" % layer
+      with tf.name_scope(layer_name):
+        cache[layer_name] = attention_values(self.max_decode_length)
+        with tf.name_scope("encdec"):
+          cache[layer_name]["encdec"] = attention_values(self.max_input_length)
+        with tf.name_scope("latent"):
+          cache[layer_name]["latent"] = {
+              "sum": _slot_variable("sum", [self.num_slots, 1]),
+              "square_sum": _slot_variable("square_sum", [self.num_slots, 1]),
+              "projection": _slot_variable(
+                  "projection", [self.num_slots, self.params["filter_size"]]),
+          }
+    cache["encoder_decoder_attention_bias"] = _slot_variable(
+        "encoder_decoder_attention_bias",
+        [self.num_slots, 1, 1, self.max_input_length])
+    return cache
+
+  def _build_insert_op(self):
+    """Return an op resetting self.slots to decode self.encoder_state_inputs."""
+    model = self.model
+    encoder_state = self.encoder_state_inputs
+    with tf.name_scope("insert"), tf.variable_scope("Transformer"):
+      # Draw new latent samples from the prior, so that inputs decoded again
+      # get different responses.
+      latent_sample = model_utils.sample_latent(
+          encoder_state["prior_mu"], encoder_state["prior_logvar"],
+          self.num_latent_samples, self.params["use_std"])
+      encoder_outputs = model._repeat_for_latent_samples(  # pylint: disable=protected-access
+          encoder_state["encoder_outputs"])
+      attention_bias = model._repeat_for_latent_samples(  # pylint: disable=protected-access
+          encoder_state["attention_bias"])
+      batch_size = tf.shape(encoder_outputs)[0]
+
+      # As in predict, run the decoder stack over an empty target sequence to
+      # store the encoder-decoder attention values and latent sample terms.
+      # The self-attention values of the slots are reset to 0s, since each
+      # step adds the values of its position.
+      num_heads = self.params["num_heads"]
+      depth = self.params["hidden_size"] // num_heads
+      cache = {
+          "layer_%d" % layer: {
+              "k": tf.zeros(
+                  [batch_size, num_heads, self.max_decode_length, depth]),
+              "v": tf.zeros(
+                  [batch_size, num_heads, self.max_decode_length, depth]),
+              "encdec": {},
+              "latent": {},
+          } for layer in range(self.params["num_hidden_layers"])}
+      model.decoder_stack(
+          tf.zeros([batch_size, 0, self.params["hidden_size"]]),
+          encoder_outputs, tf.zeros([1, 1, 0, 0]), attention_bias,
+          latent_sample, cache)
+      cache["encoder_decoder_attention_bias"] = attention_bias
+
+      # Decode each sequence for at most extra_decode_length steps more than
+      # the length of its input, whose positions have an attention bias of 0.
+      input_lengths = tf.reduce_sum(
+          tf.to_int32(tf.equal(attention_bias[:, 0, 0, :], 0.)), axis=1)
+      max_lengths = tf.minimum(
+          input_lengths + self.params["extra_decode_length"],
+          self.max_decode_length)
+
+      state = self._state
+      updates = nest.flatten(nest.map_structure(
+          lambda var, value: tf.scatter_update(var, self.slots, value),
+          self._cache, cache))
+      zeros = tf.zeros([batch_size], tf.int32)
+      updates += [
+          tf.scatter_update(state[_StateKeys.IDS], self.slots, zeros),
+          tf.scatter_update(state[_StateKeys.POSITIONS], self.slots, zeros),
+          tf.scatter_update(
+              state[_StateKeys.MAX_LENGTHS], self.slots, max_lengths),
+          tf.scatter_update(
+              state[_StateKeys.LOG_PROBS], self.slots, tf.zeros([batch_size])),
+          tf.scatter_update(
+              state[_StateKeys.FINISHED_FLAGS], self.slots,
+              tf.zeros([batch_size], tf.bool)),
+      ]
+      return tf.group(*updates)
+
+  def _build_step(self):
+    """Return the outputs of a decoding step of all slots."""
+    state = self._state
+    with tf.name_scope("step"), tf.variable_scope("Transformer"):
+      symbols_to_logits_fn = self.model._get_symbols_to_logits_fn(  # pylint: disable=protected-access
+          self.max_decode_length)
+      cache = nest.map_structure(tf.identity, self._cache)
+      finished_flags = state[_StateKeys.FINISHED_FLAGS]
+
+      # Finished and empty slots are decoded as well, since the shapes of the
+      # step are fixed, but their state is kept. Their positions may be past
+      # the end of the cache.
+      positions = state[_StateKeys.POSITIONS]
+      logits, cache = symbols_to_logits_fn(
+          tf.expand_dims(state[_StateKeys.IDS], axis=1),
+          tf.minimum(positions, self.max_decode_length - 1), cache)
+      candidate_log_probs = logits - tf.reduce_logsumexp(
+          logits, axis=1, keepdims=True)
+
+      new_ids = sampling.sample_ids(
+          logits, self.params["decoding_method"], self.params["vocab_size"],
+          self.params["sampling_top_k"], self.params["sampling_top_p"],
+          self.seed)
+      new_log_probs = tf.gather_nd(candidate_log_probs, tf.stack(
+          [tf.range(self.num_slots), new_ids], axis=1))
+
+      new_ids = tf.where(finished_flags, tf.zeros_like(new_ids), new_ids)
+      log_probs = state[_StateKeys.LOG_PROBS] + tf.where(
+          finished_flags, tf.zeros_like(new_log_probs), new_log_probs)
+      positions += tf.to_int32(tf.logical_not(finished_flags))
+      finished_flags = tf.logical_or(
+          finished_flags,
+          tf.logical_or(tf.equal(new_ids, EOS_ID),
+                        positions >= state[_StateKeys.MAX_LENGTHS]))
+
+      # Only the self-attention values of the cache change during a step.
+      new_values = [
+          (state[_StateKeys.IDS], new_ids),
+          (state[_StateKeys.POSITIONS], positions),
+          (state[_StateKeys.LOG_PROBS], log_probs),
+          (state[_StateKeys.FINISHED_FLAGS], finished_flags),
+      ]
+      for layer in range(self.params["num_hidden_layers"]):
+        layer_name = "layer_%d" % layer
+        for key in ("k", "v"):
+          new_values.append(
+              (self._cache[layer_name][key], cache[layer_name][key]))
+
+      # The variables are only assigned once all the new values are computed,
+      # so that no op reads an assigned value.
+      with tf.control_dependencies([value for _, value in new_values]):
+        updates = [tf.assign(var, value) for var, value in new_values]
+      with tf.control_dependencies(updates):
+        return {"ids": tf.identity(new_ids),
+                "log_probs": tf.identity(log_probs),
+                "finished": tf.identity(finished_flags)}
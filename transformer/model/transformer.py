@@ -29,6 +29,7 @@ from official.transformer.model import beam_search
 from official.transformer.model import embedding_layer
 from official.transformer.model import ffn_layer
 from official.transformer.model import model_utils
+from official.transformer.model import sampling
 from official.transformer.utils.tokenizer import EOS_ID
 
 _NEG_INF = -1e9
@@ -227,8 +228,8 @@ class Transformer(object):
         ids: Current decoded sequences.
           int tensor with shape [batch_size * beam_size, i + 1]
         i: Loop index
-        cache: dictionary of values storing the encoder output, encoder-decoder
-          attention bias, and previous decoder attention values.
+        cache: dictionary of values storing the encoder-decoder attention keys,
+          values and bias, and previous decoder attention values.
 
       Returns:
         Tuple of
@@ -242,10 +243,13 @@ class Transformer(object):
       decoder_input = self.embedding_softmax_layer(decoder_input)
       decoder_input += timing_signal[i:i + 1]
 
-      self_attention_bias = decoder_self_attention_bias[:, :, i:i + 1, :i + 1]
+      # The self-attention cache holds max_decode_length positions, of which
+      # only the first i + 1 are attended to.
+      self_attention_bias = decoder_self_attention_bias[:, :, i:i + 1, :]
       decoder_outputs = self.decoder_stack(
-          decoder_input, cache.get("encoder_outputs"), self_attention_bias,
-          cache.get("encoder_decoder_attention_bias"), cache)
+          decoder_input, None, self_attention_bias,
+          cache.get("encoder_decoder_attention_bias"), cache,
+          decode_step=i)
       logits = self.embedding_softmax_layer.linear(decoder_outputs)
       logits = tf.squeeze(logits, axis=[1])
       return logits, cache
@@ -262,31 +266,63 @@ class Transformer(object):
     # Create initial set of IDs that will be passed into symbols_to_logits_fn.
     initial_ids = tf.zeros([batch_size], dtype=tf.int32)
 
-    # Create cache storing decoder attention values for each layer.
+    # Create cache storing decoder attention values for each layer. The
+    # self-attention keys and values are allocated for all decoding steps, and
+    # each step writes its own position in place.
+    num_heads = self.params["num_heads"]
+    depth = self.params["hidden_size"] // num_heads
     cache = {
         "layer_%d" % layer: {
-            "k": tf.zeros([batch_size, 0, self.params["hidden_size"]]),
-            "v": tf.zeros([batch_size, 0, self.params["hidden_size"]]),
+            "k": attention_layer.zeros_cache(
+                [batch_size, num_heads, max_decode_length, depth]),
+            "v": attention_layer.zeros_cache(
+                [batch_size, num_heads, max_decode_length, depth]),
+            "encdec": {},
         } for layer in range(self.params["num_hidden_layers"])}
 
-    # Add encoder output and attention bias to the cache.
-    cache["encoder_outputs"] = encoder_outputs
+    # Add attention bias to the cache.
     cache["encoder_decoder_attention_bias"] = encoder_decoder_attention_bias
 
-    # Use beam search to find the top beam_size sequences and scores.
-    decoded_ids, scores = beam_search.sequence_beam_search(
-        symbols_to_logits_fn=symbols_to_logits_fn,
-        initial_ids=initial_ids,
-        initial_cache=cache,
-        vocab_size=self.params["vocab_size"],
-        beam_size=self.params["beam_size"],
-        alpha=self.params["alpha"],
-        max_decode_length=max_decode_length,
-        eos_id=EOS_ID)
-
-    # Get the top sequence for each batch element
-    top_decoded_ids = decoded_ids[:, 0, 1:]
-    top_scores = scores[:, 0]
+    # Run the decoder stack once over an empty target sequence. This stores the
+    # encoder-decoder attention keys and values of each layer in the cache, so
+    # the decoding steps only project the new decoder inputs instead of the
+    # whole encoder output. It also creates the variables of all sublayers
+    # before they are reused inside the decoding loop.
+    self.decoder_stack(
+        tf.zeros([batch_size, 0, self.params["hidden_size"]]), encoder_outputs,
+        tf.zeros([1, 1, 0, 0]), encoder_decoder_attention_bias, cache)
+
+    decoding_method = self.params["decoding_method"] or "beam_search"
+    if decoding_method == "beam_search":
+      # Use beam search to find the top beam_size sequences and scores.
+      decoded_ids, scores = beam_search.sequence_beam_search(
+          symbols_to_logits_fn=symbols_to_logits_fn,
+          initial_ids=initial_ids,
+          initial_cache=cache,
+          vocab_size=self.params["vocab_size"],
+          beam_size=self.params["beam_size"],
+          alpha=self.params["alpha"],
+          max_decode_length=max_decode_length,
+          eos_id=EOS_ID)
+
+      # Get the top sequence for each batch element
+      top_decoded_ids = decoded_ids[:, 0, 1:]
+      top_scores = scores[:, 0]
+    else:
+      # Decode a single sequence for each batch element by greedy search or
+      # sampling. The scores are the log probabilities of the sequences.
+      decoded_ids, scores = sampling.sequence_sample(
+          symbols_to_logits_fn=symbols_to_logits_fn,
+          initial_ids=initial_ids,
+          initial_cache=cache,
+          vocab_size=self.params["vocab_size"],
+          method=decoding_method,
+          max_decode_length=max_decode_length,
+          eos_id=EOS_ID,
+          top_k=self.params["sampling_top_k"],
+          top_p=self.params["sampling_top_p"])
+      top_decoded_ids = decoded_ids[:, 1:]
+      top_scores = scores
 
     return {"outputs": top_decoded_ids, "scores": top_scores}
 
@@ -605,7 +641,7 @@ class DecoderStack(tf.layers.Layer):
     self.output_normalization = LayerNormalization(params["hidden_size"])
 
   def call(self, decoder_inputs, encoder_outputs, decoder_self_attention_bias,
-           attention_bias, cache=None):
+           attention_bias, cache=None, decode_step=None):
     """Return the output of the decoder layer stacks.
 
     Args:
@@ -617,9 +653,18 @@ class DecoderStack(tf.layers.Layer):
         [batch_size, 1, 1, input_length]
       cache: (Used for fast decoding) A nested dictionary storing previous
         decoder self-attention values. The items are:
-          {layer_n: {"k": tensor with shape [batch_size, i, key_channels],
-                     "v": tensor with shape [batch_size, i, value_channels]},
+          {layer_n: {"k": tensor with shape
+                       [batch_size, num_heads, max_decode_length, depth],
+                     "v": tensor with shape
+                       [batch_size, num_heads, max_decode_length, depth],
+                     "encdec": {"k": encoder-decoder attention keys,
+                                "v": encoder-decoder attention values}},
            ...}
+        If the "encdec" items are empty, they are computed from encoder_outputs
+        and stored in the cache. Otherwise encoder_outputs is not used.
+      decode_step: (Used for fast decoding) index of the decoder inputs in the
+        decoded sequence. The self-attention values in the cache are only used
+        and updated if it is set.
 
     Returns:
       Output of decoder layer stack.
@@ -635,11 +680,15 @@ class DecoderStack(tf.layers.Layer):
       layer_cache = cache[layer_name] if cache is not None else None
       with tf.variable_scope(layer_name):
         with tf.variable_scope("self_attention"):
+          # The self-attention cache is only used to decode a single step.
           decoder_inputs = self_attention_layer(
-              decoder_inputs, decoder_self_attention_bias, cache=layer_cache)
+              decoder_inputs, decoder_self_attention_bias,
+              cache=layer_cache if decode_step is not None else None,
+              decode_step=decode_step)
         with tf.variable_scope("encdec_attention"):
           decoder_inputs = enc_dec_attention_layer(
-              decoder_inputs, encoder_outputs, attention_bias)
+              decoder_inputs, encoder_outputs, attention_bias,
+              cache=layer_cache["encdec"] if layer_cache is not None else None)
         with tf.variable_scope("ffn"):
           decoder_inputs = feed_forward_network(decoder_inputs)
 
@@ -29,6 +29,8 @@ from official.transformer.model import beam_search
 from official.transformer.model import embedding_layer
 from official.transformer.model import ffn_layer
 from official.transformer.model import model_utils
+from official.transformer.model import sampling
+from official.transformer.model import vocab_shortlist
 from official.transformer.utils.tokenizer import EOS_ID
 
 _NEG_INF = -1e9
@@ -89,11 +91,22 @@ class Transformer(object):
         returns a dictionary {
           output: [batch_size, decoded length]
           score: [batch_size, float]}
+        If params["num_latent_samples"] is larger than 1, a response is
+        generated for each latent sample, and the dictionary is {
+          output: [batch_size, num_latent_samples, decoded length]
+          score: [batch_size, num_latent_samples, float]
+          sample_ids: [batch_size, num_latent_samples, int]}
+        If params["return_n_best"] is set and beam search is used, the
+        dictionary also holds the sequences and scores of all beams, from the
+        best to the worst, as n_best_outputs and n_best_scores, with shapes
+        [batch_size, (num_latent_samples,) beam_size, decoded length] and
+        [batch_size, (num_latent_samples,) beam_size].
     """
     # Variance scaling is used here because it seems to work in many problems.
     # Other reasonable initializers may also work just as well.
     initializer = tf.variance_scaling_initializer(
         self.params["initializer_gain"], mode="fan_avg", distribution="uniform")
+    outer_scope = tf.get_variable_scope()
     with tf.variable_scope("Transformer", initializer=initializer):
       # Calculate attention bias for encoder self-attention and decoder
       # multi-headed attention layers.
@@ -112,12 +125,82 @@ class Transformer(object):
       # Generate output sequence if targets is None, or return logits if target
       # sequence is known.
       if targets is None:
-        logits = self.predict(encoder_outputs, src_attention_bias, latent_sample)
+        shortlist_ids = None
+        if self.params["vocab_shortlist_size"]:
+          if not self.params["use_bow"]:
+            raise ValueError("The vocabulary shortlist is selected by the "
+                             "bag-of-words head, which requires use_bow.")
+          # The bag-of-words head is trained outside of the Transformer scope,
+          # next to the model losses.
+          with tf.variable_scope(outer_scope):
+            bow_logits = vocab_shortlist.get_bow_logits(
+                latent_sample, self.params, self.train)
+          shortlist_ids = vocab_shortlist.get_shortlist_ids(
+              bow_logits,
+              min(self.params["vocab_shortlist_size"], self.params["vocab_size"]),
+              self._repeat_for_latent_samples(inputs)
+              if self.params["shortlist_source_tokens"] else None)
+        logits = self.predict(encoder_outputs, src_attention_bias, latent_sample,
+                              shortlist_ids)
       else:
         logits = self.decode(targets, encoder_outputs, src_attention_bias, latent_sample)
 
       return logits, latent_sample, prior_mu, prior_logvar, recog_mu, recog_logvar
 
+  def encode_source(self, inputs):
+    """Encode inputs once, so that they can be decoded several times.
+
+    The encoder state is independent of the latent samples and of the decoding
+    method, so it can be cached for inputs that are sent again, and decoded
+    from new latent samples (see slot_decoder.SlotDecoder).
+
+    Args:
+      inputs: int tensor with shape [batch_size, input_length].
+
+    Returns:
+      Dictionary of the encoder state {
+        encoder_outputs: [batch_size, input_length, hidden_size]
+        attention_bias: [batch_size, 1, 1, input_length]
+        prior_mu: [batch_size, latent_size]
+        prior_logvar: [batch_size, latent_size]}
+    """
+    initializer = tf.variance_scaling_initializer(
+        self.params["initializer_gain"], mode="fan_avg", distribution="uniform")
+    with tf.variable_scope("Transformer", initializer=initializer):
+      attention_bias = model_utils.get_padding_bias(inputs)
+      encoder_outputs, _, prior_mu, prior_logvar, _, _ = self.encode(
+          inputs, attention_bias)
+      return {"encoder_outputs": encoder_outputs,
+              "attention_bias": attention_bias,
+              "prior_mu": prior_mu,
+              "prior_logvar": prior_logvar}
+
+  def embed_source(self, inputs):
+    """Return the sentence embeddings of inputs, without the latent variable.
+
+    Only the source encoder and its SentenceEmbeddingLayer are run, e.g. to
+    build a retrieval index of utterances.
+
+    Args:
+      inputs: int tensor with shape [batch_size, input_length].
+
+    Returns:
+      float tensor with shape [batch_size, hidden_size]
+    """
+    initializer = tf.variance_scaling_initializer(
+        self.params["initializer_gain"], mode="fan_avg", distribution="uniform")
+    with tf.variable_scope("Transformer", initializer=initializer):
+      attention_bias = model_utils.get_padding_bias(inputs)
+      # Use the scopes of encode, so that the checkpoint variables are reused.
+      with tf.name_scope("encode"):
+        with tf.variable_scope("src_sentence_embedding"):
+          embedded_inputs = self.embedding_softmax_layer(inputs)
+          encoder_inputs, inputs_padding = self.src_encoder_input_layer(
+              inputs, embedded_inputs)
+          encoder_outputs = self.src_encoder_stack(
+              encoder_inputs, attention_bias, inputs_padding)
+          return self.src_sent_emb_layer(encoder_outputs, inputs_padding)
+
   def encode(self, inputs, src_attention_bias, targets=None, tgt_attention_bias=None):
     """Generate continuous representation for inputs.
 
@@ -150,7 +233,11 @@ class Transformer(object):
       #with tf.name_scope("latent_variable"):
       with tf.variable_scope("latent_variable"):
         if not self.train: tgt_embedding = None
-        latent_sample, prior_mu, prior_logvar, recog_mu, recog_logvar = self.latent_variable_layer(src_embedding, tgt_embedding) # get size [batch_size, hidden_size]
+        # When generating responses, draw several latent samples for each input.
+        num_latent_samples = 1
+        if targets is None:
+          num_latent_samples = self.params["num_latent_samples"] or 1
+        latent_sample, prior_mu, prior_logvar, recog_mu, recog_logvar = self.latent_variable_layer(src_embedding, tgt_embedding, num_latent_samples) # get size [batch_size * num_latent_samples, latent_size]
 
       # no longer contact latent_sample to src_encoder_outputs
       # encoder provide two things to decoder: 1.src_encoder_outputs, 2.latent_sample.
@@ -222,9 +309,12 @@ class Transformer(object):
       Args:
         ids: Current decoded sequences.
           int tensor with shape [batch_size * beam_size, i + 1]
-        i: Loop index
-        cache: dictionary of values storing the encoder output, encoder-decoder
-          attention bias, and previous decoder attention values.
+        i: Loop index, or int tensor with shape [batch_size * beam_size]
+          holding the index of each sequence, if they are decoded at
+          different positions.
+        cache: dictionary of values storing the encoder-decoder attention keys,
+          values and bias, latent sample terms, and previous decoder attention
+          values.
 
       Returns:
         Tuple of
@@ -236,20 +326,53 @@ class Transformer(object):
 
       # Preprocess decoder input by getting embeddings and adding timing signal.
       decoder_input = self.embedding_softmax_layer(decoder_input)
-      decoder_input += timing_signal[i:i + 1]
 
-      self_attention_bias = decoder_self_attention_bias[:, :, i:i + 1, :i + 1]
+      # The self-attention cache holds max_decode_length positions, of which
+      # only the first i + 1 are attended to.
+      if isinstance(i, tf.Tensor) and i.shape.ndims == 1:
+        decoder_input += tf.expand_dims(tf.gather(timing_signal, i), 1)
+        self_attention_bias = tf.reshape(
+            tf.gather(decoder_self_attention_bias[0, 0], i),
+            [-1, 1, 1, max_decode_length])
+      else:
+        decoder_input += timing_signal[i:i + 1]
+        self_attention_bias = decoder_self_attention_bias[:, :, i:i + 1, :]
       decoder_outputs = self.decoder_stack(
-          decoder_input, cache.get("encoder_outputs"), self_attention_bias,
-          cache.get("encoder_decoder_attention_bias"),
-          cache.get("latent_sample"), cache)
-      logits = self.embedding_softmax_layer.linear(decoder_outputs)
+          decoder_input, None, self_attention_bias,
+          cache.get("encoder_decoder_attention_bias"), None, cache,
+          decode_step=i)
+      if vocab_shortlist.SHORTLIST_IDS in cache:
+        logits = self.embedding_softmax_layer.shortlist_linear(
+            decoder_outputs, cache[vocab_shortlist.SHORTLIST_IDS])
+      else:
+        logits = self.embedding_softmax_layer.linear(decoder_outputs)
       logits = tf.squeeze(logits, axis=[1])
       return logits, cache
     return symbols_to_logits_fn
 
-  def predict(self, encoder_outputs, encoder_decoder_attention_bias, latent_sample):
-    """Return predicted sequence."""
+  def _repeat_for_latent_samples(self, x):
+    """Repeat the batch items of x for each of their latent samples."""
+    num_latent_samples = self.params["num_latent_samples"] or 1
+    if num_latent_samples > 1:
+      x = model_utils.repeat_batch_elements(x, num_latent_samples)
+    return x
+
+  def predict(self, encoder_outputs, encoder_decoder_attention_bias,
+              latent_sample, shortlist_ids=None):
+    """Return predicted sequence.
+
+    If shortlist_ids is set, with shape [batch_size, shortlist_size], the
+    decoder only computes the logits of the shortlisted tokens of each batch
+    item.
+    """
+    num_latent_samples = self.params["num_latent_samples"] or 1
+    # Decode the latent samples of all inputs together in one beam search.
+    # Each input is repeated for its samples, which are consecutive in
+    # latent_sample.
+    encoder_outputs = self._repeat_for_latent_samples(encoder_outputs)
+    encoder_decoder_attention_bias = self._repeat_for_latent_samples(
+        encoder_decoder_attention_bias)
+
     batch_size = tf.shape(encoder_outputs)[0]
     input_length = tf.shape(encoder_outputs)[1]
     max_decode_length = input_length + self.params["extra_decode_length"]
@@ -259,34 +382,99 @@ class Transformer(object):
     # Create initial set of IDs that will be passed into symbols_to_logits_fn.
     initial_ids = tf.zeros([batch_size], dtype=tf.int32)
 
-    # Create cache storing decoder attention values for each layer.
+    # Create cache storing decoder attention values for each layer. The
+    # self-attention keys and values are allocated for all decoding steps, and
+    # each step writes its own position in place.
+    num_heads = self.params["num_heads"]
+    depth = self.params["hidden_size"] // num_heads
     cache = {
         "layer_%d" % layer: {
-            "k": tf.zeros([batch_size, 0, self.params["hidden_size"]]),
-            "v": tf.zeros([batch_size, 0, self.params["hidden_size"]]),
+            "k": attention_layer.zeros_cache(
+                [batch_size, num_heads, max_decode_length, depth]),
+            "v": attention_layer.zeros_cache(
+                [batch_size, num_heads, max_decode_length, depth]),
+            "encdec": {},
+            "latent": {},
         } for layer in range(self.params["num_hidden_layers"])}
 
-    # Add encoder output and attention bias to the cache.
-    cache["encoder_outputs"] = encoder_outputs
+    # Add attention bias to the cache.
     cache["encoder_decoder_attention_bias"] = encoder_decoder_attention_bias
-    cache["latent_sample"] = latent_sample
-
-    # Use beam search to find the top beam_size sequences and scores.
-    decoded_ids, scores = beam_search.sequence_beam_search(
-        symbols_to_logits_fn=symbols_to_logits_fn,
-        initial_ids=initial_ids,
-        initial_cache=cache,
-        vocab_size=self.params["vocab_size"],
-        beam_size=self.params["beam_size"],
-        alpha=self.params["alpha"],
-        max_decode_length=max_decode_length,
-        eos_id=EOS_ID)
 
-    # Get the top sequence for each batch element
-    top_decoded_ids = decoded_ids[:, 0, 1:]
-    top_scores = scores[:, 0]
-
-    return {"outputs": top_decoded_ids, "scores": top_scores}
+    vocab_size = self.params["vocab_size"]
+    shortlist_key = None
+    if shortlist_ids is not None:
+      cache[vocab_shortlist.SHORTLIST_IDS] = shortlist_ids
+      vocab_size = shortlist_ids.shape[1].value
+      shortlist_key = vocab_shortlist.SHORTLIST_IDS
+
+    # Run the decoder stack once over an empty target sequence. This stores the
+    # encoder-decoder attention keys and values and the latent sample terms of
+    # each layer in the cache, so the decoding steps only project the new
+    # decoder inputs instead of the whole encoder output. It also creates the
+    # variables of all sublayers before they are reused inside the decoding
+    # loop.
+    self.decoder_stack(
+        tf.zeros([batch_size, 0, self.params["hidden_size"]]), encoder_outputs,
+        tf.zeros([1, 1, 0, 0]), encoder_decoder_attention_bias, latent_sample,
+        cache)
+
+    decoding_method = self.params["decoding_method"] or "beam_search"
+    if decoding_method == "beam_search":
+      # Use beam search to find the top beam_size sequences and scores.
+      decoded_ids, scores = beam_search.sequence_beam_search(
+          symbols_to_logits_fn=symbols_to_logits_fn,
+          initial_ids=initial_ids,
+          initial_cache=cache,
+          vocab_size=vocab_size,
+          beam_size=self.params["beam_size"],
+          alpha=self.params["alpha"],
+          max_decode_length=max_decode_length,
+          eos_id=EOS_ID,
+          shortlist_key=shortlist_key)
+
+      # Get the top sequence for each batch element
+      top_decoded_ids = decoded_ids[:, 0, 1:]
+      top_scores = scores[:, 0]
+      predictions = {}
+      if self.params["return_n_best"]:
+        # The sequences of all beams, from the best to the worst.
+        predictions = {"n_best_outputs": decoded_ids[:, :, 1:],
+                       "n_best_scores": scores}
+    else:
+      # Decode a single sequence for each batch element by greedy search or
+      # sampling. The scores are the log probabilities of the sequences.
+      decoded_ids, scores = sampling.sequence_sample(
+          symbols_to_logits_fn=symbols_to_logits_fn,
+          initial_ids=initial_ids,
+          initial_cache=cache,
+          vocab_size=vocab_size,
+          method=decoding_method,
+          max_decode_length=max_decode_length,
+          eos_id=EOS_ID,
+          top_k=self.params["sampling_top_k"],
+          top_p=self.params["sampling_top_p"],
+          shortlist_key=shortlist_key)
+      top_decoded_ids = decoded_ids[:, 1:]
+      top_scores = scores
+      predictions = {}
+
+    if num_latent_samples > 1:
+      # Group the sequences generated for the samples of each input.
+      top_decoded_ids = tf.reshape(
+          top_decoded_ids,
+          [-1, num_latent_samples, tf.shape(top_decoded_ids)[1]])
+      top_scores = tf.reshape(top_scores, [-1, num_latent_samples])
+      sample_ids = tf.tile(tf.expand_dims(tf.range(num_latent_samples), 0),
+                           [tf.shape(top_scores)[0], 1])
+      for key, value in predictions.items():
+        predictions[key] = tf.reshape(value, tf.concat(
+            [[-1, num_latent_samples], tf.shape(value)[1:]], axis=0))
+      predictions.update({"outputs": top_decoded_ids, "scores": top_scores,
+                          "sample_ids": sample_ids})
+      return predictions
+
+    predictions.update({"outputs": top_decoded_ids, "scores": top_scores})
+    return predictions
 
 
 class LayerNormalization(tf.layers.Layer):
@@ -470,7 +658,14 @@ class LatentVariableLayer(tf.layers.Layer):
           self.recog_std_layer = tf.layers.Dense(
               params["latent_size"], use_bias=False, activation=tf.sigmoid, name="std_layer")
 
-  def __call__(self, src_embedding, tgt_embedding):
+  def __call__(self, src_embedding, tgt_embedding, num_samples=1):
+    """
+      Args:
+        src_embedding: with shape [batch_size, hidden_size]
+        tgt_embedding: with shape [batch_size, hidden_size], used in training
+        num_samples: number of latent samples drawn from the prior for each
+          batch element, when not training
+    """
 
     with tf.variable_scope("prior"):
       src_embedding_expd = tf.expand_dims(src_embedding, axis=1) # get size [batch_size, 1, hidden_size]
@@ -484,9 +679,9 @@ class LatentVariableLayer(tf.layers.Layer):
           prior_logvar = self.prior_std_layer(prior_logvar) * 2.0 # multiply 2.0 for one-center
         with tf.variable_scope("mu"):
           prior_mu = self.prior_mu_layer(prior_mu)
-        latent_sample = self._sample_gaussian_v2(prior_mu, prior_logvar) # get size [batch_size, latent_size]
+        latent_sample = self._sample_gaussian_v2(prior_mu, prior_logvar, num_samples) # get size [batch_size * num_samples, latent_size]
       else:
-        latent_sample = self._sample_gaussian(prior_mu, prior_logvar) # get size [batch_size, latent_size]
+        latent_sample = self._sample_gaussian(prior_mu, prior_logvar, num_samples) # get size [batch_size * num_samples, latent_size]
       recog_mu, recog_logvar = None, None
 
     with tf.variable_scope("recog"):
@@ -510,27 +705,37 @@ class LatentVariableLayer(tf.layers.Layer):
 
     return latent_sample, prior_mu, prior_logvar, recog_mu, recog_logvar
 
-  def _sample_gaussian(self, mu, logvar):
+  def _sample_gaussian(self, mu, logvar, num_samples=1):
     """
       Args: 
         mu:     size [batch_size, latent_size]
         logvar: size [batch_size, latent_size]
+        num_samples: number of samples drawn for each batch element
       Return:
-        z: latent_variable, size [batch_size, latent_size]
+        z: latent_variable, size [batch_size * num_samples, latent_size]
+           the samples of each batch element are consecutive
     """
-    epsilon = tf.random_normal(tf.shape(logvar), name="epsilon")
     std = tf.exp(0.5 * logvar)
+    if num_samples > 1:
+      mu = model_utils.repeat_batch_elements(mu, num_samples)
+      std = model_utils.repeat_batch_elements(std, num_samples)
+    epsilon = tf.random_normal(tf.shape(std), name="epsilon")
     z = mu + tf.multiply(std, epsilon)
     return z
 
-  def _sample_gaussian_v2(self, mu, std):
+  def _sample_gaussian_v2(self, mu, std, num_samples=1):
     """
       Args: 
         mu:     size [batch_size, latent_size]
         std:    size [batch_size, latent_size]
+        num_samples: number of samples drawn for each batch element
       Return:
-        z: latent_variable, size [batch_size, latent_size]
+        z: latent_variable, size [batch_size * num_samples, latent_size]
+           the samples of each batch element are consecutive
     """
+    if num_samples > 1:
+      mu = model_utils.repeat_batch_elements(mu, num_samples)
+      std = model_utils.repeat_batch_elements(std, num_samples)
     epsilon = tf.random_normal(tf.shape(std), name="epsilon")
     z = mu + tf.multiply(std, epsilon)
     return z
@@ -659,24 +864,23 @@ class DecoderStack(tf.layers.Layer):
       enc_dec_attention_layer = attention_layer.Attention(
           params["hidden_size"], params["num_heads"],
           params["attention_dropout"], train)
-      feed_forward_network = ffn_layer.FeedFowardNetwork(
-          #params["hidden_size"], params["filter_size"],
-          #params["hidden_size"] * 2, params["filter_size"],
-          params["hidden_size"] + params["latent_size"], params["filter_size"],
-          params["relu_dropout"], train, params["allow_ffn_pad"],
-          output_size=params["hidden_size"])
+      # The feedforward network runs on the concatenation of the layer inputs
+      # and the latent sample, and normalizes it itself.
+      feed_forward_network = ffn_layer.LatentFeedFowardNetwork(
+          params["hidden_size"], params["latent_size"], params["filter_size"],
+          params["relu_dropout"], train, output_size=params["hidden_size"])
 
       self.layers.append([
           PrePostProcessingWrapper(self_attention_layer, params, train),
           PrePostProcessingWrapper(enc_dec_attention_layer, params, train),
           PrePostProcessingWrapper(feed_forward_network, params, train, 
             input_hidden_size=params["hidden_size"] + params["latent_size"], 
-            output_hidden_size=params["hidden_size"])])
+            output_hidden_size=params["hidden_size"], norm=False)])
 
     self.output_normalization = LayerNormalization(params["hidden_size"])
 
   def call(self, decoder_inputs, encoder_outputs, decoder_self_attention_bias,
-           attention_bias, latent_sample, cache=None):
+           attention_bias, latent_sample, cache=None, decode_step=None):
            #attention_bias, cache=None):
     """Return the output of the decoder layer stacks.
 
@@ -689,10 +893,23 @@ class DecoderStack(tf.layers.Layer):
         [batch_size, 1, 1, input_length]
       cache: (Used for fast decoding) A nested dictionary storing previous
         decoder self-attention values. The items are:
-          {layer_n: {"k": tensor with shape [batch_size, i, key_channels],
-                     "v": tensor with shape [batch_size, i, value_channels]},
+          {layer_n: {"k": tensor with shape
+                       [batch_size, num_heads, max_decode_length, depth],
+                     "v": tensor with shape
+                       [batch_size, num_heads, max_decode_length, depth],
+                     "encdec": {"k": encoder-decoder attention keys,
+                                "v": encoder-decoder attention values},
+                     "latent": {"sum": latent sample sum,
+                                "square_sum": latent sample sum of squares,
+                                "projection": latent filter layer projection}},
            ...}
-      latent_sample: tensor with shape [batch_size, hidden_size]
+        If the "encdec" and "latent" items are empty, they are computed from
+        encoder_outputs and latent_sample and stored in the cache. Otherwise
+        encoder_outputs and latent_sample are not used.
+      latent_sample: tensor with shape [batch_size, latent_size]
+      decode_step: (Used for fast decoding) index of the decoder inputs in the
+        decoded sequence. The self-attention values in the cache are only used
+        and updated if it is set.
 
     Returns:
       Output of decoder layer stack.
@@ -708,19 +925,19 @@ class DecoderStack(tf.layers.Layer):
       layer_cache = cache[layer_name] if cache is not None else None
       with tf.variable_scope(layer_name):
         with tf.variable_scope("self_attention"):
+          # The self-attention cache is only used to decode a single step.
           decoder_inputs = self_attention_layer(
-              decoder_inputs, decoder_self_attention_bias, cache=layer_cache)
+              decoder_inputs, decoder_self_attention_bias,
+              cache=layer_cache if decode_step is not None else None,
+              decode_step=decode_step)
         with tf.variable_scope("encdec_attention"):
           decoder_inputs = enc_dec_attention_layer(
-              decoder_inputs, encoder_outputs, attention_bias)
-
-        # contact latent_sample
-        with tf.variable_scope("concat_latent_sample"):
-          latent_sample_tiled = tf.expand_dims(latent_sample, axis=1) # get size [batch_size, 1, latent_size]
-          latent_sample_tiled = tf.tile(latent_sample_tiled, [1, tf.shape(decoder_inputs)[1], 1]) # get size [batch_size, length, latent_size]
-          decoder_inputs = tf.concat([decoder_inputs, latent_sample_tiled], axis=-1) # get size [batch_size, length, hidden_size+latent_size]
+              decoder_inputs, encoder_outputs, attention_bias,
+              cache=layer_cache["encdec"] if layer_cache is not None else None)
 
         with tf.variable_scope("ffn"):
-          decoder_inputs = feed_forward_network(decoder_inputs)
+          decoder_inputs = feed_forward_network(
+              decoder_inputs, latent_sample,
+              cache=layer_cache["latent"] if layer_cache is not None else None)
 
     return self.output_normalization(decoder_inputs)
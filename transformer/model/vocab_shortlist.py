@@ -0,0 +1,95 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Bag-of-words head, and the vocabulary shortlist it selects for decoding.
+
+The bag-of-words (BOW) head predicts the target tokens from the latent sample.
+It is trained with the BOW loss, and at inference its logits select a shortlist
+of likely target tokens for each input. The decoder then only computes the
+logits of the shortlisted tokens, instead of those of the whole vocabulary.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf  # pylint: disable=g-bad-import-order
+
+from official.transformer.model import ffn_layer
+from official.transformer.utils.tokenizer import EOS_ID
+from official.transformer.utils.tokenizer import PAD_ID
+
+# Key of the shortlist in the decoding cache.
+SHORTLIST_IDS = "shortlist_ids"
+
+# Default value for INF
+INF = 1. * 1e7
+
+
+def get_bow_logits(latent_sample, params, train):
+  """Return logits of the target tokens predicted from the latent sample.
+
+  Args:
+    latent_sample: float32 tensor with shape [batch_size, latent_size]
+    params: hyperparameter object defining layer sizes, dropout values, etc.
+    train: boolean indicating whether the model is in training mode.
+
+  Returns:
+    float32 tensor with shape [batch_size, vocab_size]
+  """
+  with tf.variable_scope("bow_decoder"):
+    bow_ffn_layer = ffn_layer.FeedFowardNetwork(
+        params["latent_size"], params["filter_size"],
+        params["relu_dropout"], train, params["allow_ffn_pad"],
+        output_size=params["vocab_size"], activation=tf.nn.relu)
+    bow_logits = bow_ffn_layer(
+        tf.expand_dims(latent_sample, axis=1), padding=None)
+    return tf.squeeze(bow_logits, axis=1)
+
+
+def get_shortlist_ids(bow_logits, shortlist_size, inputs=None):
+  """Select the shortlist of target tokens of each batch item.
+
+  The shortlist holds the tokens with the largest BOW logits, and always
+  includes the EOS token. The padding token is never included.
+
+  Args:
+    bow_logits: float32 tensor with shape [batch_size, vocab_size]
+    shortlist_size: int number of tokens in each shortlist.
+    inputs: (optional) int tensor with shape [batch_size, input_length]. If set,
+      the source tokens are included in the shortlist before the tokens chosen
+      by their BOW logits.
+
+  Returns:
+    int32 tensor with shape [batch_size, shortlist_size]
+  """
+  with tf.name_scope("vocab_shortlist"):
+    batch_size = tf.shape(bow_logits)[0]
+    vocab_size = tf.shape(bow_logits)[1]
+
+    scores = bow_logits + INF * tf.one_hot(EOS_ID, vocab_size)
+    if inputs is not None:
+      inputs = tf.to_int32(inputs)
+      batch_pos = tf.tile(tf.expand_dims(tf.range(batch_size), 1),
+                          [1, tf.shape(inputs)[1]])
+      indices = tf.reshape(tf.stack([batch_pos, inputs], axis=2), [-1, 2])
+      # Source tokens that appear several times are summed, so only their sign
+      # is kept.
+      in_inputs = tf.scatter_nd(
+          indices, tf.ones([tf.shape(indices)[0]]), [batch_size, vocab_size])
+      scores += INF * tf.sign(in_inputs)
+    scores -= 2 * INF * tf.one_hot(PAD_ID, vocab_size)
+
+    _, shortlist_ids = tf.nn.top_k(scores, k=shortlist_size)
+    return shortlist_ids
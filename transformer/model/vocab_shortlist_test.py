@@ -0,0 +1,71 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Test the vocabulary shortlist."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf  # pylint: disable=g-bad-import-order
+
+from official.transformer.model import embedding_layer
+from official.transformer.model import vocab_shortlist
+from official.transformer.utils.tokenizer import EOS_ID
+
+
+class VocabShortlistTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(VocabShortlistTest, self).setUp()
+    # The padding token has the largest logit, and EOS the smallest.
+    self.bow_logits = tf.constant([[9., -9., 1., 5., 2., 3., 4., 0.]])
+
+  def test_shortlist_ids(self):
+    shortlist_ids = vocab_shortlist.get_shortlist_ids(self.bow_logits, 3)
+    with self.test_session() as sess:
+      shortlist_ids = sess.run(shortlist_ids)
+
+    self.assertAllEqual([[EOS_ID, 3, 6]], shortlist_ids)
+
+  def test_shortlist_source_tokens(self):
+    inputs = tf.constant([[7, 2, 7, 0]])
+    shortlist_ids = vocab_shortlist.get_shortlist_ids(
+        self.bow_logits, 4, inputs=inputs)
+    with self.test_session() as sess:
+      shortlist_ids = sess.run(shortlist_ids)
+
+    self.assertItemsEqual([EOS_ID, 2, 7, 3], shortlist_ids[0])
+
+  def test_shortlist_linear(self):
+    layer = embedding_layer.EmbeddingSharedWeights(8, 4)
+    layer(tf.constant([[1]]))  # Build the shared weights
+    x = tf.random_normal([2, 3, 4], seed=1)
+    shortlist_ids = tf.constant([[1, 5], [6, 2]])
+    logits = layer.linear(x)
+    shortlist_logits = layer.shortlist_linear(x, shortlist_ids)
+    batch_pos = tf.constant([[0, 0], [1, 1]])
+    expected_logits = tf.transpose(tf.gather_nd(
+        tf.transpose(logits, [0, 2, 1]),
+        tf.stack([batch_pos, shortlist_ids], axis=2)), [0, 2, 1])
+    with self.test_session() as sess:
+      sess.run(tf.global_variables_initializer())
+      shortlist_logits, expected_logits = sess.run(
+          (shortlist_logits, expected_logits))
+
+    self.assertAllClose(expected_logits, shortlist_logits)
+
+
+if __name__ == "__main__":
+  tf.test.main()
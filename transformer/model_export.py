@@ -0,0 +1,150 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Export the Transformer model as a SavedModel with named signatures.
+
+Every signature takes the encoded inputs, an int64 tensor with shape
+[batch_size, input_length], as "input". The outputs of the signatures are:
+  serving_default and translate:
+    outputs: decoded ids of the best response to each input.
+    scores: scores of the responses.
+    sample_ids: (if several latent samples are drawn for each input) index of
+      the latent sample of each response.
+  n_best:
+    outputs, scores: the responses of all beams of beam search, from the best to
+      the worst.
+  latent_sample:
+    latent_sample: latent sample(s) drawn for each input.
+  translations:
+    outputs: the best responses decoded into UTF-8 strings in the graph.
+    scores: scores of the responses.
+
+Each signature is also exported with the prefix "text:", e.g. "text:n_best",
+taking a string tensor with shape [batch_size] of raw UTF-8 inputs as "input".
+The inputs are encoded in the graph, so that "text:translations" maps strings to
+strings without a Subtokenizer on the client side.
+
+The export is loaded by saved_model_predictor.SavedModelPredictor, which does
+not depend on the model code.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import copy
+
+import tensorflow as tf
+
+from official.transformer.utils import graph_tokenizer
+from official.transformer.utils import tokenizer
+
+SERVING_SIGNATURE = (
+    tf.saved_model.signature_constants.DEFAULT_SERVING_SIGNATURE_DEF_KEY)
+TRANSLATE_SIGNATURE = "translate"
+N_BEST_SIGNATURE = "n_best"
+LATENT_SAMPLE_SIGNATURE = "latent_sample"
+TRANSLATIONS_SIGNATURE = "translations"
+TEXT_INPUT = "text"
+TEXT_SIGNATURE = "%s:%s" % (TEXT_INPUT, TRANSLATIONS_SIGNATURE)
+
+
+def get_export_outputs(predictions, latent_sample, params):
+  """Return the signatures of the predictions of model_fn.
+
+  Args:
+    predictions: dictionary returned by Transformer.predict.
+    latent_sample: float tensor with shape
+      [batch_size * num_latent_samples, latent_size]
+    params: hyperparameter object of the model. If params["export_vocab_file"]
+      is set, the outputs are also decoded with this subtoken vocabulary.
+
+  Returns:
+    Dictionary mapping signature names to tf.estimator.export.PredictOutput.
+  """
+  outputs = {key: predictions[key] for key in ("outputs", "scores", "sample_ids")
+             if key in predictions}
+  export_outputs = {
+      SERVING_SIGNATURE: tf.estimator.export.PredictOutput(outputs),
+      TRANSLATE_SIGNATURE: tf.estimator.export.PredictOutput(outputs),
+  }
+
+  if "n_best_outputs" in predictions:
+    export_outputs[N_BEST_SIGNATURE] = tf.estimator.export.PredictOutput({
+        "outputs": predictions["n_best_outputs"],
+        "scores": predictions["n_best_scores"]})
+
+  if latent_sample is not None:
+    num_latent_samples = params["num_latent_samples"] or 1
+    if num_latent_samples > 1:
+      latent_sample = tf.reshape(
+          latent_sample, [-1, num_latent_samples, tf.shape(latent_sample)[1]])
+    export_outputs[LATENT_SAMPLE_SIGNATURE] = tf.estimator.export.PredictOutput(
+        {"latent_sample": latent_sample})
+
+  if params["export_vocab_file"]:
+    subtokenizer = tokenizer.Subtokenizer(params["export_vocab_file"])
+    ids = predictions["outputs"]
+    translations = graph_tokenizer.decode(
+        tf.reshape(ids, [-1, tf.shape(ids)[-1]]), subtokenizer)
+    export_outputs[TRANSLATIONS_SIGNATURE] = tf.estimator.export.PredictOutput({
+        "outputs": tf.reshape(translations, tf.shape(ids)[:-1]),
+        "scores": predictions["scores"]})
+  return export_outputs
+
+
+def _build_serving_input_receiver_fn(subtokenizer):
+  """Return a serving input receiver function taking ids or strings."""
+  def serving_input_receiver_fn():
+    text = tf.placeholder(dtype=tf.string, shape=[None], name="input_text")
+    # The encoded text is only computed if the ids are not fed.
+    features = tf.placeholder_with_default(
+        graph_tokenizer.encode(text, subtokenizer), shape=[None, None],
+        name="input_tensor")
+    return tf.estimator.export.TensorServingInputReceiver(
+        features=features, receiver_tensors=features,
+        receiver_tensors_alternatives={TEXT_INPUT: text})
+  return serving_input_receiver_fn
+
+
+def export_saved_model(model_fn, params, model_dir, export_dir, vocab_file,
+                       n_best=True):
+  """Export the latest checkpoint of model_dir as a SavedModel.
+
+  Args:
+    model_fn: Model function of the estimator, e.g. transformer_main.model_fn.
+    params: hyperparameter object passed to model_fn.
+    model_dir: directory containing the model checkpoints.
+    export_dir: directory in which the timestamped SavedModel directory is
+      created.
+    vocab_file: subtoken vocabulary file, used by the text signatures and saved
+      as the extra asset "vocab.txt" to allow consistent input encoding and
+      output decoding.
+    n_best: whether to export the n_best signature.
+
+  Returns:
+    The path of the exported SavedModel directory.
+  """
+  export_params = copy.deepcopy(params)
+  export_params["return_n_best"] = n_best
+  export_params["export_vocab_file"] = vocab_file
+  estimator = tf.estimator.Estimator(
+      model_fn=model_fn, model_dir=model_dir, params=export_params)
+
+  serving_input_fn = _build_serving_input_receiver_fn(
+      tokenizer.Subtokenizer(vocab_file))
+  # Since the model itself does not use the vocab file, this file is saved as
+  # an extra asset rather than a core asset.
+  return estimator.export_savedmodel(
+      export_dir, serving_input_fn, assets_extra={"vocab.txt": vocab_file})
@@ -0,0 +1,301 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Build and search a retrieval index of sentence embeddings.
+
+Generating a response with beam search runs the decoder once per output token
+and beam. For many queries, a response from a corpus is acceptable, and
+retrieving it only runs the source encoder once, followed by a nearest
+neighbour search over precomputed embeddings.
+
+This tool streams the lines of --response_file through the source encoder and
+SentenceEmbeddingLayer of a checkpoint, without the decoder, and writes their
+embeddings to a memory-mapped matrix in --index_dir (see
+utils/embedding_index.py). If --key_file is set, its lines, e.g. the
+utterances the responses reply to, are embedded instead, so that queries are
+matched against them. With --query, the responses nearest to the query are
+printed.
+
+A Retriever answers queries with the interface of a Translator, so that
+server.py can serve an index as the "retrieval" decoding method.
+
+Example:
+  python retrieval_index.py --model_dir=/tmp/transformer_model \
+      --vocab_file=/tmp/data/vocab.txt --response_file=responses.txt \
+      --index_dir=/tmp/index --pq_subspaces=16
+  python retrieval_index.py --model_dir=/tmp/transformer_model \
+      --vocab_file=/tmp/data/vocab.txt --index_dir=/tmp/index \
+      --query="how are you?"
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+# pylint: disable=g-bad-import-order
+from absl import app as absl_app
+from absl import flags
+import numpy as np
+import tensorflow as tf
+# pylint: enable=g-bad-import-order
+
+from official.transformer import translate
+from official.transformer.model import transformer3
+from official.transformer.utils import embedding_index
+from official.transformer.utils import inference_checkpoint
+from official.transformer.utils import tokenizer
+from official.utils.flags import core as flags_core
+
+_BATCH_SIZE = 64
+_TOP_K = 5
+
+
+class SentenceEmbedder(object):
+  """Embeds sentences with the source encoder of a checkpoint."""
+
+  def __init__(self, model_class, params, model_dir, subtokenizer):
+    """Build the embedding graph and restore the latest checkpoint.
+
+    Args:
+      model_class: Transformer class of the checkpoint, e.g.
+        transformer3.Transformer for the models of transformer_main.
+      params: hyperparameter object of the model. Inputs are truncated to
+        params["max_length"] ids.
+      model_dir: directory containing the model checkpoints.
+      subtokenizer: Subtokenizer object for encoding the sentences.
+
+    Raises:
+      ValueError: if there is no checkpoint in model_dir.
+    """
+    self.subtokenizer = subtokenizer
+    self.dim = params["hidden_size"]
+    self.max_length = params["max_length"]
+
+    checkpoint_path = tf.train.latest_checkpoint(model_dir)
+    if checkpoint_path is None:
+      raise ValueError("No checkpoint found in %s." % model_dir)
+
+    self._graph = tf.Graph()
+    with self._graph.as_default():
+      self._inputs = tf.placeholder(tf.int64, [None, None], name="inputs")
+      # Use the variable scope of transformer_main.model_fn, so that the
+      # checkpoint variables are restored.
+      with tf.variable_scope("model"):
+        self._embeddings = model_class(params, False).embed_source(
+            self._inputs)
+      self._session = tf.Session()
+      inference_checkpoint.Saver().restore(self._session, checkpoint_path)
+    self._graph.finalize()
+
+  def embed(self, txts):
+    """Return the float32 embeddings of a list of strings, [len(txts), dim]."""
+    encoded = []
+    for txt in txts:
+      ids = translate._encode_and_add_eos(txt, self.subtokenizer)  # pylint: disable=protected-access
+      if len(ids) > self.max_length:
+        ids = ids[:self.max_length - 1] + [tokenizer.EOS_ID]
+      encoded.append(ids)
+    return self._session.run(self._embeddings, feed_dict={
+        self._inputs: translate._pad_batch(encoded)})  # pylint: disable=protected-access
+
+  def close(self):
+    self._session.close()
+
+
+class Retriever(object):
+  """Answers queries with the nearest responses of an EmbeddingIndex.
+
+  It has the translate and translate_batch methods of a Translator, and may be
+  used from several threads.
+  """
+
+  def __init__(self, embedder, index, num_responses=1, use_pq=True):
+    """Create a retriever.
+
+    Args:
+      embedder: SentenceEmbedder of the model the index was built with.
+      index: EmbeddingIndex.
+      num_responses: number of responses returned for each query.
+      use_pq: whether to search the product quantization codes of the index,
+        if it has them.
+    """
+    self.embedder = embedder
+    self.index = index
+    self.num_responses = num_responses
+    self.use_pq = use_pq
+
+  def warm_up(self):
+    """Answer a dummy query, so that the first queries are not slowed."""
+    self.translate("hello")
+
+  def retrieve(self, txts):
+    """Return the scores and the ids of the nearest responses to each query."""
+    return self.index.search(self.embedder.embed(txts), self.num_responses,
+                             use_pq=self.use_pq)
+
+  def translate(self, txt):
+    return self.translate_batch([txt])[0]
+
+  def translate_batch(self, txts, all_responses=False):
+    """Return the nearest responses of each string.
+
+    Args:
+      txts: list of query strings.
+      all_responses: If true, the translation of each string is the list of its
+        responses, from the nearest. Otherwise, the responses are separated by
+        tabs, as in translate.py.
+
+    Returns:
+      List of translations.
+    """
+    _, ids = self.retrieve(txts)
+    translations = [[self.index.get_response(i) for i in row] for row in ids]
+    if all_responses:
+      return translations
+    return ["\t".join(responses) for responses in translations]
+
+  def shutdown(self):
+    """Close the session of the embedder and the files of the index."""
+    self.embedder.close()
+    self.index.close()
+
+
+def _read_lines(filename):
+  with tf.gfile.Open(filename) as f:
+    for line in f:
+      yield line.strip()
+
+
+def _batches(lines, batch_size):
+  batch = []
+  for line in lines:
+    batch.append(line)
+    if len(batch) == batch_size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+
+def build_index(embedder, response_file, index_dir, key_file=None,
+                batch_size=_BATCH_SIZE, dtype=np.float32, num_pq_subspaces=0):
+  """Embed the lines of a file, and write them to an index directory.
+
+  Args:
+    embedder: SentenceEmbedder.
+    response_file: file of the responses, one per line.
+    index_dir: directory of the index files.
+    key_file: (optional) file whose lines are embedded instead of the
+      responses, with one line per response.
+    batch_size: number of lines embedded together.
+    dtype: numpy dtype of the stored embeddings, float32 or float16.
+    num_pq_subspaces: if positive, the embeddings are also product quantized
+      with this many subspaces.
+  """
+  num_rows = sum(1 for _ in _read_lines(response_file))
+  embedded_file = key_file or response_file
+  embeddings = (embedder.embed(batch) for batch in _batches(
+      _read_lines(embedded_file), batch_size))
+  embedding_index.write_index(
+      index_dir, _read_lines(response_file), embeddings, num_rows,
+      embedder.dim, dtype=dtype, num_pq_subspaces=num_pq_subspaces)
+  tf.logging.info("Indexed %d responses of %s in %s." %
+                  (num_rows, response_file, index_dir))
+
+
+def main(unused_argv):
+  from official.transformer import transformer_main
+
+  tf.logging.set_verbosity(tf.logging.INFO)
+
+  subtokenizer = tokenizer.Subtokenizer(FLAGS.vocab_file)
+  params = transformer_main.PARAMS_MAP[FLAGS.param_set]
+  with tf.gfile.Open(FLAGS.vocab_file) as f:
+    params["vocab_size"] = len(f.readlines())
+  embedder = SentenceEmbedder(
+      transformer3.Transformer, params, FLAGS.model_dir, subtokenizer)
+
+  if FLAGS.response_file is not None:
+    build_index(embedder, FLAGS.response_file, FLAGS.index_dir,
+                key_file=FLAGS.key_file, batch_size=FLAGS.batch_size,
+                dtype=np.dtype(FLAGS.index_dtype),
+                num_pq_subspaces=FLAGS.pq_subspaces)
+
+  if FLAGS.query is not None:
+    index = embedding_index.EmbeddingIndex(FLAGS.index_dir)
+    retriever = Retriever(embedder, index, num_responses=FLAGS.top_k)
+    scores, ids = retriever.retrieve([FLAGS.query])
+    for score, response_id in zip(scores[0], ids[0]):
+      tf.logging.info("%.3f\t%s" % (score, index.get_response(response_id)))
+    index.close()
+  embedder.close()
+
+
+def define_retrieval_index_flags():
+  """Define flags used for the retrieval index script."""
+  flags.DEFINE_string(
+      name="model_dir", short_name="md", default="/tmp/transformer_model",
+      help=flags_core.help_wrap(
+          "Directory containing Transformer model checkpoints."))
+  flags.DEFINE_enum(
+      name="param_set", short_name="mp", default="big",
+      enum_values=["base", "big"],
+      help=flags_core.help_wrap(
+          "Parameter set of the model in --model_dir."))
+  flags.DEFINE_string(
+      name="vocab_file", short_name="vf", default=None,
+      help=flags_core.help_wrap("Path to subtoken vocabulary file."))
+  flags.mark_flag_as_required("vocab_file")
+  flags.DEFINE_string(
+      name="index_dir", default=None,
+      help=flags_core.help_wrap("Directory of the index files."))
+  flags.mark_flag_as_required("index_dir")
+  flags.DEFINE_string(
+      name="response_file", default=None,
+      help=flags_core.help_wrap(
+          "If set, the responses of this file, one per line, are embedded and "
+          "written to --index_dir."))
+  flags.DEFINE_string(
+      name="key_file", default=None,
+      help=flags_core.help_wrap(
+          "If set, the lines of this file, e.g. the utterances that the lines "
+          "of --response_file reply to, are embedded instead of the "
+          "responses."))
+  flags.DEFINE_enum(
+      name="index_dtype", default="float32", enum_values=["float32", "float16"],
+      help=flags_core.help_wrap(
+          "Type of the stored embeddings. float16 halves the size of the "
+          "index."))
+  flags.DEFINE_integer(
+      name="pq_subspaces", default=0,
+      help=flags_core.help_wrap(
+          "If positive, the embeddings are also product quantized with this "
+          "many subspaces, which must divide the hidden size. Each embedding "
+          "is then searched as one byte per subspace."))
+  flags.DEFINE_integer(
+      name="batch_size", default=_BATCH_SIZE,
+      help=flags_core.help_wrap("Number of lines embedded together."))
+  flags.DEFINE_string(
+      name="query", default=None,
+      help=flags_core.help_wrap(
+          "If set, the --top_k responses nearest to this text are printed."))
+  flags.DEFINE_integer(
+      name="top_k", default=_TOP_K,
+      help=flags_core.help_wrap("Number of responses printed for --query."))
+
+
+if __name__ == "__main__":
+  define_retrieval_index_flags()
+  FLAGS = flags.FLAGS
+  absl_app.run(main)
@@ -0,0 +1,70 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Test answering queries with the responses of an embedding index."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import numpy as np
+import tensorflow as tf  # pylint: disable=g-bad-import-order
+
+from official.transformer import retrieval_index
+from official.transformer.utils import embedding_index
+
+
+class _OneHotEmbedder(object):
+  """Embedder of the words "a", "b" and "c" as one-hot vectors."""
+
+  dim = 3
+
+  def embed(self, txts):
+    return np.array([[float(word in txt.split()) for word in ("a", "b", "c")]
+                     for txt in txts], dtype=np.float32)
+
+
+class RetrieverTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(RetrieverTest, self).setUp()
+    temp_dir = self.get_temp_dir()
+    # Responses to the utterances of the key file.
+    self.response_file = os.path.join(temp_dir, "responses")
+    self.key_file = os.path.join(temp_dir, "keys")
+    with tf.gfile.Open(self.response_file, "w") as f:
+      f.write("to a\nto b\nto a c\n")
+    with tf.gfile.Open(self.key_file, "w") as f:
+      f.write("a\nb\na c\n")
+    self.index_dir = os.path.join(temp_dir, "index")
+
+  def test_translate_batch(self):
+    retrieval_index.build_index(
+        _OneHotEmbedder(), self.response_file, self.index_dir,
+        key_file=self.key_file, batch_size=2)
+    index = embedding_index.EmbeddingIndex(self.index_dir)
+    retriever = retrieval_index.Retriever(
+        _OneHotEmbedder(), index, num_responses=2)
+
+    self.assertEqual([["to a", "to a c"], ["to a c", "to a"]],
+                     retriever.translate_batch(["a", "c a"],
+                                               all_responses=True))
+    self.assertEqual("to a\tto a c", retriever.translate("a"))
+    index.close()
+
+
+if __name__ == "__main__":
+  tf.test.main()
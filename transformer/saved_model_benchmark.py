@@ -0,0 +1,158 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Compare the latency of SavedModelPredictor and of the estimator on CPU.
+
+The lines of --file are translated in batches of --batch_size lines, first by
+the SavedModel of --export_dir run with SavedModelPredictor, then by the
+estimator as in translate.py, which builds the graph and restores the
+checkpoint of --model_dir each time it translates. The cold start (loading the
+model and translating the first batch) and the per-batch latency are logged.
+
+Example:
+  python saved_model_benchmark.py --export_dir=/tmp/export/1538000000 \
+      --model_dir=/tmp/transformer_model --vocab_file=/tmp/data/vocab.txt \
+      --file=/tmp/data/dev.src
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+# pylint: disable=g-bad-import-order
+from absl import app as absl_app
+from absl import flags
+import numpy as np
+import tensorflow as tf
+# pylint: enable=g-bad-import-order
+
+from official.transformer import saved_model_predictor
+from official.transformer import translate
+from official.transformer.utils import tokenizer
+from official.utils.flags import core as flags_core
+
+
+def _read_batches(filename, subtokenizer, batch_size, num_batches):
+  """Return padded batches of the encoded lines of a file."""
+  with tf.gfile.Open(filename) as f:
+    lines = [line.strip() for line in f][:batch_size * num_batches]
+  encoded = [translate._encode_and_add_eos(line, subtokenizer)  # pylint: disable=protected-access
+             for line in lines]
+  return [saved_model_predictor.pad_inputs(encoded[i:i + batch_size])
+          for i in range(0, len(encoded), batch_size)]
+
+
+def _log_latencies(name, cold_start, latencies):
+  tf.logging.info(
+      "%s: cold start %.3f s, batch latency mean %.3f s, median %.3f s, "
+      "max %.3f s over %d batches." % (
+          name, cold_start, np.mean(latencies), np.median(latencies),
+          np.max(latencies), len(latencies)))
+
+
+def benchmark_saved_model(export_dir, batches):
+  """Return the cold start and the per-batch latencies of the SavedModel."""
+  config = tf.ConfigProto(device_count={"GPU": 0})
+  start = time.time()
+  predictor = saved_model_predictor.SavedModelPredictor(export_dir, config)
+  predictor.predict(batches[0])
+  cold_start = time.time() - start
+
+  latencies = []
+  for batch in batches:
+    start = time.time()
+    predictor.predict(batch)
+    latencies.append(time.time() - start)
+  predictor.close()
+  return cold_start, latencies
+
+
+def benchmark_estimator(estimator, batches):
+  """Return the cold start and the per-batch latencies of the estimator."""
+  latencies = []
+  for batch in batches:
+    def input_fn(batch=batch):
+      return tf.data.Dataset.from_tensors(batch)
+
+    start = time.time()
+    for _ in estimator.predict(input_fn):
+      pass
+    latencies.append(time.time() - start)
+  # The estimator has no persistent state, so every batch is a cold start.
+  return latencies[0], latencies[1:] or latencies
+
+
+def main(unused_argv):
+  from official.transformer import transformer_main
+
+  tf.logging.set_verbosity(tf.logging.INFO)
+
+  subtokenizer = tokenizer.Subtokenizer(FLAGS.vocab_file)
+  batches = _read_batches(
+      FLAGS.file, subtokenizer, FLAGS.batch_size, FLAGS.num_batches)
+
+  cold_start, latencies = benchmark_saved_model(FLAGS.export_dir, batches)
+  _log_latencies("SavedModelPredictor", cold_start, latencies)
+
+  if FLAGS.model_dir is not None:
+    params = transformer_main.PARAMS_MAP[FLAGS.param_set]
+    with tf.gfile.Open(FLAGS.vocab_file) as f:
+      params["vocab_size"] = len(f.readlines())
+    estimator = tf.estimator.Estimator(
+        model_fn=transformer_main.model_fn, model_dir=FLAGS.model_dir,
+        params=params, config=tf.estimator.RunConfig(
+            session_config=tf.ConfigProto(device_count={"GPU": 0})))
+    cold_start, latencies = benchmark_estimator(estimator, batches)
+    _log_latencies("Estimator", cold_start, latencies)
+
+
+def define_benchmark_flags():
+  """Define flags used for the benchmark script."""
+  flags.DEFINE_string(
+      name="export_dir", default=None,
+      help=flags_core.help_wrap(
+          "Directory of the SavedModel exported by transformer_main.py."))
+  flags.mark_flag_as_required("export_dir")
+  flags.DEFINE_string(
+      name="model_dir", short_name="md", default=None,
+      help=flags_core.help_wrap(
+          "Directory containing Transformer model checkpoints. If set, the "
+          "estimator is benchmarked as well."))
+  flags.DEFINE_enum(
+      name="param_set", short_name="mp", default="big",
+      enum_values=["base", "big"],
+      help=flags_core.help_wrap(
+          "Parameter set of the model in --model_dir."))
+  flags.DEFINE_string(
+      name="vocab_file", short_name="vf", default=None,
+      help=flags_core.help_wrap("Path to subtoken vocabulary file."))
+  flags.mark_flag_as_required("vocab_file")
+  flags.DEFINE_string(
+      name="file", default=None,
+      help=flags_core.help_wrap("File containing the lines to translate."))
+  flags.mark_flag_as_required("file")
+  flags.DEFINE_integer(
+      name="batch_size", default=32,
+      help=flags_core.help_wrap("Number of lines translated together."))
+  flags.DEFINE_integer(
+      name="num_batches", default=20,
+      help=flags_core.help_wrap("Number of batches translated."))
+
+
+if __name__ == "__main__":
+  define_benchmark_flags()
+  FLAGS = flags.FLAGS
+  absl_app.run(main)
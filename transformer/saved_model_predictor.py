@@ -0,0 +1,111 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Run a SavedModel exported by model_export with a plain session.
+
+This module only depends on TensorFlow and numpy, so that the exported model can
+be served without the model code or the estimator.
+
+Example:
+  predictor = SavedModelPredictor(export_dir)
+  predictions = predictor.predict([[25, 8, 1], [76, 1]])
+  predictions["outputs"]  # Decoded ids of the best response to each input.
+
+  predictions = predictor.predict(["how are you?"], "text:translations")
+  predictions["outputs"]  # UTF-8 string of the best response to each input.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import numpy as np
+import tensorflow as tf
+
+_PAD_ID = 0
+_SERVING_SIGNATURE = (
+    tf.saved_model.signature_constants.DEFAULT_SERVING_SIGNATURE_DEF_KEY)
+
+
+def pad_inputs(inputs):
+  """Pad a list of encoded inputs with 0s to an int64 array."""
+  padded_inputs = np.full([len(inputs), max(len(ids) for ids in inputs)],
+                          _PAD_ID, dtype=np.int64)
+  for i, ids in enumerate(inputs):
+    padded_inputs[i, :len(ids)] = ids
+  return padded_inputs
+
+
+class SavedModelPredictor(object):
+  """Loads a SavedModel once and runs its signatures."""
+
+  def __init__(self, export_dir, config=None):
+    """Load the SavedModel into a new session.
+
+    Args:
+      export_dir: directory of the SavedModel.
+      config: (optional) tf.ConfigProto of the session.
+    """
+    self.export_dir = export_dir
+    self._graph = tf.Graph()
+    self._session = tf.Session(graph=self._graph, config=config)
+    meta_graph_def = tf.saved_model.loader.load(
+        self._session, [tf.saved_model.tag_constants.SERVING], export_dir)
+    self._graph.finalize()
+
+    self._signatures = {}
+    for name, signature_def in meta_graph_def.signature_def.items():
+      self._signatures[name] = (
+          {key: self._graph.get_tensor_by_name(tensor_info.name)
+           for key, tensor_info in signature_def.inputs.items()},
+          {key: self._graph.get_tensor_by_name(tensor_info.name)
+           for key, tensor_info in signature_def.outputs.items()})
+
+  @property
+  def signatures(self):
+    """Names of the signatures of the SavedModel."""
+    return sorted(self._signatures)
+
+  @property
+  def vocab_file(self):
+    """Path of the subtoken vocabulary saved with the model."""
+    return os.path.join(self.export_dir, "assets.extra", "vocab.txt")
+
+  def predict(self, inputs, signature=_SERVING_SIGNATURE):
+    """Run a signature of the SavedModel.
+
+    Args:
+      inputs: encoded inputs, either a list of lists of ids ending with EOS, or
+        a padded int64 array with shape [batch_size, input_length]. The inputs
+        of signatures taking strings are a list of UTF-8 strings.
+      signature: name of the signature to run.
+
+    Returns:
+      Dictionary mapping the output names of the signature to numpy arrays.
+
+    Raises:
+      ValueError: if the SavedModel has no such signature.
+    """
+    if signature not in self._signatures:
+      raise ValueError("Signature %s not in %s." % (signature, self.signatures))
+    input_tensors, output_tensors = self._signatures[signature]
+    input_tensor, = input_tensors.values()
+    if input_tensor.dtype != tf.string and not isinstance(inputs, np.ndarray):
+      inputs = pad_inputs(inputs)
+    return self._session.run(output_tensors, feed_dict={input_tensor: inputs})
+
+  def close(self):
+    self._session.close()
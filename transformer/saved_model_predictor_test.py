@@ -0,0 +1,114 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Test exporting a model and running it with SavedModelPredictor."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import tensorflow as tf  # pylint: disable=g-bad-import-order
+
+from official.transformer import model_export
+from official.transformer import saved_model_predictor
+from official.transformer.model import model_params
+
+
+def _echo_model_fn(features, labels, mode, params):
+  """Model function whose outputs are its inputs, in two beams."""
+  del labels  # Unused
+  offset = tf.get_variable("offset", [], tf.int64,
+                           initializer=tf.zeros_initializer())
+  outputs = features + offset
+  predictions = {"outputs": outputs,
+                 "scores": tf.zeros([tf.shape(outputs)[0]])}
+  if params["return_n_best"]:
+    predictions["n_best_outputs"] = tf.stack([outputs, outputs + 1], axis=1)
+    predictions["n_best_scores"] = tf.zeros([tf.shape(outputs)[0], 2])
+  latent_sample = tf.to_float(outputs[:, :1])
+  return tf.estimator.EstimatorSpec(
+      mode, predictions=predictions,
+      export_outputs=model_export.get_export_outputs(
+          predictions, latent_sample, params))
+
+
+class SavedModelPredictorTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(SavedModelPredictorTest, self).setUp()
+    temp_dir = self.get_temp_dir()
+    model_dir = os.path.join(temp_dir, "model")
+    with tf.Graph().as_default():
+      tf.train.get_or_create_global_step()
+      _echo_model_fn(tf.zeros([1, 1], tf.int64), None,
+                     tf.estimator.ModeKeys.PREDICT,
+                     model_params.BASE_PARAMS)
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        tf.train.Saver().save(sess, os.path.join(model_dir, "model.ckpt"))
+
+    vocab_file = os.path.join(temp_dir, "vocab")
+    with tf.gfile.Open(vocab_file, "w") as f:
+      for subtoken in ["hello_", "how_", "are_", "you_"]:
+        f.write("'%s'\n" % subtoken)
+    export_dir = model_export.export_saved_model(
+        _echo_model_fn, model_params.BASE_PARAMS, model_dir,
+        os.path.join(temp_dir, "export"), vocab_file)
+    self.predictor = saved_model_predictor.SavedModelPredictor(export_dir)
+
+  def tearDown(self):
+    self.predictor.close()
+    super(SavedModelPredictorTest, self).tearDown()
+
+  def test_signatures(self):
+    signatures = ["latent_sample", "n_best", "serving_default", "translate",
+                  "translations"]
+    self.assertEqual(
+        sorted(signatures + ["text:" + s for s in signatures]),
+        self.predictor.signatures)
+    self.assertTrue(tf.gfile.Exists(self.predictor.vocab_file))
+
+  def test_predict(self):
+    predictions = self.predictor.predict([[4, 5, 1], [6, 1]])
+
+    self.assertEqual(set(["outputs", "scores"]), set(predictions))
+    self.assertAllEqual([[4, 5, 1], [6, 1, 0]], predictions["outputs"])
+
+  def test_predict_n_best(self):
+    predictions = self.predictor.predict([[4, 1]], model_export.N_BEST_SIGNATURE)
+
+    self.assertAllEqual([[[4, 1], [5, 2]]], predictions["outputs"])
+    self.assertEqual((1, 2), predictions["scores"].shape)
+
+  def test_predict_text(self):
+    predictions = self.predictor.predict(
+        ["how are you", "hello"], model_export.TEXT_SIGNATURE)
+
+    self.assertAllEqual([b"how are you", b"hello"], predictions["outputs"])
+
+  def test_predict_translations(self):
+    predictions = self.predictor.predict(
+        [[3, 4, 5, 1], [2, 1]], model_export.TRANSLATIONS_SIGNATURE)
+
+    self.assertAllEqual([b"how are you", b"hello"], predictions["outputs"])
+
+  def test_unknown_signature(self):
+    with self.assertRaises(ValueError):
+      self.predictor.predict([[4, 1]], "beam")
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -0,0 +1,550 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Serve the Transformer model over HTTP, with asyncio.
+
+Responses are generated for JSON requests posted to /generate:
+  {"text": "how are you?", "num_responses": 2, "decoding_method": "top_k"}
+The server replies with:
+  {"responses": ["i am fine.", "good, thanks."]}
+"num_responses" (at most --max_num_responses) and "decoding_method" (one of
+--decoding_methods) are optional. GET /health replies {"status": "ok"}.
+
+Concurrent requests with the same decoding method are coalesced into batches. A
+batch is translated as soon as it is full, or when its oldest request could not
+meet the latency SLO if it waited longer, given the recent translation time of
+a batch. Batches are translated by a Translator in an executor thread, so that
+the event loop never blocks.
+
+With --continuous_batching, the greedy, top_k and nucleus decoding methods use a
+DecodingEngine instead, which starts decoding each request as soon as one of
+its slots is free, rather than after the previous batch. It also caches the
+encoder states of recent inputs (--encoder_cache_size).
+
+With --retrieval_index_dir, requests may also use the "retrieval" decoding
+method, which returns the nearest responses of an index built by
+retrieval_index.py instead of generating responses.
+
+This module requires Python 3.
+
+Example:
+  python server.py --model_dir=/tmp/transformer_model \
+      --vocab_file=/tmp/data/vocab.txt --port=8080
+  curl -d '{"text": "how are you?"}' localhost:8080/generate
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import asyncio
+import collections
+import concurrent.futures
+import copy
+import http
+import json
+
+# pylint: disable=g-bad-import-order
+from absl import app as absl_app
+from absl import flags
+import tensorflow as tf
+# pylint: enable=g-bad-import-order
+
+from official.transformer import decoding_engine
+from official.transformer import retrieval_index
+from official.transformer import translate
+from official.transformer import translator
+from official.transformer.model import sampling
+from official.transformer.model import transformer3
+from official.transformer.utils import embedding_index
+from official.transformer.utils import encoder_cache
+from official.transformer.utils import tokenizer
+from official.utils.flags import core as flags_core
+
+GENERATE_PATH = "/generate"
+HEALTH_PATH = "/health"
+
+_MAX_BATCH_SIZE = 32
+_LATENCY_SLO_SECS = 0.2
+_MAX_BODY_BYTES = 1 << 20
+# Weight of the last batch in the moving average of the translation time.
+_BATCH_SECS_DECAY = 0.1
+
+
+class HTTPError(Exception):
+  """Error replied to a request, with its HTTP status code."""
+
+  def __init__(self, status, message):
+    super(HTTPError, self).__init__(message)
+    self.status = status
+
+
+class RequestCoalescer(object):
+  """Coalesces concurrent requests into batches under a latency SLO."""
+
+  def __init__(self, translate_batch_fn, executor, max_batch_size,
+               latency_slo_secs):
+    """Create a coalescer. Must be called in the event loop.
+
+    Args:
+      translate_batch_fn: function translating a list of strings, and returning
+        the list of responses to each string.
+      executor: executor running translate_batch_fn.
+      max_batch_size: maximum number of strings translated together.
+      latency_slo_secs: target latency of a request, including the time waited
+        for other requests and the translation time.
+    """
+    self.translate_batch_fn = translate_batch_fn
+    self.max_batch_size = max_batch_size
+    self.latency_slo_secs = latency_slo_secs
+    self.batch_sizes = []
+
+    self._executor = executor
+    self._loop = asyncio.get_event_loop()
+    # Pending requests, as (arrival time, string, future of the responses).
+    self._pending = collections.deque()
+    self._has_pending = asyncio.Event()
+    self._batch_secs = None  # Moving average of the translation time.
+    self._task = asyncio.ensure_future(self._run())
+
+  async def translate(self, txt):
+    """Return the list of responses to a string."""
+    future = self._loop.create_future()
+    self._pending.append((self._loop.time(), txt, future))
+    self._has_pending.set()
+    return await future
+
+  async def stop(self):
+    self._task.cancel()
+    try:
+      await self._task
+    except asyncio.CancelledError:
+      pass
+    for _, _, future in self._pending:
+      future.cancel()
+
+  async def _run(self):
+    """Translate batches of pending requests until stopped."""
+    while True:
+      await self._has_pending.wait()
+
+      # Wait for more requests while the oldest one can still meet the SLO.
+      deadline = self._pending[0][0] + max(
+          0., self.latency_slo_secs - (self._batch_secs or 0.))
+      while len(self._pending) < self.max_batch_size:
+        timeout = deadline - self._loop.time()
+        if timeout <= 0:
+          break
+        self._has_pending.clear()
+        try:
+          await asyncio.wait_for(self._has_pending.wait(), timeout)
+        except asyncio.TimeoutError:
+          break
+
+      batch = [self._pending.popleft() for _ in range(
+          min(len(self._pending), self.max_batch_size))]
+      if self._pending:
+        self._has_pending.set()
+      else:
+        self._has_pending.clear()
+      # Requests of disconnected clients are cancelled.
+      batch = [request for request in batch if not request[2].done()]
+      if batch:
+        await self._translate(batch)
+
+  async def _translate(self, batch):
+    """Translate a batch of requests in the executor, and set their results."""
+    start = self._loop.time()
+    try:
+      translations = await self._loop.run_in_executor(
+          self._executor, self.translate_batch_fn, [txt for _, txt, _ in batch])
+    except Exception as e:  # pylint: disable=broad-except
+      for _, _, future in batch:
+        if not future.done():
+          future.set_exception(e)
+      return
+
+    batch_secs = self._loop.time() - start
+    if self._batch_secs is None:
+      self._batch_secs = batch_secs
+    else:
+      self._batch_secs += _BATCH_SECS_DECAY * (batch_secs - self._batch_secs)
+    self.batch_sizes.append(len(batch))
+
+    for (_, _, future), responses in zip(batch, translations):
+      if not future.done():
+        future.set_result(responses)
+
+
+class EngineSubmitter(object):
+  """Submits each request to a continuous batching engine once received.
+
+  The engine batches the requests itself, between its decoding steps (see
+  decoding_engine.py), so requests are not coalesced.
+  """
+
+  def __init__(self, engine):
+    """Create a submitter. Must be called in the event loop."""
+    self.engine = engine
+    self._loop = asyncio.get_event_loop()
+
+  async def translate(self, txt):
+    """Return the list of responses to a string."""
+    future = self._loop.create_future()
+
+    def set_result(responses, error):
+      if future.done():  # The client disconnected.
+        return
+      if error is not None:
+        future.set_exception(error)
+      else:
+        future.set_result(responses)
+
+    def callback(responses, error):
+      # Called by the worker thread of the engine.
+      self._loop.call_soon_threadsafe(set_result, responses, error)
+
+    self.engine.submit(txt, callback)
+    return await future
+
+  async def stop(self):
+    pass
+
+
+class GenerationServer(object):
+  """HTTP server generating responses with Translators or DecodingEngines."""
+
+  def __init__(self, translators, default_decoding_method=None,
+               max_num_responses=1, max_batch_size=_MAX_BATCH_SIZE,
+               latency_slo_secs=_LATENCY_SLO_SECS):
+    """Create the server.
+
+    Args:
+      translators: dictionary mapping decoding methods to Translators or
+        DecodingEngines, whose models generate max_num_responses responses to
+        each input.
+      default_decoding_method: decoding method of requests that do not specify
+        one. Defaults to beam_search, or to the only decoding method.
+      max_num_responses: maximum number of responses of a request.
+      max_batch_size: maximum number of requests translated together.
+      latency_slo_secs: target latency of a request.
+    """
+    self.translators = translators
+    if default_decoding_method is None and len(translators) == 1:
+      default_decoding_method, = translators
+    self.default_decoding_method = default_decoding_method or "beam_search"
+    self.max_num_responses = max_num_responses
+    self.max_batch_size = max_batch_size
+    self.latency_slo_secs = latency_slo_secs
+
+    self.coalescers = None
+    self._executor = None
+    self._server = None
+
+  async def start(self, host="localhost", port=0):
+    """Start serving, and return the address of the server."""
+    # Each Translator translates one batch at a time.
+    self._executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=len(self.translators))
+    self.coalescers = {}
+    for decoding_method, t in self.translators.items():
+      if getattr(t, "continuous_batching", False):
+        self.coalescers[decoding_method] = EngineSubmitter(t)
+      else:
+        self.coalescers[decoding_method] = RequestCoalescer(
+            lambda txts, t=t: t.translate_batch(txts, all_responses=True),
+            self._executor, self.max_batch_size, self.latency_slo_secs)
+    self._server = await asyncio.start_server(
+        self._handle_connection, host, port)
+    return self._server.sockets[0].getsockname()[:2]
+
+  async def close(self):
+    """Stop accepting connections, and cancel the pending requests."""
+    self._server.close()
+    await self._server.wait_closed()
+    for coalescer in self.coalescers.values():
+      await coalescer.stop()
+    self._executor.shutdown()
+
+  async def _handle_connection(self, reader, writer):
+    """Reply to the requests of a connection until it is closed."""
+    try:
+      while True:
+        try:
+          request = await _read_request(reader)
+          if request is None:
+            break
+          method, path, headers, body = request
+          keep_alive = headers.get("connection", "").lower() != "close"
+          status, payload = await self._reply(method, path, body)
+        except HTTPError as e:
+          keep_alive = False
+          status, payload = e.status, {"error": str(e)}
+        _write_response(writer, status, payload, keep_alive)
+        await writer.drain()
+        if not keep_alive:
+          break
+    except (ConnectionError, asyncio.IncompleteReadError):
+      pass
+    finally:
+      writer.close()
+
+  async def _reply(self, method, path, body):
+    """Return the status code and the JSON payload replied to a request."""
+    if path == HEALTH_PATH:
+      return http.HTTPStatus.OK, {"status": "ok"}
+    if path != GENERATE_PATH:
+      return http.HTTPStatus.NOT_FOUND, {"error": "Unknown path %s." % path}
+    if method != "POST":
+      return (http.HTTPStatus.METHOD_NOT_ALLOWED,
+              {"error": "%s only accepts POST requests." % path})
+
+    try:
+      text, num_responses, decoding_method = self._parse_request(body)
+    except HTTPError as e:
+      return e.status, {"error": str(e)}
+    try:
+      responses = await self.coalescers[decoding_method].translate(text)
+    except Exception as e:  # pylint: disable=broad-except
+      tf.logging.error("Failed to translate \"%s\": %s" % (text, e))
+      return http.HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+    return http.HTTPStatus.OK, {"responses": responses[:num_responses]}
+
+  def _parse_request(self, body):
+    """Return the text, number of responses and decoding method of a request.
+
+    Raises:
+      HTTPError: if the request is invalid.
+    """
+    try:
+      request = json.loads(body.decode("utf-8"))
+    except ValueError:
+      raise HTTPError(http.HTTPStatus.BAD_REQUEST, "Invalid JSON request.")
+    if not isinstance(request, dict) or not isinstance(request.get("text"), str):
+      raise HTTPError(http.HTTPStatus.BAD_REQUEST,
+                      "The request must have a \"text\" string.")
+
+    num_responses = request.get("num_responses", 1)
+    if (not isinstance(num_responses, int) or
+        not 1 <= num_responses <= self.max_num_responses):
+      raise HTTPError(
+          http.HTTPStatus.BAD_REQUEST,
+          "num_responses must be between 1 and %d." % self.max_num_responses)
+
+    decoding_method = request.get(
+        "decoding_method", self.default_decoding_method)
+    if decoding_method not in self.coalescers:
+      raise HTTPError(
+          http.HTTPStatus.BAD_REQUEST, "decoding_method must be one of %s." %
+          ", ".join(sorted(self.coalescers)))
+    return request["text"], num_responses, decoding_method
+
+
+async def _read_request(reader):
+  """Read an HTTP request.
+
+  Returns:
+    The method, path, headers (with lowercase names) and body of the request,
+    or None if the connection was closed.
+
+  Raises:
+    HTTPError: if the request is malformed or too large.
+  """
+  request_line = await reader.readline()
+  if not request_line:
+    return None
+  try:
+    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+  except ValueError:
+    raise HTTPError(http.HTTPStatus.BAD_REQUEST, "Malformed request line.")
+
+  headers = {}
+  while True:
+    line = await reader.readline()
+    if line in (b"\r\n", b"\n", b""):
+      break
+    name, _, value = line.decode("latin-1").partition(":")
+    headers[name.strip().lower()] = value.strip()
+
+  try:
+    content_length = int(headers.get("content-length", 0))
+  except ValueError:
+    raise HTTPError(http.HTTPStatus.BAD_REQUEST, "Invalid Content-Length.")
+  if content_length > _MAX_BODY_BYTES:
+    raise HTTPError(http.HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                    "Requests are limited to %d bytes." % _MAX_BODY_BYTES)
+  body = await reader.readexactly(content_length)
+  return method, path.split("?", 1)[0], headers, body
+
+
+def _write_response(writer, status, payload, keep_alive):
+  """Write an HTTP response with a JSON payload."""
+  status = http.HTTPStatus(status)
+  body = json.dumps(payload).encode("utf-8")
+  writer.write((
+      "HTTP/1.1 %d %s\r\n"
+      "Content-Type: application/json\r\n"
+      "Content-Length: %d\r\n"
+      "Connection: %s\r\n\r\n" % (
+          status.value, status.phrase, len(body),
+          "keep-alive" if keep_alive else "close")).encode("latin-1"))
+  writer.write(body)
+
+
+def shutdown_translators(translators):
+  """Shut down every translator, even if some of them fail to."""
+  for decoding_method, t in sorted(translators.items()):
+    try:
+      t.shutdown()
+    except Exception as e:  # pylint: disable=broad-except
+      tf.logging.error("Failed to shut down the %s translator: %s" %
+                       (decoding_method, e))
+
+
+def main(unused_argv):
+  from official.transformer import transformer_main
+
+  tf.logging.set_verbosity(tf.logging.INFO)
+
+  subtokenizer = tokenizer.Subtokenizer(FLAGS.vocab_file)
+  with tf.gfile.Open(FLAGS.vocab_file) as f:
+    vocab_size = len(f.readlines())
+
+  # Each decoding method is a different prediction graph.
+  translators = {}
+  for decoding_method in FLAGS.decoding_methods:
+    params = copy.deepcopy(transformer_main.PARAMS_MAP[FLAGS.param_set])
+    params["beam_size"] = translate._BEAM_SIZE  # pylint: disable=protected-access
+    params["alpha"] = translate._ALPHA  # pylint: disable=protected-access
+    params["extra_decode_length"] = translate._EXTRA_DECODE_LENGTH  # pylint: disable=protected-access
+    params["num_latent_samples"] = FLAGS.max_num_responses
+    params["decoding_method"] = decoding_method
+    params["sampling_top_k"] = FLAGS.sampling_top_k
+    params["sampling_top_p"] = FLAGS.sampling_top_p
+    params["vocab_size"] = vocab_size
+    if (FLAGS.continuous_batching and
+        decoding_method in sampling.SAMPLING_METHODS):
+      translators[decoding_method] = decoding_engine.DecodingEngine(
+          transformer3.Transformer, params, FLAGS.model_dir, subtokenizer,
+          num_slots=FLAGS.max_batch_size * FLAGS.max_num_responses,
+          encoder_cache_size=FLAGS.encoder_cache_size)
+    else:
+      translators[decoding_method] = translator.Translator(
+          transformer_main.model_fn, params, FLAGS.model_dir, subtokenizer,
+          max_batch_size=FLAGS.max_batch_size, max_wait_secs=0)
+    translators[decoding_method].warm_up()
+
+  if FLAGS.retrieval_index_dir is not None:
+    params = copy.deepcopy(transformer_main.PARAMS_MAP[FLAGS.param_set])
+    params["vocab_size"] = vocab_size
+    translators["retrieval"] = retrieval_index.Retriever(
+        retrieval_index.SentenceEmbedder(
+            transformer3.Transformer, params, FLAGS.model_dir, subtokenizer),
+        embedding_index.EmbeddingIndex(FLAGS.retrieval_index_dir),
+        num_responses=FLAGS.max_num_responses)
+    translators["retrieval"].warm_up()
+
+  server = GenerationServer(
+      translators, default_decoding_method=FLAGS.decoding_methods[0],
+      max_num_responses=FLAGS.max_num_responses,
+      max_batch_size=FLAGS.max_batch_size,
+      latency_slo_secs=FLAGS.latency_slo_ms / 1000.)
+  loop = asyncio.get_event_loop()
+  host, port = loop.run_until_complete(server.start(FLAGS.host, FLAGS.port))
+  tf.logging.info("Serving on http://%s:%d%s" % (host, port, GENERATE_PATH))
+  try:
+    loop.run_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    loop.run_until_complete(server.close())
+    shutdown_translators(translators)
+
+
+def define_server_flags():
+  """Define flags used for the server."""
+  flags.DEFINE_string(
+      name="model_dir", short_name="md", default="/tmp/transformer_model",
+      help=flags_core.help_wrap(
+          "Directory containing Transformer model checkpoints."))
+  flags.DEFINE_enum(
+      name="param_set", short_name="mp", default="big",
+      enum_values=["base", "big"],
+      help=flags_core.help_wrap(
+          "Parameter set of the model. For a complete list of parameters, "
+          "please see model/model_params.py."))
+  flags.DEFINE_string(
+      name="vocab_file", short_name="vf", default=None,
+      help=flags_core.help_wrap("Path to subtoken vocabulary file."))
+  flags.mark_flag_as_required("vocab_file")
+  flags.DEFINE_string(
+      name="host", default="localhost",
+      help=flags_core.help_wrap("Host name or address to listen on."))
+  flags.DEFINE_integer(
+      name="port", default=8080,
+      help=flags_core.help_wrap("Port to listen on."))
+  flags.DEFINE_list(
+      name="decoding_methods", default=["beam_search"],
+      help=flags_core.help_wrap(
+          "Decoding methods that requests can choose, among beam_search, "
+          "greedy, top_k and nucleus. The first one is the default. The "
+          "model is loaded once for each decoding method."))
+  flags.DEFINE_integer(
+      name="max_num_responses", default=1,
+      help=flags_core.help_wrap(
+          "Maximum number of responses of a request. The model draws this "
+          "many latent samples for every request."))
+  flags.DEFINE_integer(
+      name="sampling_top_k", default=40,
+      help=flags_core.help_wrap(
+          "Number of most probable tokens sampled from with top_k decoding."))
+  flags.DEFINE_float(
+      name="sampling_top_p", default=0.9,
+      help=flags_core.help_wrap(
+          "Probability mass sampled from with nucleus decoding."))
+  flags.DEFINE_integer(
+      name="max_batch_size", default=_MAX_BATCH_SIZE,
+      help=flags_core.help_wrap(
+          "Maximum number of requests translated together."))
+  flags.DEFINE_bool(
+      name="continuous_batching", default=False,
+      help=flags_core.help_wrap(
+          "If set, the greedy, top_k and nucleus decoding methods decode "
+          "requests in max_batch_size * max_num_responses slots, which are "
+          "refilled with new requests between decoding steps. Beam search "
+          "requests are still batched."))
+  flags.DEFINE_integer(
+      name="encoder_cache_size", default=encoder_cache.MAX_ENTRIES,
+      help=flags_core.help_wrap(
+          "With --continuous_batching, number of encoder states of recent "
+          "inputs kept in memory, so that inputs sent again are not encoded "
+          "again. 0 disables the cache."))
+  flags.DEFINE_string(
+      name="retrieval_index_dir", default=None,
+      help=flags_core.help_wrap(
+          "If set, requests may use the \"retrieval\" decoding method, which "
+          "returns the nearest responses of this index, built by "
+          "retrieval_index.py with the same model."))
+  flags.DEFINE_float(
+      name="latency_slo_ms", default=_LATENCY_SLO_SECS * 1000,
+      help=flags_core.help_wrap(
+          "Target latency of a request in milliseconds. Requests wait for "
+          "other requests to be batched with as long as the translation of "
+          "the batch is expected to finish within this time."))
+
+
+if __name__ == "__main__":
+  define_server_flags()
+  FLAGS = flags.FLAGS
+  absl_app.run(main)
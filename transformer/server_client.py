@@ -0,0 +1,106 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Asyncio client of the generation server in server.py.
+
+This module only depends on the standard library, and requires Python 3.
+
+Example:
+  client = GenerationClient("localhost", 8080)
+  responses = await client.generate("how are you?", num_responses=2)
+  client.close()
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import asyncio
+import json
+
+GENERATE_PATH = "/generate"
+
+
+class GenerationError(Exception):
+  """Error replied by the server, with its HTTP status code."""
+
+  def __init__(self, status, message):
+    super(GenerationError, self).__init__("%d: %s" % (status, message))
+    self.status = status
+
+
+class GenerationClient(object):
+  """Sends requests to the server over a connection kept open.
+
+  A client sends one request at a time. Concurrent requests are sent with
+  several clients.
+  """
+
+  def __init__(self, host, port):
+    self.host = host
+    self.port = port
+    self._reader = None
+    self._writer = None
+
+  async def generate(self, text, num_responses=None, decoding_method=None):
+    """Return the list of responses generated for a string.
+
+    Raises:
+      GenerationError: if the server replied with an error.
+    """
+    request = {"text": text}
+    if num_responses is not None:
+      request["num_responses"] = num_responses
+    if decoding_method is not None:
+      request["decoding_method"] = decoding_method
+    status, reply = await self.request("POST", GENERATE_PATH, request)
+    if status != 200:
+      raise GenerationError(status, reply.get("error"))
+    return reply["responses"]
+
+  async def request(self, method, path, payload=None):
+    """Send a request with a JSON payload, and return the status and reply."""
+    if self._writer is None:
+      self._reader, self._writer = await asyncio.open_connection(
+          self.host, self.port)
+    body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+    self._writer.write((
+        "%s %s HTTP/1.1\r\n"
+        "Host: %s:%d\r\n"
+        "Content-Type: application/json\r\n"
+        "Content-Length: %d\r\n\r\n" % (
+            method, path, self.host, self.port, len(body))).encode("latin-1"))
+    self._writer.write(body)
+    await self._writer.drain()
+
+    status_line = await self._reader.readline()
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+      line = await self._reader.readline()
+      if line in (b"\r\n", b"\n", b""):
+        break
+      name, _, value = line.decode("latin-1").partition(":")
+      headers[name.strip().lower()] = value.strip()
+    reply = json.loads((await self._reader.readexactly(
+        int(headers.get("content-length", 0)))).decode("utf-8"))
+
+    if headers.get("connection", "").lower() == "close":
+      self.close()
+    return status, reply
+
+  def close(self):
+    if self._writer is not None:
+      self._writer.close()
+      self._reader = self._writer = None
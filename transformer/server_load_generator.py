@@ -0,0 +1,152 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Send concurrent requests to the generation server, and report its latency.
+
+The lines of --file are sent in turn by --concurrency clients, each waiting for
+the reply to its request before sending the next one. The throughput (QPS) and
+the p50, p95 and p99 latencies of the successful requests are reported.
+
+This script does not depend on TensorFlow, and requires Python 3.
+
+Example:
+  python server_load_generator.py --port=8080 --file=/tmp/data/dev.src \
+      --num_requests=1000 --concurrency=32
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import asyncio
+import time
+
+# pylint: disable=g-bad-import-order
+from absl import app as absl_app
+from absl import flags
+from absl import logging
+import numpy as np
+# pylint: enable=g-bad-import-order
+
+from official.transformer import server_client
+
+
+def summarize_latencies(latencies, elapsed_secs):
+  """Return the throughput and latency percentiles of requests.
+
+  Args:
+    latencies: list of the latencies of the requests in seconds.
+    elapsed_secs: time taken to send all requests.
+
+  Returns:
+    Dictionary with the number of requests, the QPS, and the p50, p95 and p99
+    latencies in milliseconds.
+  """
+  summary = {"num_requests": len(latencies),
+             "qps": len(latencies) / elapsed_secs if elapsed_secs else 0.}
+  for percentile in (50, 95, 99):
+    summary["p%d_ms" % percentile] = (
+        float(np.percentile(latencies, percentile)) * 1000 if latencies else 0.)
+  return summary
+
+
+async def generate_load(host, port, texts, num_requests, concurrency,
+                        num_responses=None, decoding_method=None):
+  """Send requests from concurrent clients.
+
+  Args:
+    host: host of the server.
+    port: port of the server.
+    texts: list of strings sent in turn.
+    num_requests: total number of requests.
+    concurrency: number of clients sending requests at the same time.
+    num_responses: (optional) number of responses of each request.
+    decoding_method: (optional) decoding method of each request.
+
+  Returns:
+    List of the latencies of successful requests in seconds, number of failed
+    requests, and time taken to send all requests.
+  """
+  request_indices = iter(range(num_requests))
+  latencies = []
+  errors = []
+
+  async def run_client():
+    client = server_client.GenerationClient(host, port)
+    try:
+      # The clients share the iterator, so that each request is sent once.
+      for i in request_indices:
+        start = time.time()
+        try:
+          await client.generate(
+              texts[i % len(texts)], num_responses, decoding_method)
+        except (server_client.GenerationError, ConnectionError,
+                asyncio.IncompleteReadError) as e:
+          errors.append(e)
+          client.close()
+          continue
+        latencies.append(time.time() - start)
+    finally:
+      client.close()
+
+  start = time.time()
+  await asyncio.gather(*[run_client() for _ in range(concurrency)])
+  elapsed_secs = time.time() - start
+  if errors:
+    logging.warning("%d requests failed, e.g. %s" % (len(errors), errors[0]))
+  return latencies, len(errors), elapsed_secs
+
+
+def main(unused_argv):
+  with open(FLAGS.file) as f:
+    texts = [line.strip() for line in f]
+
+  loop = asyncio.get_event_loop()
+  latencies, num_errors, elapsed_secs = loop.run_until_complete(generate_load(
+      FLAGS.host, FLAGS.port, texts, FLAGS.num_requests, FLAGS.concurrency,
+      FLAGS.num_responses, FLAGS.decoding_method))
+  summary = summarize_latencies(latencies, elapsed_secs)
+  logging.info(
+      "%d requests (%d failed) in %.1f seconds: %.1f QPS, latency p50 %.1f ms, "
+      "p95 %.1f ms, p99 %.1f ms." % (
+          summary["num_requests"] + num_errors, num_errors, elapsed_secs,
+          summary["qps"], summary["p50_ms"], summary["p95_ms"],
+          summary["p99_ms"]))
+
+
+def define_load_generator_flags():
+  """Define flags used for the load generator."""
+  flags.DEFINE_string(
+      name="host", default="localhost", help="Host of the server.")
+  flags.DEFINE_integer(name="port", default=8080, help="Port of the server.")
+  flags.DEFINE_string(
+      name="file", default=None, help="File of the lines sent in requests.")
+  flags.mark_flag_as_required("file")
+  flags.DEFINE_integer(
+      name="num_requests", default=1000, help="Total number of requests.")
+  flags.DEFINE_integer(
+      name="concurrency", default=16,
+      help="Number of clients sending requests at the same time.")
+  flags.DEFINE_integer(
+      name="num_responses", default=None,
+      help="Number of responses of each request.")
+  flags.DEFINE_string(
+      name="decoding_method", default=None,
+      help="Decoding method of each request.")
+
+
+if __name__ == "__main__":
+  define_load_generator_flags()
+  FLAGS = flags.FLAGS
+  absl_app.run(main)
@@ -0,0 +1,204 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Test the generation server with a loopback client."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import asyncio
+import os
+import threading
+
+import numpy as np
+import tensorflow as tf  # pylint: disable=g-bad-import-order
+
+from official.transformer import retrieval_index
+from official.transformer import server
+from official.transformer import server_client
+from official.transformer import server_load_generator
+from official.transformer.utils import embedding_index
+
+
+class _EchoTranslator(object):
+  """Translator whose responses are its inputs, in lower and upper case."""
+
+  def __init__(self):
+    self.batch_sizes = []
+    self.stopped = False
+    self._lock = threading.Lock()
+
+  def translate_batch(self, txts, all_responses=False):
+    assert all_responses
+    if "fail" in txts:
+      raise ValueError("Failed translation.")
+    with self._lock:
+      self.batch_sizes.append(len(txts))
+    return [[txt.lower(), txt.upper()] for txt in txts]
+
+  def shutdown(self):
+    self.stopped = True
+
+
+class _LengthEmbedder(object):
+  """Embedder of strings as their length and 1."""
+
+  dim = 2
+
+  def __init__(self):
+    self.closed = False
+
+  def embed(self, txts):
+    return np.array([[len(txt), 1.] for txt in txts], dtype=np.float32)
+
+  def close(self):
+    self.closed = True
+
+
+class _EchoEngine(object):
+  """Continuous batching engine whose response is its input, reversed."""
+
+  continuous_batching = True
+
+  def __init__(self):
+    self.txts = []
+
+  def submit(self, txt, callback):
+    self.txts.append(txt)
+    threading.Thread(target=callback, args=([txt[::-1]], None)).start()
+
+
+class GenerationServerTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(GenerationServerTest, self).setUp()
+    self.loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(self.loop)
+    self.translators = {"beam_search": _EchoTranslator(),
+                        "greedy": _EchoTranslator()}
+    self.server = server.GenerationServer(
+        self.translators, max_num_responses=2, max_batch_size=4,
+        latency_slo_secs=0.5)
+    _, self.port = self.loop.run_until_complete(self.server.start())
+
+  def tearDown(self):
+    self.loop.run_until_complete(self.server.close())
+    self.loop.close()
+    super(GenerationServerTest, self).tearDown()
+
+  def _generate(self, *args, **kwargs):
+    client = server_client.GenerationClient("localhost", self.port)
+    try:
+      return self.loop.run_until_complete(client.generate(*args, **kwargs))
+    finally:
+      client.close()
+
+  def test_generate(self):
+    self.assertEqual(["hello"], self._generate("Hello"))
+    self.assertEqual(["hello", "HELLO"],
+                     self._generate("Hello", num_responses=2,
+                                    decoding_method="greedy"))
+    self.assertEqual([1], self.translators["greedy"].batch_sizes)
+
+  def test_coalescing(self):
+    latencies, num_errors, _ = self.loop.run_until_complete(
+        server_load_generator.generate_load(
+            "localhost", self.port, ["a", "b", "c"], num_requests=12,
+            concurrency=6))
+
+    self.assertEqual(12, len(latencies))
+    self.assertEqual(0, num_errors)
+    batch_sizes = self.translators["beam_search"].batch_sizes
+    self.assertEqual(12, sum(batch_sizes))
+    self.assertLessEqual(max(batch_sizes), 4)
+    self.assertLess(len(batch_sizes), 12)
+
+  def test_continuous_batching(self):
+    engine = _EchoEngine()
+    self.translators["greedy"] = engine
+    greedy_server = server.GenerationServer(self.translators)
+    _, port = self.loop.run_until_complete(greedy_server.start())
+    client = server_client.GenerationClient("localhost", port)
+    try:
+      self.assertEqual(["olleh"], self.loop.run_until_complete(
+          client.generate("hello", decoding_method="greedy")))
+    finally:
+      client.close()
+      self.loop.run_until_complete(greedy_server.close())
+    self.assertEqual(["hello"], engine.txts)
+
+  def test_invalid_requests(self):
+    client = server_client.GenerationClient("localhost", self.port)
+    for request in [{"text": 1}, {"text": "a", "num_responses": 3},
+                    {"text": "a", "decoding_method": "top_k"}]:
+      status, reply = self.loop.run_until_complete(
+          client.request("POST", server.GENERATE_PATH, request))
+      self.assertEqual(400, status)
+      self.assertIn("error", reply)
+
+    status, _ = self.loop.run_until_complete(
+        client.request("GET", server.GENERATE_PATH))
+    self.assertEqual(405, status)
+    status, _ = self.loop.run_until_complete(client.request("GET", "/none"))
+    self.assertEqual(404, status)
+    status, reply = self.loop.run_until_complete(
+        client.request("GET", server.HEALTH_PATH))
+    self.assertEqual((200, {"status": "ok"}), (status, reply))
+    client.close()
+
+  def test_failed_translation(self):
+    with self.assertRaises(server_client.GenerationError) as context:
+      self._generate("fail")
+    self.assertEqual(500, context.exception.status)
+    # The server keeps serving after an error.
+    self.assertEqual(["ok"], self._generate("ok"))
+
+  def test_retrieval_shutdown(self):
+    response_file = os.path.join(self.get_temp_dir(), "responses")
+    with tf.gfile.Open(response_file, "w") as f:
+      f.write("short\nmuch longer\n")
+    index_dir = os.path.join(self.get_temp_dir(), "index")
+    embedder = _LengthEmbedder()
+    retrieval_index.build_index(embedder, response_file, index_dir)
+    index = embedding_index.EmbeddingIndex(index_dir)
+    self.translators["retrieval"] = retrieval_index.Retriever(embedder, index)
+    retrieval_server = server.GenerationServer(self.translators)
+    _, port = self.loop.run_until_complete(retrieval_server.start())
+    client = server_client.GenerationClient("localhost", port)
+    try:
+      self.assertEqual(["much longer"], self.loop.run_until_complete(
+          client.generate("a long query", decoding_method="retrieval")))
+    finally:
+      client.close()
+      self.loop.run_until_complete(retrieval_server.close())
+
+    server.shutdown_translators(self.translators)
+    self.assertTrue(embedder.closed)
+    self.assertIsNone(index.embeddings)
+    self.assertTrue(self.translators["beam_search"].stopped)
+    self.assertTrue(self.translators["greedy"].stopped)
+
+  def test_summarize_latencies(self):
+    summary = server_load_generator.summarize_latencies(
+        [0.001 * i for i in range(1, 101)], 2.)
+
+    self.assertEqual(100, summary["num_requests"])
+    self.assertAllClose(50., summary["qps"])
+    self.assertAllClose(50.5, summary["p50_ms"])
+    self.assertAllClose(99.01, summary["p99_ms"])
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -0,0 +1,134 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Measure the startup cost of the Unicode tables of the tokenizers.
+
+Each case is timed in --num_runs new Python processes, after its setup code,
+which imports the dependencies so that their import time is not counted. The
+cases are:
+  import tokenizer, import compute_bleu: time to import the modules, whose
+    Unicode tables are built when they are first used.
+  first use, precomputed ranges: time of the first tokenization with each
+    module, which loads the ranges of utils/unicode_ranges.json.
+  first use, computed ranges: the same, when the ranges of the Python version
+    are not precomputed and are computed from the Unicode database.
+  eager tables: time the modules took to build their tables when they were
+    imported, before the tables were built lazily.
+
+Example:
+  python startup_benchmark.py --num_runs=5
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import os
+import subprocess
+import sys
+
+# pylint: disable=g-bad-import-order
+from absl import app as absl_app
+from absl import flags
+import numpy as np
+import tensorflow as tf
+# pylint: enable=g-bad-import-order
+
+from official.utils.flags import core as flags_core
+
+_NUM_RUNS = 5
+
+# Prints the time taken by the statement of a case, in seconds.
+_TIMING_SCRIPT = """
+import time
+%s
+start = time.time()
+%s
+print(time.time() - start)
+"""
+
+_DEPENDENCIES = "import numpy, six, tensorflow"
+_MODULES = (
+    _DEPENDENCIES + "\n"
+    "from official.transformer import compute_bleu\n"
+    "from official.transformer.utils import tokenizer\n"
+    "from official.transformer.utils import unicode_tables")
+_FIRST_USE = (
+    "tokenizer._split_string_to_tokens(u'a, b')\n"
+    "compute_bleu.bleu_tokenize(u'a, b')")
+# The tables that tokenizer.py and compute_bleu.py built when imported.
+_EAGER_TABLES = """
+import re, sys, unicodedata, six
+alphanumeric_char_set = set(
+    six.unichr(i) for i in range(sys.maxunicode)
+    if (unicodedata.category(six.unichr(i)).startswith("L") or
+        unicodedata.category(six.unichr(i)).startswith("N")))
+def property_chars(prefix):
+  return "".join(six.unichr(x) for x in range(sys.maxunicode)
+                 if unicodedata.category(six.unichr(x)).startswith(prefix))
+punctuation = property_chars("P")
+re.compile(r"([^\\d])([" + punctuation + r"])")
+re.compile(r"([" + punctuation + r"])([^\\d])")
+re.compile("([" + property_chars("S") + "])")
+"""
+
+# Setup and timed statement of each case.
+CASES = collections.OrderedDict([
+    ("import tokenizer", (
+        _DEPENDENCIES,
+        "from official.transformer.utils import tokenizer")),
+    ("import compute_bleu", (
+        _DEPENDENCIES,
+        "from official.transformer import compute_bleu")),
+    ("first use, precomputed ranges", (_MODULES, _FIRST_USE)),
+    ("first use, computed ranges", (
+        _MODULES + "\nunicode_tables.TABLE_FILE = ''", _FIRST_USE)),
+    ("eager tables", ("", _EAGER_TABLES)),
+])
+
+
+def time_case(setup, statement, num_runs=_NUM_RUNS):
+  """Return the times of a statement run after setup in new processes."""
+  # The processes import the modules from the same paths as this one.
+  env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+  times = []
+  for _ in range(num_runs):
+    output = subprocess.check_output(
+        [sys.executable, "-c", _TIMING_SCRIPT % (setup, statement)], env=env)
+    times.append(float(output.decode("utf-8").split()[-1]))
+  return times
+
+
+def main(unused_argv):
+  tf.logging.set_verbosity(tf.logging.INFO)
+
+  for name, (setup, statement) in CASES.items():
+    times = time_case(setup, statement, FLAGS.num_runs)
+    tf.logging.info("%s: median %.3f s, min %.3f s, max %.3f s over %d runs." %
+                    (name, np.median(times), np.min(times), np.max(times),
+                     len(times)))
+
+
+def define_startup_benchmark_flags():
+  """Define flags used for the startup benchmark script."""
+  flags.DEFINE_integer(
+      name="num_runs", default=_NUM_RUNS,
+      help=flags_core.help_wrap("Number of processes timing each case."))
+
+
+if __name__ == "__main__":
+  define_startup_benchmark_flags()
+  FLAGS = flags.FLAGS
+  absl_app.run(main)
@@ -15,3 +15,8 @@ TEST_FILE_OUT=./test.res
 CUDA_VISIBLE_DEVICES=0 python translate.py --model_dir=$MODEL_DIR --vocab_file=$VOCAB_FILE \
     --param_set=$PARAM_SET --file=$TEST_FILE --file_out=$TEST_FILE_OUT
 
+# On a CPU server, translate shards of the file with several workers, each
+# pinned to its own cores:
+#python translate_job.py --model_dir=$MODEL_DIR --vocab_file=$VOCAB_FILE \
+#    --param_set=$PARAM_SET --file=$TEST_FILE --file_out=$TEST_FILE_OUT \
+#    --num_workers=8
@@ -36,24 +36,25 @@ from tensorflow.python import debug as tf_debug
 # pylint: enable=g-bad-import-order
 
 from official.transformer import compute_bleu
+from official.transformer import model_export
 from official.transformer import translate
 from official.transformer.model import model_params
 from official.transformer.model import transformer
 from official.transformer.model import transformer2
 from official.transformer.model import transformer3
 from official.transformer.utils import dataset
+from official.transformer.utils import inference_checkpoint
 from official.transformer.utils import metrics
 from official.transformer.utils import schedule
 from official.transformer.utils import tokenizer
 from official.utils.accelerator import tpu as tpu_util
-from official.utils.export import export
 from official.utils.flags import core as flags_core
 from official.utils.logs import hooks_helper
 from official.utils.logs import logger
 from official.utils.misc import distribution_utils
 from official.utils.misc import model_helpers
 # tc add
-from official.transformer.model import ffn_layer
+from official.transformer.model import vocab_shortlist
 
 PARAMS_MAP = {
     "tiny": model_params.TINY_PARAMS,
@@ -105,9 +106,10 @@ def model_fn(features, labels, mode, params):
       return tf.estimator.EstimatorSpec(
           tf.estimator.ModeKeys.PREDICT,
           predictions=logits,
-          export_outputs={
-              "translate": tf.estimator.export.PredictOutput(logits)
-          })
+          export_outputs=model_export.get_export_outputs(
+              logits, latent_sample, params),
+          # Also restore inference checkpoints stored in float16.
+          scaffold=tf.train.Scaffold(saver=inference_checkpoint.Saver()))
 
     # Explicitly set the shape of the logits for XLA (TPU). This is needed
     # because the logits are passed back to the host VM CPU for metric
@@ -225,15 +227,10 @@ def compute_bow_loss(latent_sample, targets, params, train):
       latent_variable: size [batch_size, hidden_size]
       targets: size [batch_size, length]
   """
-  with tf.variable_scope("bow_decoder"):
+  with tf.name_scope("bow_decoder"):
     # feed forward
-    bow_ffn_layer = ffn_layer.FeedFowardNetwork(
-        params["latent_size"], params["filter_size"],
-        params["relu_dropout"], train, params["allow_ffn_pad"],
-        output_size = params["vocab_size"], activation=tf.nn.relu 
-    )
-    expd_lv = tf.expand_dims(latent_sample, axis=1) # get [batch_size, 1, hidden_size]
-    bow_logits = bow_ffn_layer(expd_lv, padding=None) # get [batch_size, 1, vocab_size]
+    bow_logits = vocab_shortlist.get_bow_logits(latent_sample, params, train)
+    bow_logits = tf.expand_dims(bow_logits, axis=1) # get [batch_size, 1, vocab_size]
     length = tf.shape(targets)[1]
     tile_bow_logits = tf.tile(bow_logits, [1, length, 1]) # get [batch_size, length, vocab_size]
 
@@ -779,17 +776,13 @@ def run_transformer(flags_obj):
       vocab_file=flags_obj.vocab_file)
 
   if flags_obj.export_dir:
-    serving_input_fn = export.build_tensor_serving_input_receiver_fn(
-        shape=[None], dtype=tf.int64, batch_size=None)
     # Export saved model, and save the vocab file as an extra asset. The vocab
     # file is saved to allow consistent input encoding and output decoding.
     # (See the "Export trained model" section in the README for an example of
     # how to use the vocab file.)
-    # Since the model itself does not use the vocab file, this file is saved as
-    # an extra asset rather than a core asset.
-    estimator.export_savedmodel(
-        flags_obj.export_dir, serving_input_fn,
-        assets_extra={"vocab.txt": flags_obj.vocab_file})
+    model_export.export_saved_model(
+        model_fn, params, flags_obj.model_dir, flags_obj.export_dir,
+        flags_obj.vocab_file)
 
 
 def main(_):
@@ -18,47 +18,269 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import collections
+import copy
+import itertools
+import multiprocessing
 import os
+import random
+import time
 
 # pylint: disable=g-bad-import-order
 from absl import app as absl_app
 from absl import flags
+import numpy as np
 import tensorflow as tf
+from tensorflow.python.client import timeline
 # pylint: enable=g-bad-import-order
 
+from official.transformer.utils import dataset
+from official.transformer.utils import response_cache
 from official.transformer.utils import tokenizer
+from official.transformer.utils import tracing
 from official.utils.flags import core as flags_core
 
 _DECODE_BATCH_SIZE = 32
+# Maximum number of decoded tokens in a batch of translate_file, counting the
+# extra decode length and every beam of each input.
+_DECODE_TOKEN_BUDGET = 16384
+# Number of lines of translate_file that are read, sorted and written together.
+_DECODE_WINDOW_SIZE = 100000
+# Number of chunks of a window encoded by each process of the encoding pool.
+_ENCODE_CHUNKS_PER_WORKER = 4
 _EXTRA_DECODE_LENGTH = 100
 _BEAM_SIZE = 4
 _ALPHA = 0.6
+# Default input length, number of batches and warm-up batches of --benchmark.
+_BENCHMARK_INPUT_LENGTH = 32
+_BENCHMARK_NUM_BATCHES = 10
+_BENCHMARK_WARMUP_BATCHES = 2
 
 
-def _get_sorted_inputs(filename):
-  """Read and sort lines from the file sorted by decreasing length.
+def _read_windows(filename, window_size, start_line=0):
+  """Yield lists of window_size consecutive lines from the file.
 
   Args:
     filename: String name of file to read inputs from.
-  Returns:
-    Sorted list of inputs, and dictionary mapping original index->sorted index
-    of each element.
+    window_size: Number of lines in each list. The last list may be shorter.
+    start_line: Index of the first line to read.
   """
   with tf.gfile.Open(filename) as f:
-    records = f.read().split("\n")
-    inputs = [record.strip() for record in records]
-    if not inputs[-1]:
-      inputs.pop()
+    window = []
+    for i, line in enumerate(f):
+      if i < start_line:
+        continue
+      window.append(line.strip())
+      if len(window) == window_size:
+        yield window
+        window = []
+    if window:
+      yield window
+
+
+# Subtokenizer of the processes of the encoding pool.
+_worker_subtokenizer = None
+
+
+def _init_encode_worker(subtokenizer):
+  global _worker_subtokenizer
+  _worker_subtokenizer = subtokenizer
+
+
+def _encode_lines(lines, subtokenizer=None):
+  """Encode lines and add EOS ids.
+
+  Args:
+    lines: List of strings.
+    subtokenizer: Subtokenizer object used to encode the lines. Defaults to that
+      of the encoding pool process.
+  Returns:
+    int32 array of the concatenated ids of the lines, and int32 array of the
+    number of ids of each line.
+  """
+  subtokenizer = subtokenizer or _worker_subtokenizer
+  encoded_lines = [_encode_and_add_eos(line, subtokenizer) for line in lines]
+  lengths = np.array([len(ids) for ids in encoded_lines], dtype=np.int32)
+  ids = np.fromiter((i for ids in encoded_lines for i in ids), dtype=np.int32,
+                    count=lengths.sum())
+  return ids, lengths
+
 
-  input_lens = [(i, len(line.split())) for i, line in enumerate(inputs)]
-  sorted_input_lens = sorted(input_lens, key=lambda x: x[1], reverse=True)
+def _encode_windows(windows, subtokenizer, pool=None, num_workers=1):
+  """Encode windows of lines, in parallel if a process pool is given.
 
-  sorted_inputs = [None] * len(sorted_input_lens)
-  sorted_keys = [0] * len(sorted_input_lens)
-  for i, (index, _) in enumerate(sorted_input_lens):
+  The next window is encoded by the pool while the current one is consumed.
+
+  Args:
+    windows: iterable of lists of strings.
+    subtokenizer: Subtokenizer object used to encode the lines without a pool.
+    pool: (optional) multiprocessing.Pool whose processes were initialized with
+      _init_encode_worker. The lines of each window are split in chunks that
+      are encoded by the processes of the pool.
+    num_workers: number of processes of the pool.
+  Yields:
+    Tuples of (lines, list of int32 arrays of the ids of each line).
+  """
+  def split_chunks(chunks):
+    return [line_ids for ids, lengths in chunks
+            for line_ids in np.split(ids, np.cumsum(lengths)[:-1])]
+
+  if pool is None:
+    for lines in windows:
+      yield lines, split_chunks([_encode_lines(lines, subtokenizer)])
+    return
+
+  pending = None
+  for lines in windows:
+    chunk_size = max(1, -(-len(lines) // (
+        num_workers * _ENCODE_CHUNKS_PER_WORKER)))
+    result = pool.map_async(
+        _encode_lines,
+        [lines[i:i + chunk_size] for i in range(0, len(lines), chunk_size)])
+    if pending is not None:
+      yield pending[0], split_chunks(pending[1].get())
+    pending = (lines, result)
+  if pending is not None:
+    yield pending[0], split_chunks(pending[1].get())
+
+
+def _get_sorted_inputs(inputs, encoded_inputs):
+  """Sort inputs by decreasing encoded length.
+
+  Args:
+    inputs: List of strings.
+    encoded_inputs: List of the encoded ids of each input.
+  Returns:
+    Sorted list of inputs, list of their encoded ids, and dictionary mapping
+    original index->sorted index of each element.
+  """
+  sorted_indices = sorted(range(len(inputs)),
+                          key=lambda i: len(encoded_inputs[i]), reverse=True)
+
+  sorted_inputs = [None] * len(sorted_indices)
+  sorted_encoded_inputs = [None] * len(sorted_indices)
+  sorted_keys = [0] * len(sorted_indices)
+  for i, index in enumerate(sorted_indices):
     sorted_inputs[i] = inputs[index]
+    sorted_encoded_inputs[i] = encoded_inputs[index]
     sorted_keys[index] = i
-  return sorted_inputs, sorted_keys
+  return sorted_inputs, sorted_encoded_inputs, sorted_keys
+
+
+def _get_batch_sizes(sorted_lengths, token_budget, extra_decode_length,
+                     num_beams):
+  """Return sizes of the batches of inputs sorted by decreasing length.
+
+  The inputs are grouped with the bucket boundaries used for training, so that
+  inputs of a batch have similar lengths. Each batch has as many inputs as fit
+  in the token budget, given that the decoder runs num_beams beams of up to
+  (input length + extra_decode_length) tokens for each input.
+
+  Args:
+    sorted_lengths: list of input lengths, in decreasing order.
+    token_budget: maximum number of decoded tokens in a batch.
+    extra_decode_length: number of tokens decoded beyond the input length.
+    num_beams: number of sequences decoded for each input.
+
+  Returns:
+    List of batch sizes, which sum to the number of inputs.
+  """
+  if not sorted_lengths:
+    return []
+  buckets_min, buckets_max = dataset._create_min_max_boundaries(  # pylint: disable=protected-access
+      sorted_lengths[0])
+
+  batch_sizes = []
+  batch_bucket_id = None
+  bucket_id = len(buckets_min) - 1
+  for length in sorted_lengths:
+    while length < buckets_min[bucket_id]:
+      bucket_id -= 1
+    max_batch_size = max(1, token_budget // (
+        (buckets_max[bucket_id] + extra_decode_length) * num_beams))
+
+    # Start a new batch when the bucket changes or the batch is full.
+    if batch_bucket_id != bucket_id or batch_sizes[-1] >= max_batch_size:
+      batch_sizes.append(0)
+      batch_bucket_id = bucket_id
+    batch_sizes[-1] += 1
+  return batch_sizes
+
+
+def _pad_batch(batch):
+  """Return an int64 array of the encoded inputs, padded with PAD_ID."""
+  padded_batch = np.full([len(batch), max(len(ids) for ids in batch)],
+                         tokenizer.PAD_ID, dtype=np.int64)
+  for i, ids in enumerate(batch):
+    padded_batch[i, :len(ids)] = ids
+  return padded_batch
+
+
+def _get_window_arrays(encoded_inputs, batch_sizes):
+  """Return the arrays from which _batch_window builds the batches of inputs.
+
+  Args:
+    encoded_inputs: list of the encoded ids of each input, in batch order.
+    batch_sizes: list of the number of consecutive inputs in each batch.
+
+  Returns:
+    Tuple of int64 arrays: the concatenated ids of the inputs, the length of
+    each input, the index of the batch of each input, and the size of each
+    batch.
+  """
+  lengths = np.array([len(ids) for ids in encoded_inputs], dtype=np.int64)
+  if encoded_inputs:
+    ids = np.concatenate(encoded_inputs).astype(np.int64)
+  else:
+    ids = np.zeros([0], dtype=np.int64)
+  batch_sizes = np.array(batch_sizes, dtype=np.int64)
+  batch_ids = np.repeat(np.arange(len(batch_sizes), dtype=np.int64),
+                        batch_sizes)
+  return ids, lengths, batch_ids, batch_sizes
+
+
+def _batch_window(ids, lengths, batch_ids, batch_sizes):
+  """Return a dataset of the padded batches of a window of inputs.
+
+  The inputs are sliced from their concatenated ids and padded with PAD_ID in
+  the graph, so that Python only handles one element per window.
+
+  Args:
+    ids: int64 tensor of the concatenated ids of the inputs.
+    lengths: int64 tensor of the length of each input.
+    batch_ids: int64 tensor of the index of the batch of each input.
+    batch_sizes: int64 tensor of the size of each batch.
+
+  Returns:
+    Dataset of int64 tensors with shape [batch_size, max input length].
+  """
+  starts = tf.cumsum(lengths, exclusive=True)
+  inputs = tf.data.Dataset.from_tensor_slices((starts, lengths, batch_ids))
+  inputs = inputs.map(
+      lambda start, length, batch_id: (ids[start:start + length], batch_id))
+
+  def window_size_fn(batch_id):
+    """Return the number of inputs of a batch."""
+    return batch_sizes[batch_id]
+
+  def batching_fn(batch_id, grouped_dataset):
+    """Pad the inputs of a batch to the same length."""
+    return grouped_dataset.padded_batch(window_size_fn(batch_id), ([None], []))
+
+  # The inputs of a batch are consecutive, so each batch is complete once its
+  # last input is grouped, and the batches keep their order.
+  batches = inputs.apply(tf.contrib.data.group_by_window(
+      key_func=lambda _, batch_id: batch_id,
+      reduce_func=batching_fn,
+      window_size=None,
+      window_size_func=window_size_fn))
+  return batches.map(lambda batch, _: batch)
+
+
+def _split_predictions(predictions):
+  """Return the predictions of each input of a batch of predictions."""
+  return [{key: value[i] for key, value in predictions.items()}
+          for i in range(len(predictions["outputs"]))]
 
 
 def _encode_and_add_eos(line, subtokenizer):
@@ -75,11 +297,173 @@ def _trim_and_decode(ids, subtokenizer):
     return subtokenizer.decode(ids)
 
 
+def _decode_responses(prediction, subtokenizer):
+  """Decode the response(s) of a prediction to a list of strings.
+
+  If the model generated a response for each of several latent samples, the
+  responses are returned in the order of their sample ids.
+  """
+  if prediction["outputs"].ndim == 1:
+    return [_trim_and_decode(prediction["outputs"], subtokenizer)]
+  return [_trim_and_decode(prediction["outputs"][i], subtokenizer)
+          for i in prediction["sample_ids"]]
+
+
+def _decode_prediction(prediction, subtokenizer):
+  """Decode the response(s) of a prediction to a string.
+
+  Several responses are separated by tabs.
+  """
+  return "\t".join(_decode_responses(prediction, subtokenizer))
+
+
+class _Window(object):
+  """A window of lines of translate_file, and the translations of its inputs.
+
+  Each unique encoded input is translated once, and its translation is written
+  for all the lines it appears in.
+  """
+
+  def __init__(self, lines, encoded_lines, cache=None):
+    """Find the unique inputs of the lines, and their cached translations.
+
+    Args:
+      lines: List of strings.
+      encoded_lines: List of int32 arrays of the ids of each line.
+      cache: (optional) ResponseCache holding translations of previous runs.
+    """
+    self.cache = cache
+
+    # Index of the unique input of each line.
+    self.input_indices = []
+    self.inputs = []
+    self.encoded_inputs = []
+    unique_indices = {}
+    for line, ids in zip(lines, encoded_lines):
+      index = unique_indices.setdefault(ids.tobytes(), len(self.inputs))
+      if index == len(self.inputs):
+        self.inputs.append(line)
+        self.encoded_inputs.append(ids)
+      self.input_indices.append(index)
+
+    self.cache_keys = [None] * len(self.inputs)
+    self.translations = [None] * len(self.inputs)
+    if cache is not None:
+      for i, ids in enumerate(self.encoded_inputs):
+        self.cache_keys[i] = cache.get_key(ids)
+        self.translations[i] = cache.get(self.cache_keys[i])
+
+    # Indices of the inputs to translate, sorted by decreasing length.
+    uncached = [i for i, t in enumerate(self.translations) if t is None]
+    self.decode_order, self.sorted_encoded_inputs, _ = _get_sorted_inputs(
+        uncached, [self.encoded_inputs[i] for i in uncached])
+    self.num_translated = 0
+
+  def done(self):
+    return self.num_translated == len(self.decode_order)
+
+  def add_translation(self, translation):
+    """Set the translation of the next input in decoding order.
+
+    Returns:
+      The translated input.
+    """
+    index = self.decode_order[self.num_translated]
+    self.translations[index] = translation
+    if self.cache is not None:
+      self.cache.put(self.cache_keys[index], translation)
+    self.num_translated += 1
+    return self.inputs[index]
+
+  def line_translations(self):
+    """Return the translation of each line, in the original order."""
+    return [self.translations[i] for i in self.input_indices]
+
+
+class _BatchTrace(object):
+  """Timing of a batch of translate_file, from its window to its outputs.
+
+  The yield time is the time the window of the batch was passed to the input
+  pipeline, which pads the batches of the window in the graph.
+  """
+
+  def __init__(self, index, size, input_length):
+    self.index = index
+    self.size = size
+    self.input_length = input_length
+    self.yield_time = time.time()
+    self.run_start = None
+    self.run_end = None
+    self.sampled = False
+
+
+class _TraceHook(tf.train.SessionRunHook):
+  """Times the session run of each batch of translate_file.
+
+  The batches are run in the order of the windows yielded by the input
+  generator, so the n-th run is that of the n-th batch of the windows. Batches
+  are sampled when they are run. If profile_dir is set, the sampled runs are
+  also traced op by op, and their timelines are written to profile_dir, which
+  splits the session run between the encoder and the decoding loop.
+  """
+
+  def __init__(self, tracer, yielded_batches, run_batches, profile_dir=None):
+    """Create the hook.
+
+    Args:
+      tracer: Tracer sampling the batches.
+      yielded_batches: deque of the _BatchTraces yielded and not yet run.
+      run_batches: deque to which the run _BatchTraces are appended.
+      profile_dir: (optional) directory of the op-level timelines.
+    """
+    self._tracer = tracer
+    self._yielded_batches = yielded_batches
+    self._run_batches = run_batches
+    self._profile_dir = profile_dir
+    self._run_start = None
+    self._sampled = False
+
+  def before_run(self, run_context):
+    self._run_start = time.time()
+    self._sampled = self._tracer.sample()
+    if self._sampled and self._profile_dir is not None:
+      return tf.train.SessionRunArgs(None, options=tf.RunOptions(
+          trace_level=tf.RunOptions.FULL_TRACE))
+    return None
+
+  def after_run(self, run_context, run_values):
+    batch = self._yielded_batches.popleft()
+    # The session may have waited for the batch to be yielded.
+    batch.run_start = max(self._run_start, batch.yield_time)
+    batch.run_end = time.time()
+    batch.sampled = self._sampled
+    if self._sampled and self._profile_dir is not None:
+      with tf.gfile.Open(os.path.join(
+          self._profile_dir, "timeline-%d.json" % batch.index), "w") as f:
+        f.write(timeline.Timeline(
+            run_values.run_metadata.step_stats).generate_chrome_trace_format())
+    self._run_batches.append(batch)
+
+
 def translate_file(
     estimator, subtokenizer, input_file, output_file=None,
-    print_all_translations=True):
+    print_all_translations=True, token_budget=_DECODE_TOKEN_BUDGET,
+    window_size=_DECODE_WINDOW_SIZE, start_line=0, num_encode_workers=1,
+    cache_file=None, cache_size=response_cache.MAX_ENTRIES, tracer=None,
+    profile_dir=None):
   """Translate lines in file, and save to output file if specified.
 
+  The file is translated in windows of window_size lines, so that only one
+  window of inputs and translations is held in memory. The lines of a window
+  are sorted by length for batching, and their translations are written in the
+  original order once the whole window is translated. With several encoding
+  workers, the lines of the next window are encoded by a process pool while the
+  current window is translated.
+
+  Lines of a window that are encoded to the same ids are translated once. If a
+  cache file is given, the translations are also stored in it, and inputs that
+  the same model translated in a previous run are not translated again.
+
   Args:
     estimator: tf.Estimator used to generate the translations.
     subtokenizer: Subtokenizer object for encoding and decoding source and
@@ -87,52 +471,177 @@ def translate_file(
     input_file: file containing lines to translate
     output_file: file that stores the generated translations.
     print_all_translations: If true, all translations are printed to stdout.
+    token_budget: maximum number of decoded tokens in a batch, counting every
+      beam of each input.
+    window_size: number of lines read, sorted and written together.
+    start_line: index of the first line to translate. If it is positive, the
+      translations are appended to output_file, so that an interrupted
+      translation can be resumed from the number of lines of output_file.
+    num_encode_workers: number of processes encoding the lines. If 1, the lines
+      are encoded by the thread feeding the model.
+    cache_file: (optional) file of the ResponseCache storing the translations.
+    cache_size: maximum number of translations stored in the cache file.
+    tracer: (optional) Tracer recording the tokenization time of sampled
+      windows, and the queueing time, session run time, decoding steps and
+      detokenization time of sampled batches.
+    profile_dir: (optional) if set with a tracer, the session runs of sampled
+      batches are traced op by op, and their timelines written to this
+      directory.
 
   Raises:
     ValueError: if output file is invalid.
   """
-  batch_size = _DECODE_BATCH_SIZE
+  if output_file is not None and tf.gfile.IsDirectory(output_file):
+    raise ValueError("File output is a directory, will not save outputs to "
+                     "file.")
+
+  params = estimator.params
+  num_beams = params["num_latent_samples"] or 1
+  if (params["decoding_method"] or "beam_search") == "beam_search":
+    num_beams *= params["beam_size"]
+
+  cache = None
+  if cache_file is not None:
+    cache = response_cache.ResponseCache(
+        cache_file, response_cache.get_model_key(
+            estimator.latest_checkpoint(), params,
+            estimator.config.tf_random_seed),
+        max_entries=cache_size)
+
+  # Windows that were read but not yet written.
+  windows = collections.deque()
+  # With a tracer, batches that were yielded but not yet run, and batches that
+  # were run but whose outputs were not all decoded.
+  yielded_batches = collections.deque()
+  run_batches = collections.deque()
+  hooks = None
+  if tracer is not None:
+    hooks = [_TraceHook(tracer, yielded_batches, run_batches, profile_dir)]
+  stats = {"lines": 0, "inputs": 0, "translated": 0}
 
-  # Read and sort inputs by length. Keep dictionary (original index-->new index
-  # in sorted list) to write translations in the original order.
-  sorted_inputs, sorted_keys = _get_sorted_inputs(input_file)
-  num_decode_batches = (len(sorted_inputs) - 1) // batch_size + 1
+  # Create the encoding pool before the estimator starts its threads.
+  pool = None
+  if num_encode_workers > 1:
+    pool = multiprocessing.Pool(
+        num_encode_workers, _init_encode_worker, (subtokenizer,))
 
-  def input_generator():
-    """Yield encoded strings from sorted_inputs."""
-    for i, line in enumerate(sorted_inputs):
-      if i % batch_size == 0:
-        batch_num = (i // batch_size) + 1
+  def window_generator():
+    """Yield the arrays of the batches of encoded inputs of each window."""
+    encoded_windows = _encode_windows(
+        _read_windows(input_file, window_size, start_line), subtokenizer,
+        pool, num_encode_workers)
+    num_batches = 0
+    tokenize_start = time.time()
+    for window_num, (lines, encoded_lines) in enumerate(encoded_windows):
+      # With encoding workers, this is the time waited for the window.
+      if tracer is not None and tracer.sample():
+        tracer.add_span("tokenize", tokenize_start, time.time(),
+                        args={"window": window_num, "lines": len(lines)})
+      window = _Window(lines, encoded_lines, cache)
+      stats["lines"] += len(lines)
+      stats["inputs"] += len(window.inputs)
+      stats["translated"] += len(window.decode_order)
+      sorted_encoded_inputs = window.sorted_encoded_inputs
+      batch_sizes = _get_batch_sizes(
+          [len(ids) for ids in sorted_encoded_inputs], token_budget,
+          params["extra_decode_length"], num_beams)
+      windows.append(window)
 
-        tf.logging.info("Decoding batch %d out of %d." %
-                        (batch_num, num_decode_batches))
-      yield _encode_and_add_eos(line, subtokenizer)
+      if batch_sizes:
+        tf.logging.info("Decoding %d batches (%d inputs) of window %d." %
+                        (len(batch_sizes), len(sorted_encoded_inputs),
+                         window_num + 1))
+        if tracer is not None:
+          start = 0
+          for batch_size in batch_sizes:
+            yielded_batches.append(_BatchTrace(
+                num_batches, batch_size, len(sorted_encoded_inputs[start])))
+            num_batches += 1
+            start += batch_size
+        yield _get_window_arrays(sorted_encoded_inputs, batch_sizes)
+      tokenize_start = time.time()
 
   def input_fn():
     """Created batched dataset of encoded inputs."""
     ds = tf.data.Dataset.from_generator(
-        input_generator, tf.int64, tf.TensorShape([None]))
-    ds = ds.padded_batch(batch_size, [None])
+        window_generator, (tf.int64,) * 4, (tf.TensorShape([None]),) * 4)
+    ds = ds.flat_map(_batch_window)
+    # Pad the next batches while the current one is translated.
+    ds = ds.prefetch(2)
     return ds
 
-  translations = []
-  for i, prediction in enumerate(estimator.predict(input_fn)):
-    translation = _trim_and_decode(prediction["outputs"], subtokenizer)
-    translations.append(translation)
-
-    if print_all_translations:
-      tf.logging.info("Translating:\n\tInput: %s\n\tOutput: %s" %
-                      (sorted_inputs[i], translation))
-
-  # Write translations in the order they appeared in the original file.
+  f = None
   if output_file is not None:
-    if tf.gfile.IsDirectory(output_file):
-      raise ValueError("File output is a directory, will not save outputs to "
-                       "file.")
     tf.logging.info("Writing to file %s" % output_file)
-    with tf.gfile.Open(output_file, "w") as f:
-      for i in sorted_keys:
-        f.write("%s\n" % translations[i])
+    f = tf.gfile.Open(output_file, "a" if start_line else "w")
+
+  def write_done_windows():
+    """Write the translations of the windows that are fully translated."""
+    while windows and windows[0].done():
+      window = windows.popleft()
+      # Write translations in the order they appeared in the original file.
+      if f is not None:
+        for translation in window.line_translations():
+          f.write("%s\n" % translation)
+        f.flush()
+      if cache is not None:
+        cache.flush()
+
+  def trace_batch(batch, predictions):
+    """Record the stages of a sampled batch, given its predictions."""
+    args = {"batch": batch.index, "size": batch.size}
+    tracer.add_span("queue", batch.yield_time, batch.run_start, args=args)
+    # The decoding loop of a batch runs until all its sequences are finished,
+    # and its outputs are trimmed to the number of steps it ran.
+    decode_steps = predictions["outputs"].shape[-1]
+    max_decode_length = batch.input_length + params["extra_decode_length"]
+    run_args = dict(args, input_length=batch.input_length,
+                    decode_steps=decode_steps,
+                    max_decode_length=max_decode_length,
+                    stopped_early=bool(decode_steps < max_decode_length))
+    tracer.add_span("session_run", batch.run_start, batch.run_end,
+                    args=run_args)
+    tracer.add_value("decode_steps", decode_steps, batch.run_end)
+
+  batch = None
+  try:
+    for predictions in estimator.predict(
+        input_fn, hooks=hooks, yield_single_examples=False):
+      # Windows whose inputs were all cached have no predictions.
+      write_done_windows()
+
+      if tracer is not None:
+        batch = run_batches.popleft()
+        if batch.sampled:
+          trace_batch(batch, predictions)
+
+      decode_start = time.time()
+      translations = [_decode_prediction(prediction, subtokenizer)
+                      for prediction in _split_predictions(predictions)]
+      if tracer is not None and batch.sampled:
+        tracer.add_span("detokenize", decode_start, time.time(),
+                        args={"batch": batch.index})
+      for translation in translations:
+        translated_input = windows[0].add_translation(translation)
+        if print_all_translations:
+          tf.logging.info("Translating:\n\tInput: %s\n\tOutput: %s" %
+                          (translated_input, translation))
+    write_done_windows()
+  finally:
+    if f is not None:
+      f.close()
+    if cache is not None:
+      cache.close()
+    if pool is not None:
+      pool.terminate()
+
+  tf.logging.info(
+      "Translated %d lines: %d unique inputs, of which %d were decoded." %
+      (stats["lines"], stats["inputs"], stats["translated"]))
+  if cache is not None:
+    tf.logging.info("Response cache hit rate: %.1f%% (%d of %d inputs)." %
+                    (100 * cache.hit_rate, cache.hits,
+                     cache.hits + cache.misses))
 
 
 def translate_text(estimator, subtokenizer, txt):
@@ -144,18 +653,213 @@ def translate_text(estimator, subtokenizer, txt):
     ds = ds.batch(_DECODE_BATCH_SIZE)
     return ds
 
-  predictions = estimator.predict(input_fn)
-  translation = next(predictions)["outputs"]
-  translation = _trim_and_decode(translation, subtokenizer)
+  predictions = next(estimator.predict(input_fn, yield_single_examples=False))
+  translation = _decode_prediction(_split_predictions(predictions)[0],
+                                   subtokenizer)
   tf.logging.info("Translation of \"%s\": \"%s\"" % (txt, translation))
 
 
+def get_benchmark_inputs(subtokenizer, num_inputs, input_length,
+                         input_file=None, seed=None):
+  """Return encoded inputs of controlled lengths for benchmarking.
+
+  Args:
+    subtokenizer: Subtokenizer object used to encode the lines of input_file.
+    num_inputs: number of inputs.
+    input_length: length of the synthetic inputs, or maximum length of the
+      inputs sampled from input_file, counting EOS.
+    input_file: (optional) file whose lines are sampled, with replacement, from
+      the lines of at most input_length ids of its first window. If not set,
+      the inputs are random ids.
+    seed: (optional) random seed of the inputs.
+
+  Returns:
+    List of num_inputs lists of ids ending with EOS.
+
+  Raises:
+    ValueError: if input_file has no line of at most input_length ids.
+  """
+  rng = random.Random(seed)
+  if input_file is None:
+    return [[rng.randrange(tokenizer.EOS_ID + 1, subtokenizer.vocab_size)
+             for _ in range(input_length - 1)] + [tokenizer.EOS_ID]
+            for _ in range(num_inputs)]
+
+  lines = next(_read_windows(input_file, _DECODE_WINDOW_SIZE), [])
+  encoded_lines = [_encode_and_add_eos(line, subtokenizer) for line in lines]
+  candidates = [ids for ids in encoded_lines if len(ids) <= input_length]
+  if not candidates:
+    raise ValueError("No line of %s has at most %d ids." %
+                     (input_file, input_length))
+  return [rng.choice(candidates) for _ in range(num_inputs)]
+
+
+def _count_output_tokens(outputs):
+  """Return the number of ids before EOS in the outputs of predictions."""
+  outputs = np.reshape(outputs, [-1, outputs.shape[-1]])
+  is_eos = outputs == tokenizer.EOS_ID
+  lengths = np.where(is_eos.any(axis=1), is_eos.argmax(axis=1),
+                     outputs.shape[1])
+  return int(lengths.sum())
+
+
+class _RunTimerHook(tf.train.SessionRunHook):
+  """Records the start and end time of each session run."""
+
+  def __init__(self):
+    self.run_times = []
+    self._run_start = None
+
+  def before_run(self, run_context):
+    self._run_start = time.time()
+
+  def after_run(self, run_context, run_values):
+    self.run_times.append((self._run_start, time.time()))
+
+
+def benchmark_decoding(estimator, inputs, batch_size,
+                       num_warmup_batches=_BENCHMARK_WARMUP_BATCHES):
+  """Translate inputs in batches, and measure the throughput and latency.
+
+  The batches are translated by a single call to estimator.predict, so the
+  graph is built once. The first num_warmup_batches batches are translated but
+  not measured.
+
+  Args:
+    estimator: tf.Estimator used to generate the translations.
+    inputs: list of encoded inputs, e.g. from get_benchmark_inputs.
+    batch_size: number of inputs of each batch. Remaining inputs that do not
+      fill a batch are not translated.
+    num_warmup_batches: number of batches translated before measuring.
+
+  Returns:
+    Dictionary of the number of sentences and of output tokens (over all the
+    responses) decoded per second, and of the percentiles of the batch latency
+    in milliseconds.
+
+  Raises:
+    ValueError: if there are no batches besides the warm-up batches.
+  """
+  num_batches = len(inputs) // batch_size
+  if num_batches <= num_warmup_batches:
+    raise ValueError("%d inputs make %d batches of %d, but %d are warm-up "
+                     "batches." % (len(inputs), num_batches, batch_size,
+                                   num_warmup_batches))
+
+  def input_fn():
+    arrays = _get_window_arrays(inputs[:num_batches * batch_size],
+                                [batch_size] * num_batches)
+    ds = tf.data.Dataset.from_tensors(arrays).flat_map(_batch_window)
+    return ds.prefetch(2)
+
+  hook = _RunTimerHook()
+  num_tokens = 0
+  for i, predictions in enumerate(estimator.predict(
+      input_fn, hooks=[hook], yield_single_examples=False)):
+    if i >= num_warmup_batches:
+      num_tokens += _count_output_tokens(predictions["outputs"])
+
+  run_times = hook.run_times[num_warmup_batches:]
+  # The measured time starts when the warm-up batches are done.
+  start = (hook.run_times[num_warmup_batches - 1][1] if num_warmup_batches
+           else run_times[0][0])
+  elapsed = run_times[-1][1] - start
+  latencies = [1000 * (end - run_start) for run_start, end in run_times]
+  metrics = {
+      "sentences_per_sec": len(run_times) * batch_size / elapsed,
+      "tokens_per_sec": num_tokens / elapsed,
+  }
+  for percentile, latency in zip(
+      tracing.PERCENTILES, np.percentile(latencies, tracing.PERCENTILES)):
+    metrics["latency_p%d" % percentile] = latency
+  return metrics
+
+
+def get_benchmark_configs(batch_sizes, beam_sizes, extra_decode_lengths,
+                          thread_counts, input_lengths):
+  """Return the list of all combinations of the benchmarked settings.
+
+  Args:
+    batch_sizes: list of batch sizes.
+    beam_sizes: list of beam sizes.
+    extra_decode_lengths: list of extra decode lengths.
+    thread_counts: list of (intra-op threads, inter-op threads) tuples.
+    input_lengths: list of input lengths.
+
+  Returns:
+    List of dictionaries with the keys batch_size, beam_size,
+    extra_decode_length, intra_op_threads, inter_op_threads and input_length.
+  """
+  return [
+      {"batch_size": batch_size, "beam_size": beam_size,
+       "extra_decode_length": extra_decode_length,
+       "intra_op_threads": intra_op_threads,
+       "inter_op_threads": inter_op_threads, "input_length": input_length}
+      for (batch_size, beam_size, extra_decode_length,
+           (intra_op_threads, inter_op_threads), input_length) in
+      itertools.product(batch_sizes, beam_sizes, extra_decode_lengths,
+                        thread_counts, input_lengths)]
+
+
+def run_benchmark(model_fn, params, subtokenizer, benchmark_logger):
+  """Benchmark the decoding of each configuration of the benchmark flags.
+
+  Args:
+    model_fn: model function of the estimator.
+    params: hyperparameter object of the model. The benchmarked settings are
+      overridden for each configuration.
+    subtokenizer: Subtokenizer object used to encode the lines of --file.
+    benchmark_logger: logger from official.utils.logs.logger. The metrics of
+      each configuration are logged with the configuration as extras.
+  """
+  configs = get_benchmark_configs(
+      [int(n) for n in FLAGS.benchmark_batch_sizes],
+      [int(n) for n in FLAGS.benchmark_beam_sizes],
+      [int(n) for n in FLAGS.benchmark_extra_decode_lengths],
+      [(int(intra), int(inter)) for intra, inter in itertools.product(
+          FLAGS.benchmark_intra_op_threads, FLAGS.benchmark_inter_op_threads)],
+      [int(n) for n in FLAGS.benchmark_input_lengths])
+  benchmark_logger.log_run_info(
+      "transformer", FLAGS.file or "synthetic",
+      {"param_set": FLAGS.param_set, "decoding_method": FLAGS.decoding_method,
+       "num_latent_samples": FLAGS.num_latent_samples,
+       "num_configs": len(configs)},
+      test_id=FLAGS.benchmark_test_id)
+
+  for config_num, config in enumerate(configs):
+    config_params = copy.copy(params)
+    config_params["beam_size"] = config["beam_size"]
+    config_params["extra_decode_length"] = config["extra_decode_length"]
+    config_params["batch_size"] = config["batch_size"]
+    estimator = tf.estimator.Estimator(
+        model_fn=model_fn, model_dir=FLAGS.model_dir, params=config_params,
+        config=tf.estimator.RunConfig(session_config=tf.ConfigProto(
+            intra_op_parallelism_threads=config["intra_op_threads"],
+            inter_op_parallelism_threads=config["inter_op_threads"])))
+    inputs = get_benchmark_inputs(
+        subtokenizer,
+        config["batch_size"] * (
+            FLAGS.benchmark_num_batches + FLAGS.benchmark_warmup_batches),
+        config["input_length"], FLAGS.file, seed=config_num)
+    metrics = benchmark_decoding(
+        estimator, inputs, config["batch_size"],
+        FLAGS.benchmark_warmup_batches)
+
+    tf.logging.info("Benchmark %d of %d: %s: %s" % (
+        config_num + 1, len(configs), config,
+        ", ".join("%s %.2f" % item for item in sorted(metrics.items()))))
+    for name, value in sorted(metrics.items()):
+      unit = "ms" if name.startswith("latency") else name.replace("_per_", "/")
+      benchmark_logger.log_metric(name, value, unit=unit, extras=config)
+
+
 def main(unused_argv):
   from official.transformer import transformer_main
+  from official.utils.logs import logger
 
   tf.logging.set_verbosity(tf.logging.INFO)
 
-  if FLAGS.text is None and FLAGS.file is None:
+  if not FLAGS.benchmark and FLAGS.text is None and FLAGS.file is None:
     tf.logging.warn("Nothing to translate. Make sure to call this script using "
                     "flags --text or --file.")
     return
@@ -173,19 +877,44 @@ def main(unused_argv):
   params["alpha"] = _ALPHA
   params["extra_decode_length"] = _EXTRA_DECODE_LENGTH
   params["batch_size"] = _DECODE_BATCH_SIZE
+  params["num_latent_samples"] = FLAGS.num_latent_samples
+  params["decoding_method"] = FLAGS.decoding_method
+  params["sampling_top_k"] = FLAGS.sampling_top_k
+  params["sampling_top_p"] = FLAGS.sampling_top_p
+  params["vocab_shortlist_size"] = FLAGS.vocab_shortlist_size
+  params["shortlist_source_tokens"] = FLAGS.shortlist_source_tokens
 
   # TC: set vocab_size as the number of tokens in vocab_file
   params["vocab_size"] = len(open(FLAGS.vocab_file).readlines())
   print('TC: vocab_size %d' % params["vocab_size"])
 
+  if FLAGS.benchmark:
+    with logger.benchmark_context(FLAGS):
+      run_benchmark(transformer_main.model_fn, params, subtokenizer,
+                    logger.get_benchmark_logger())
+    return
+
+  # The thread counts are set by translate_job.py for workers pinned to a
+  # group of cores. 0 lets TensorFlow choose.
+  session_config = tf.ConfigProto(
+      intra_op_parallelism_threads=FLAGS.intra_op_parallelism_threads,
+      inter_op_parallelism_threads=FLAGS.inter_op_parallelism_threads)
   estimator = tf.estimator.Estimator(
       model_fn=transformer_main.model_fn, model_dir=FLAGS.model_dir,
-      params=params)
+      params=params,
+      config=tf.estimator.RunConfig(session_config=session_config))
 
   if FLAGS.text is not None:
     tf.logging.info("Translating text: %s" % FLAGS.text)
     translate_text(estimator, subtokenizer, FLAGS.text)
 
+  tracer = None
+  profile_dir = None
+  if FLAGS.trace_file is not None:
+    tracer = tracing.Tracer(FLAGS.trace_sample_rate)
+    if FLAGS.trace_graph_ops:
+      profile_dir = os.path.dirname(os.path.abspath(FLAGS.trace_file))
+
   if FLAGS.file is not None:
     input_file = os.path.abspath(FLAGS.file)
     tf.logging.info("Translating file: %s" % input_file)
@@ -197,7 +926,19 @@ def main(unused_argv):
       output_file = os.path.abspath(FLAGS.file_out)
       tf.logging.info("File output specified: %s" % output_file)
 
-    translate_file(estimator, subtokenizer, input_file, output_file)
+    translate_file(estimator, subtokenizer, input_file, output_file,
+                   token_budget=FLAGS.decode_token_budget,
+                   window_size=FLAGS.decode_window_size,
+                   start_line=FLAGS.start_line,
+                   num_encode_workers=FLAGS.num_encode_workers,
+                   cache_file=FLAGS.response_cache_file,
+                   cache_size=FLAGS.response_cache_size,
+                   tracer=tracer, profile_dir=profile_dir)
+
+  if tracer is not None:
+    tracer.write_chrome_trace(FLAGS.trace_file)
+    tracer.log_summary(logger.config_benchmark_logger(FLAGS))
+    tf.logging.info("Wrote the timing trace to %s." % FLAGS.trace_file)
 
 
 def define_translate_flags():
@@ -238,6 +979,151 @@ def define_translate_flags():
       name="file_out", default=None,
       help=flags_core.help_wrap(
           "If --file flag is specified, save translation to this file."))
+  flags.DEFINE_integer(
+      name="decode_token_budget", short_name="dtb",
+      default=_DECODE_TOKEN_BUDGET,
+      help=flags_core.help_wrap(
+          "Maximum number of decoded tokens in a batch when translating a "
+          "file, counting the extra decode length and every beam of each "
+          "input. Inputs of similar lengths are batched together, so that "
+          "batches of short inputs hold more inputs."))
+  flags.DEFINE_integer(
+      name="decode_window_size", default=_DECODE_WINDOW_SIZE,
+      help=flags_core.help_wrap(
+          "Number of lines of --file that are sorted by length and translated "
+          "together. The translations of a window are written to --file_out "
+          "as soon as the window is translated."))
+  flags.DEFINE_integer(
+      name="start_line", default=0,
+      help=flags_core.help_wrap(
+          "Index of the first line of --file to translate. If positive, the "
+          "translations are appended to --file_out. To resume an interrupted "
+          "translation, set it to the number of lines of --file_out."))
+  flags.DEFINE_integer(
+      name="num_encode_workers", default=1,
+      help=flags_core.help_wrap(
+          "Number of processes encoding the lines of --file. If larger than 1, "
+          "the next window of lines is encoded in parallel while the current "
+          "one is translated."))
+  flags.DEFINE_string(
+      name="response_cache_file", default=None,
+      help=flags_core.help_wrap(
+          "If set, the translations of --file are stored in this SQLite file, "
+          "and inputs that were translated by the same checkpoint with the "
+          "same decoding flags in a previous run are not translated again."))
+  flags.DEFINE_integer(
+      name="response_cache_size", default=response_cache.MAX_ENTRIES,
+      help=flags_core.help_wrap(
+          "Maximum number of translations in --response_cache_file. The least "
+          "recently used translations are evicted first."))
+  flags.DEFINE_integer(
+      name="num_latent_samples", short_name="nls", default=1,
+      help=flags_core.help_wrap(
+          "Number of latent samples drawn for each input. A response is "
+          "generated for each sample, and the responses to an input are "
+          "separated by tabs."))
+  flags.DEFINE_enum(
+      name="decoding_method", short_name="dm", default="beam_search",
+      enum_values=["beam_search", "greedy", "top_k", "nucleus"],
+      help=flags_core.help_wrap(
+          "Method used to decode the responses. greedy, top_k and nucleus "
+          "decode a single sequence for each input without beams, choosing "
+          "the most probable token or sampling from the --sampling_top_k most "
+          "probable tokens or from the tokens within the --sampling_top_p "
+          "probability mass."))
+  flags.DEFINE_integer(
+      name="sampling_top_k", default=40,
+      help=flags_core.help_wrap(
+          "Number of most probable tokens sampled from with top_k decoding."))
+  flags.DEFINE_float(
+      name="sampling_top_p", default=0.9,
+      help=flags_core.help_wrap(
+          "Probability mass sampled from with nucleus decoding."))
+  flags.DEFINE_integer(
+      name="vocab_shortlist_size", short_name="vss", default=0,
+      help=flags_core.help_wrap(
+          "If positive, the decoder only computes the logits of this many "
+          "tokens for each input, chosen by the bag-of-words head of the "
+          "model. The logits of the whole vocabulary are computed if 0."))
+  flags.DEFINE_bool(
+      name="shortlist_source_tokens", default=True,
+      help=flags_core.help_wrap(
+          "Whether to always include the tokens of the input in the "
+          "vocabulary shortlist."))
+  flags.DEFINE_string(
+      name="trace_file", default=None,
+      help=flags_core.help_wrap(
+          "If set, the tokenization, queueing, session run, decoding steps and "
+          "detokenization of sampled batches of --file are written to this "
+          "Chrome trace-event JSON file, and their percentiles are logged "
+          "with the benchmark logger, e.g. to --benchmark_log_dir with "
+          "--benchmark_logger_type=BenchmarkFileLogger."))
+  flags.DEFINE_float(
+      name="trace_sample_rate", default=1.,
+      help=flags_core.help_wrap(
+          "Fraction of the windows and batches recorded in --trace_file. A "
+          "small rate keeps the overhead of tracing negligible."))
+  flags.DEFINE_bool(
+      name="trace_graph_ops", default=False,
+      help=flags_core.help_wrap(
+          "If set with --trace_file, the session runs of sampled batches are "
+          "also traced op by op, and their timelines are written next to "
+          "--trace_file, which splits the time of the encoder and of the "
+          "decoding loop. This slows the sampled batches down."))
+  flags.DEFINE_bool(
+      name="benchmark", default=False,
+      help=flags_core.help_wrap(
+          "If set, instead of translating, the decoding throughput and latency "
+          "are measured for each combination of the --benchmark_* lists, and "
+          "logged with the benchmark logger, e.g. as JSON to "
+          "--benchmark_log_dir with "
+          "--benchmark_logger_type=BenchmarkFileLogger. The inputs are random "
+          "ids, or lines sampled from --file if it is set."))
+  flags.DEFINE_list(
+      name="benchmark_batch_sizes", default=[str(_DECODE_BATCH_SIZE)],
+      help=flags_core.help_wrap("Batch sizes benchmarked with --benchmark."))
+  flags.DEFINE_list(
+      name="benchmark_beam_sizes", default=[str(_BEAM_SIZE)],
+      help=flags_core.help_wrap("Beam sizes benchmarked with --benchmark."))
+  flags.DEFINE_list(
+      name="benchmark_extra_decode_lengths",
+      default=[str(_EXTRA_DECODE_LENGTH)],
+      help=flags_core.help_wrap(
+          "Extra decode lengths benchmarked with --benchmark."))
+  flags.DEFINE_list(
+      name="benchmark_intra_op_threads", default=["0"],
+      help=flags_core.help_wrap(
+          "Intra-op thread counts benchmarked with --benchmark. 0 lets "
+          "TensorFlow choose."))
+  flags.DEFINE_list(
+      name="benchmark_inter_op_threads", default=["0"],
+      help=flags_core.help_wrap(
+          "Inter-op thread counts benchmarked with --benchmark. 0 lets "
+          "TensorFlow choose."))
+  flags.DEFINE_list(
+      name="benchmark_input_lengths", default=[str(_BENCHMARK_INPUT_LENGTH)],
+      help=flags_core.help_wrap(
+          "Input lengths benchmarked with --benchmark, counting EOS. Lines "
+          "sampled from --file have at most this many ids."))
+  flags.DEFINE_integer(
+      name="benchmark_num_batches", default=_BENCHMARK_NUM_BATCHES,
+      help=flags_core.help_wrap(
+          "Number of batches measured for each benchmark configuration."))
+  flags.DEFINE_integer(
+      name="benchmark_warmup_batches", default=_BENCHMARK_WARMUP_BATCHES,
+      help=flags_core.help_wrap(
+          "Number of batches translated before measuring each benchmark "
+          "configuration."))
+  flags_core.define_benchmark(bigquery_uploader=False)
+  flags_core.define_performance(
+      num_parallel_calls=False,
+      inter_op=True,
+      intra_op=True,
+      synthetic_data=False,
+      max_train_steps=False,
+      dtype=False,
+      all_reduce_alg=False
+  )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,331 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Translate a file with several translate.py processes, each on its own cores.
+
+The input file is split into shards of consecutive lines, which are translated
+by --num_workers translate.py processes at a time. Each worker is pinned to a
+group of cores, and its session uses as many intra-op threads as the group has
+cores. The matrices of the decoding steps are small, so several sessions with a
+few threads each decode faster than one session using all the cores.
+
+Shards whose worker fails are retried up to --max_attempts times. The
+translations of the shards are merged in the order of the input file. If
+--work_dir is set, the shards translated by a previous run in that directory
+are not translated again.
+
+All the flags of translate.py, except those set for each shard, are passed to
+the workers. If --trace_file is set, each worker writes the timing trace of its
+shard next to the translations of the shard.
+
+Example:
+  python translate_job.py --model_dir=/tmp/transformer_model \
+      --vocab_file=/tmp/data/vocab.txt --param_set=big --file=test.in \
+      --file_out=test.res --num_workers=8
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# pylint: disable=g-bad-import-order
+from absl import app as absl_app
+from absl import flags
+import tensorflow as tf
+# pylint: enable=g-bad-import-order
+
+from official.transformer import translate
+from official.utils.flags import core as flags_core
+
+_SHARDS_PER_WORKER = 4
+_MAX_ATTEMPTS = 3
+_POLL_SECS = 1.
+# Flags of translate.py that are set for each shard.
+_SHARD_FLAGS = ("text", "file", "file_out", "start_line", "trace_file",
+                "intra_op_parallelism_threads", "inter_op_parallelism_threads")
+
+
+class Shard(object):
+  """Consecutive lines of the input file, translated by a worker process."""
+
+  def __init__(self, index, input_file, output_file, num_lines):
+    self.index = index
+    self.input_file = input_file
+    self.output_file = output_file
+    self.num_lines = num_lines
+    self.attempts = 0
+
+  @property
+  def log_file(self):
+    return self.output_file + ".log"
+
+  def done(self):
+    """Whether every line of the shard has been translated."""
+    return (tf.gfile.Exists(self.output_file) and
+            _count_lines(self.output_file) == self.num_lines)
+
+
+def _count_lines(filename):
+  with tf.gfile.Open(filename) as f:
+    return sum(1 for _ in f)
+
+
+def split_file(input_file, shard_dir, num_shards):
+  """Split a file into shards of consecutive lines.
+
+  Args:
+    input_file: file to split.
+    shard_dir: directory in which the shard files are written.
+    num_shards: number of shards. There are fewer shards if the file has fewer
+      lines.
+
+  Returns:
+    List of Shards, in the order of the input file.
+  """
+  num_lines = _count_lines(input_file)
+  num_shards = max(1, min(num_shards, num_lines))
+  shards = []
+  with tf.gfile.Open(input_file) as f:
+    for index in range(num_shards):
+      # The first num_lines % num_shards shards have one more line.
+      shard_lines = num_lines // num_shards + (index < num_lines % num_shards)
+      shard = Shard(index, os.path.join(shard_dir, "shard-%05d.in" % index),
+                    os.path.join(shard_dir, "shard-%05d.out" % index),
+                    shard_lines)
+      with tf.gfile.Open(shard.input_file, "w") as shard_f:
+        for _ in range(shard_lines):
+          shard_f.write(f.readline())
+      shards.append(shard)
+  return shards
+
+
+def merge_outputs(shards, output_file):
+  """Concatenate the outputs of the shards into output_file."""
+  with tf.gfile.Open(output_file, "w") as f:
+    for shard in shards:
+      with tf.gfile.Open(shard.output_file) as shard_f:
+        shutil.copyfileobj(shard_f, f)
+
+
+def get_available_cores():
+  """Return the cores this process may run on."""
+  if hasattr(os, "sched_getaffinity"):
+    return sorted(os.sched_getaffinity(0))
+  return list(range(multiprocessing.cpu_count()))
+
+
+def get_core_groups(num_workers, cores=None):
+  """Split cores into num_workers groups of consecutive cores.
+
+  Args:
+    num_workers: number of groups.
+    cores: list of core ids. Defaults to the available cores.
+
+  Returns:
+    List of num_workers lists of core ids, whose sizes differ by at most one.
+
+  Raises:
+    ValueError: if there are fewer cores than workers.
+  """
+  if cores is None:
+    cores = get_available_cores()
+  if num_workers > len(cores):
+    raise ValueError("Cannot run %d workers on %d cores." %
+                     (num_workers, len(cores)))
+  groups = []
+  start = 0
+  for index in range(num_workers):
+    end = start + len(cores) // num_workers + (
+        index < len(cores) % num_workers)
+    groups.append(cores[start:end])
+    start = end
+  return groups
+
+
+def get_thread_counts(num_cores):
+  """Return the intra-op and inter-op thread counts of a worker's session.
+
+  The ops of the decoding steps run one after another, so intra-op threads use
+  all the cores of the worker. A second inter-op thread lets the input pipeline
+  prepare the next batch while the current one is decoded.
+  """
+  return num_cores, min(2, num_cores)
+
+
+def _start_worker(command, cores, log_file):
+  """Start a worker process pinned to cores, writing its output to log_file."""
+  env = dict(os.environ)
+  # Also limit the threads of OpenMP, which MKL builds of TensorFlow use.
+  env["OMP_NUM_THREADS"] = str(len(cores))
+
+  def pin_to_cores():
+    os.sched_setaffinity(0, cores)
+
+  with open(log_file, "w") as log:
+    return subprocess.Popen(
+        command, env=env, stdout=log, stderr=subprocess.STDOUT,
+        preexec_fn=pin_to_cores if hasattr(os, "sched_setaffinity") else None)
+
+
+def run_shards(shards, command_fn, core_groups, max_attempts=_MAX_ATTEMPTS,
+               poll_secs=_POLL_SECS):
+  """Translate shards with a worker process on each group of cores.
+
+  Shards that are already done are skipped. A shard is retried if its worker
+  exits with an error, or does not translate all its lines.
+
+  Args:
+    shards: list of Shards.
+    command_fn: function taking a Shard and a list of core ids, and returning
+      the command of the worker translating the shard on these cores.
+    core_groups: list of lists of core ids. A worker is run on each group.
+    max_attempts: maximum number of times a shard is translated.
+    poll_secs: time between two checks of the running workers.
+
+  Raises:
+    RuntimeError: if some shards failed max_attempts times. The other shards
+      are translated first.
+  """
+  pending = collections.deque(shard for shard in shards if not shard.done())
+  tf.logging.info("Translating %d shards, %d of which are already done." %
+                  (len(shards), len(shards) - len(pending)))
+  free_groups = collections.deque(core_groups)
+  running = {}  # Maps worker processes to their shard and core group.
+  failed = []
+  while pending or running:
+    while pending and free_groups:
+      shard = pending.popleft()
+      cores = free_groups.popleft()
+      shard.attempts += 1
+      tf.logging.info("Translating shard %d on cores %s (attempt %d)." %
+                      (shard.index, cores, shard.attempts))
+      process = _start_worker(command_fn(shard, cores), cores, shard.log_file)
+      running[process] = (shard, cores)
+
+    time.sleep(poll_secs)
+    for process, (shard, cores) in list(running.items()):
+      returncode = process.poll()
+      if returncode is None:
+        continue
+      del running[process]
+      free_groups.append(cores)
+      if returncode == 0 and shard.done():
+        tf.logging.info("Translated shard %d." % shard.index)
+        continue
+      tf.logging.warn("Shard %d failed with exit code %d, see %s." %
+                      (shard.index, returncode, shard.log_file))
+      if shard.attempts < max_attempts:
+        pending.append(shard)
+      else:
+        failed.append(shard)
+
+  if failed:
+    raise RuntimeError("Shards %s failed %d times." % (
+        ", ".join(str(shard.index) for shard in failed), max_attempts))
+
+
+def _get_translate_args(translate_flag_names):
+  """Return the command-line arguments of the translate.py flags to forward."""
+  args = []
+  for name in sorted(translate_flag_names):
+    flag = FLAGS[name]
+    # Skip the short names, and the flags that were not set.
+    if flag.name == name and flag.present and name not in _SHARD_FLAGS:
+      args.append(flag.serialize())
+  return args
+
+
+def main(unused_argv):
+  tf.logging.set_verbosity(tf.logging.INFO)
+
+  if FLAGS.file is None or FLAGS.file_out is None:
+    raise ValueError("--file and --file_out must be set.")
+
+  work_dir = FLAGS.work_dir or tempfile.mkdtemp()
+  tf.gfile.MakeDirs(work_dir)
+  core_groups = get_core_groups(FLAGS.num_workers)
+  num_shards = FLAGS.num_shards or FLAGS.num_workers * _SHARDS_PER_WORKER
+  shards = split_file(FLAGS.file, work_dir, num_shards)
+
+  translate_args = _get_translate_args(TRANSLATE_FLAG_NAMES)
+
+  def command_fn(shard, cores):
+    intra_op_threads, inter_op_threads = get_thread_counts(len(cores))
+    command = [
+        sys.executable, "-m", "official.transformer.translate",
+        "--file=%s" % shard.input_file, "--file_out=%s" % shard.output_file,
+        "--intra_op_parallelism_threads=%d" % intra_op_threads,
+        "--inter_op_parallelism_threads=%d" % inter_op_threads,
+    ]
+    if FLAGS.trace_file:
+      command.append("--trace_file=%s.trace.json" % shard.output_file)
+    return command + translate_args
+
+  start = time.time()
+  run_shards(shards, command_fn, core_groups, FLAGS.max_attempts)
+  merge_outputs(shards, FLAGS.file_out)
+  tf.logging.info("Translated %d shards with %d workers in %.1f seconds." %
+                  (len(shards), len(core_groups), time.time() - start))
+  if not FLAGS.work_dir:
+    tf.gfile.DeleteRecursively(work_dir)
+
+
+def define_translate_job_flags():
+  """Define the flags of the job runner, in addition to those of translate.py.
+
+  Returns:
+    Set of the names of the translate.py flags.
+  """
+  defined_flags = set(flags.FLAGS)
+  translate.define_translate_flags()
+  translate_flag_names = set(flags.FLAGS) - defined_flags
+
+  flags.DEFINE_integer(
+      name="num_workers", default=1,
+      help=flags_core.help_wrap(
+          "Number of translate.py processes run at the same time. The "
+          "available cores are split between them."))
+  flags.DEFINE_integer(
+      name="num_shards", default=None,
+      help=flags_core.help_wrap(
+          "Number of shards of --file. Defaults to %d per worker, so that the "
+          "workers finish at about the same time." % _SHARDS_PER_WORKER))
+  flags.DEFINE_integer(
+      name="max_attempts", default=_MAX_ATTEMPTS,
+      help=flags_core.help_wrap(
+          "Maximum number of times a shard is translated, if its worker "
+          "fails."))
+  flags.DEFINE_string(
+      name="work_dir", default=None,
+      help=flags_core.help_wrap(
+          "Directory of the shards, their translations and the logs of the "
+          "workers. If set, it is kept after the job, and the shards it "
+          "already holds translations of are not translated again. Otherwise "
+          "a temporary directory is used."))
+  return translate_flag_names
+
+
+if __name__ == "__main__":
+  TRANSLATE_FLAG_NAMES = define_translate_job_flags()
+  FLAGS = flags.FLAGS
+  absl_app.run(main)
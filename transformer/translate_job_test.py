@@ -0,0 +1,108 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Test the sharding, retries and merging of translate_job."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+
+import tensorflow as tf  # pylint: disable=g-bad-import-order
+
+from official.transformer import translate_job
+
+# Worker copying its input file to its output file in upper case. It fails the
+# first time it is run for a shard if argv[3] is set.
+_WORKER_SCRIPT = """
+import os, sys
+input_file, output_file, fail_once = sys.argv[1:]
+marker = output_file + ".failed"
+if fail_once == "1" and not os.path.exists(marker):
+  open(marker, "w").close()
+  open(output_file, "w").write("partial\\n")
+  sys.exit(1)
+open(output_file, "w").write(open(input_file).read().upper())
+"""
+
+
+class TranslateJobTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(TranslateJobTest, self).setUp()
+    self.work_dir = self.get_temp_dir()
+    self.input_file = os.path.join(self.work_dir, "input")
+    self.lines = ["line %d\n" % i for i in range(10)]
+    with tf.gfile.Open(self.input_file, "w") as f:
+      f.write("".join(self.lines))
+
+  def _run_job(self, num_shards, fail_once=False, max_attempts=2):
+    shards = translate_job.split_file(
+        self.input_file, self.work_dir, num_shards)
+
+    def command_fn(shard, cores):
+      del cores  # Unused
+      return [sys.executable, "-c", _WORKER_SCRIPT, shard.input_file,
+              shard.output_file, "1" if fail_once else "0"]
+
+    translate_job.run_shards(
+        shards, command_fn, translate_job.get_core_groups(1), max_attempts,
+        poll_secs=0.01)
+    output_file = os.path.join(self.work_dir, "output")
+    translate_job.merge_outputs(shards, output_file)
+    with tf.gfile.Open(output_file) as f:
+      return shards, f.read()
+
+  def test_split_file(self):
+    shards = translate_job.split_file(self.input_file, self.work_dir, 4)
+    self.assertEqual([3, 3, 2, 2], [shard.num_lines for shard in shards])
+    lines = []
+    for shard in shards:
+      with tf.gfile.Open(shard.input_file) as f:
+        lines.extend(f.readlines())
+    self.assertEqual(self.lines, lines)
+
+    # There are no empty shards.
+    self.assertEqual(
+        10, len(translate_job.split_file(self.input_file, self.work_dir, 20)))
+
+  def test_get_core_groups(self):
+    self.assertEqual([[0, 1, 2], [3, 4], [5, 6]],
+                     translate_job.get_core_groups(3, list(range(7))))
+    self.assertEqual((4, 2), translate_job.get_thread_counts(4))
+    with self.assertRaises(ValueError):
+      translate_job.get_core_groups(3, [0, 1])
+
+  def test_run_shards(self):
+    _, output = self._run_job(3)
+    self.assertEqual("".join(self.lines).upper(), output)
+
+  def test_retry_failed_shards(self):
+    shards, output = self._run_job(3, fail_once=True)
+    self.assertEqual("".join(self.lines).upper(), output)
+    self.assertEqual([2, 2, 2], [shard.attempts for shard in shards])
+
+    # The shards are done, so they are not translated again.
+    shards, _ = self._run_job(3)
+    self.assertEqual([0, 0, 0], [shard.attempts for shard in shards])
+
+  def test_failed_shards(self):
+    with self.assertRaises(RuntimeError):
+      self._run_job(2, fail_once=True, max_attempts=1)
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -0,0 +1,276 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Test translation helper methods."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import json
+import os
+
+import tensorflow as tf  # pylint: disable=g-bad-import-order
+
+from official.transformer import translate
+from official.transformer.model import model_params
+from official.transformer.utils import tokenizer
+from official.transformer.utils import tracing
+
+
+class _EchoEstimator(object):
+  """Estimator whose predicted outputs are its inputs."""
+
+  def __init__(self):
+    self.params = model_params.BASE_PARAMS.copy()
+    self.config = tf.estimator.RunConfig()
+    self.batch_sizes = []
+
+  def latest_checkpoint(self):
+    return "echo"
+
+  def predict(self, input_fn, hooks=None, yield_single_examples=True):
+    hooks = hooks or []
+    with tf.Graph().as_default():
+      next_batch = input_fn().make_one_shot_iterator().get_next()
+      with tf.Session() as sess:
+        while True:
+          for hook in hooks:
+            hook.before_run(None)
+          try:
+            batch = sess.run(next_batch)
+          except tf.errors.OutOfRangeError:
+            return
+          for hook in hooks:
+            hook.after_run(None, tf.train.SessionRunValues(
+                results=None, options=None, run_metadata=tf.RunMetadata()))
+          self.batch_sizes.append(len(batch))
+          if not yield_single_examples:
+            yield {"outputs": batch}
+            continue
+          for outputs in batch:
+            yield {"outputs": outputs}
+
+
+class BatchSizesTest(tf.test.TestCase):
+
+  def test_batches_fit_token_budget(self):
+    # Buckets are [0, 8), [8, 9), ..., [12, 13), ..., [18, 19) and [19, 21).
+    lengths = [20, 19, 12, 12, 12, 5, 5, 5, 5, 5, 4]
+    batch_sizes = translate._get_batch_sizes(
+        lengths, token_budget=64, extra_decode_length=0, num_beams=2)
+
+    # Batches hold 64 // (2 * bucket max) inputs of the same bucket.
+    self.assertEqual([1, 1, 2, 1, 4, 2], batch_sizes)
+
+  def test_extra_decode_length(self):
+    batch_sizes = translate._get_batch_sizes(
+        [3] * 10, token_budget=100, extra_decode_length=21, num_beams=1)
+
+    self.assertEqual([4, 4, 2], batch_sizes)
+
+  def test_no_inputs(self):
+    self.assertEqual([], translate._get_batch_sizes([], 100, 0, 1))
+
+  def test_batch_window(self):
+    encoded_inputs = [[5, 6, 7, 1], [5, 6, 1], [7, 1], [6, 1], [1]]
+    arrays = translate._get_window_arrays(encoded_inputs, [2, 3])
+    next_batch = translate._batch_window(
+        *arrays).make_one_shot_iterator().get_next()
+    with self.test_session() as sess:
+      self.assertAllEqual([[5, 6, 7, 1], [5, 6, 1, 0]], sess.run(next_batch))
+      self.assertAllEqual([[7, 1], [6, 1], [1, 0]], sess.run(next_batch))
+      with self.assertRaises(tf.errors.OutOfRangeError):
+        sess.run(next_batch)
+
+
+class TranslateFileTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(TranslateFileTest, self).setUp()
+    temp_dir = self.get_temp_dir()
+    vocab_file = os.path.join(temp_dir, "vocab")
+    with tf.gfile.Open(vocab_file, "w") as f:
+      for subtoken in ["a_", "b_", "c_"]:
+        f.write("'%s'\n" % subtoken)
+    self.subtokenizer = tokenizer.Subtokenizer(vocab_file)
+
+    self.lines = ["a", "b c a", "c", "a b", "b b b b", "c a", "a", "c"]
+    self.input_file = os.path.join(temp_dir, "input")
+    with tf.gfile.Open(self.input_file, "w") as f:
+      f.write("\n".join(self.lines) + "\n")
+    self.output_file = os.path.join(temp_dir, "output")
+
+  def _read_output(self):
+    with tf.gfile.Open(self.output_file) as f:
+      return f.read().split("\n")[:-1]
+
+  def test_translations_keep_order(self):
+    estimator = _EchoEstimator()
+    translate.translate_file(
+        estimator, self.subtokenizer, self.input_file, self.output_file,
+        print_all_translations=False, window_size=4)
+
+    self.assertEqual(self.lines, self._read_output())
+
+  def test_encode_workers(self):
+    estimator = _EchoEstimator()
+    translate.translate_file(
+        estimator, self.subtokenizer, self.input_file, self.output_file,
+        print_all_translations=False, window_size=4, num_encode_workers=2)
+
+    self.assertEqual(self.lines, self._read_output())
+
+  def test_resume(self):
+    estimator = _EchoEstimator()
+    with tf.gfile.Open(self.output_file, "w") as f:
+      f.write("\n".join(self.lines[:3]) + "\n")
+    translate.translate_file(
+        estimator, self.subtokenizer, self.input_file, self.output_file,
+        print_all_translations=False, window_size=2, start_line=3)
+
+    self.assertEqual(self.lines, self._read_output())
+    self.assertEqual(5, sum(estimator.batch_sizes))
+
+  def test_duplicate_inputs(self):
+    estimator = _EchoEstimator()
+    translate.translate_file(
+        estimator, self.subtokenizer, self.input_file, self.output_file,
+        print_all_translations=False)
+
+    self.assertEqual(self.lines, self._read_output())
+    self.assertEqual(6, sum(estimator.batch_sizes))
+
+  def test_response_cache(self):
+    cache_file = os.path.join(self.get_temp_dir(), "cache.db")
+    if os.path.exists(cache_file):
+      os.remove(cache_file)
+    translate.translate_file(
+        _EchoEstimator(), self.subtokenizer, self.input_file, self.output_file,
+        print_all_translations=False, window_size=4, cache_file=cache_file)
+
+    # All inputs were cached by the first run, so none is decoded again.
+    estimator = _EchoEstimator()
+    translate.translate_file(
+        estimator, self.subtokenizer, self.input_file, self.output_file,
+        print_all_translations=False, window_size=4, cache_file=cache_file)
+
+    self.assertEqual(self.lines, self._read_output())
+    self.assertEqual([], estimator.batch_sizes)
+
+  def test_trace(self):
+    estimator = _EchoEstimator()
+    tracer = tracing.Tracer()
+    translate.translate_file(
+        estimator, self.subtokenizer, self.input_file, self.output_file,
+        print_all_translations=False, window_size=4, tracer=tracer)
+    self.assertEqual(self.lines, self._read_output())
+
+    trace_file = os.path.join(self.get_temp_dir(), "trace.json")
+    tracer.write_chrome_trace(trace_file)
+    with tf.gfile.Open(trace_file) as f:
+      events = json.load(f)["traceEvents"]
+    spans = collections.Counter(
+        event["name"] for event in events if event["ph"] == "X")
+    num_batches = len(estimator.batch_sizes)
+    self.assertEqual(2, spans["tokenize"])
+    self.assertEqual(num_batches, spans["queue"])
+    self.assertEqual(num_batches, spans["session_run"])
+    self.assertEqual(num_batches, spans["detokenize"])
+
+    # The echoed outputs have the length of the padded inputs, so the decoding
+    # stopped before the maximum length.
+    for event in events:
+      if event["name"] == "session_run":
+        self.assertTrue(event["args"]["stopped_early"])
+        self.assertEqual(event["args"]["input_length"],
+                         event["args"]["decode_steps"])
+    self.assertIn(50, tracer.percentiles()["session_run"])
+
+  def test_trace_sampling(self):
+    tracer = tracing.Tracer(sample_rate=0.)
+    translate.translate_file(
+        _EchoEstimator(), self.subtokenizer, self.input_file, self.output_file,
+        print_all_translations=False, window_size=4, tracer=tracer)
+    self.assertEqual(self.lines, self._read_output())
+    self.assertEqual({}, tracer.percentiles())
+
+
+class BenchmarkTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(BenchmarkTest, self).setUp()
+    temp_dir = self.get_temp_dir()
+    vocab_file = os.path.join(temp_dir, "vocab")
+    with tf.gfile.Open(vocab_file, "w") as f:
+      for subtoken in ["a_", "b_", "c_"]:
+        f.write("'%s'\n" % subtoken)
+    self.subtokenizer = tokenizer.Subtokenizer(vocab_file)
+
+  def test_synthetic_inputs(self):
+    inputs = translate.get_benchmark_inputs(self.subtokenizer, 10, 5, seed=1)
+    self.assertEqual([5] * 10, [len(ids) for ids in inputs])
+    for ids in inputs:
+      self.assertEqual(tokenizer.EOS_ID, ids[-1])
+      self.assertTrue(all(tokenizer.EOS_ID < i < self.subtokenizer.vocab_size
+                          for i in ids[:-1]))
+    # The inputs are the same for the same seed.
+    self.assertEqual(inputs, translate.get_benchmark_inputs(
+        self.subtokenizer, 10, 5, seed=1))
+
+  def test_sampled_inputs(self):
+    input_file = os.path.join(self.get_temp_dir(), "input")
+    with tf.gfile.Open(input_file, "w") as f:
+      f.write("a\nb c a\nc a\n")
+    inputs = translate.get_benchmark_inputs(
+        self.subtokenizer, 20, 3, input_file=input_file)
+    self.assertEqual(20, len(inputs))
+    self.assertLessEqual(max(len(ids) for ids in inputs), 3)
+
+    with self.assertRaises(ValueError):
+      translate.get_benchmark_inputs(
+          self.subtokenizer, 20, 1, input_file=input_file)
+
+  def test_benchmark_decoding(self):
+    estimator = _EchoEstimator()
+    inputs = translate.get_benchmark_inputs(self.subtokenizer, 14, 4)
+    metrics = translate.benchmark_decoding(
+        estimator, inputs, batch_size=3, num_warmup_batches=1)
+
+    # The 14 inputs make 4 full batches, of which 3 are measured.
+    self.assertEqual([3] * 4, estimator.batch_sizes)
+    self.assertEqual(
+        ["latency_p50", "latency_p90", "latency_p99", "sentences_per_sec",
+         "tokens_per_sec"], sorted(metrics))
+    # The echoed outputs have 3 ids before EOS.
+    self.assertAllClose(3 * metrics["sentences_per_sec"],
+                        metrics["tokens_per_sec"])
+
+    with self.assertRaises(ValueError):
+      translate.benchmark_decoding(
+          _EchoEstimator(), inputs, batch_size=7, num_warmup_batches=2)
+
+  def test_benchmark_configs(self):
+    configs = translate.get_benchmark_configs(
+        [8, 16], [1, 4], [50], [(1, 1), (4, 2)], [32])
+    self.assertEqual(8, len(configs))
+    self.assertEqual(
+        {"batch_size": 8, "beam_size": 1, "extra_decode_length": 50,
+         "intra_op_threads": 1, "inter_op_threads": 1, "input_length": 32},
+        configs[0])
+
+
+if __name__ == "__main__":
+  tf.test.main()
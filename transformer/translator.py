@@ -0,0 +1,232 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Translate strings with a model that is kept loaded between requests.
+
+Unlike translate.translate_text, which builds the graph and restores the
+checkpoint each time it is called, a Translator builds the prediction graph
+once and keeps its session open. Requests from several threads are queued, and
+a worker thread translates them together in padded batches.
+
+Example:
+  translator = Translator(transformer_main.model_fn, params, model_dir,
+                          subtokenizer)
+  translator.warm_up()
+  response = translator.translate("how are you?")
+  translator.shutdown()
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+import time
+
+# pylint: disable=g-bad-import-order
+from six.moves import queue
+import tensorflow as tf
+# pylint: enable=g-bad-import-order
+
+from official.transformer import translate
+from official.transformer.utils import inference_checkpoint
+
+_MAX_BATCH_SIZE = 32
+_MAX_WAIT_SECS = 0.01
+
+
+class _Request(object):
+  """A string to translate, and its responses once it is done."""
+
+  def __init__(self, txt):
+    self.txt = txt
+    self.responses = None
+    self.error = None
+    self.done = threading.Event()
+
+
+class Translator(object):
+  """Translates strings with a prediction graph built once.
+
+  Requests are grouped into batches of up to max_batch_size strings. A batch is
+  translated as soon as it is full, or max_wait_secs after its first request
+  was received. The strings passed to translate_batch are queued together, so
+  that they are translated in as few batches as possible.
+  """
+
+  def __init__(self, model_fn, params, model_dir, subtokenizer,
+               max_batch_size=_MAX_BATCH_SIZE, max_wait_secs=_MAX_WAIT_SECS):
+    """Build the prediction graph and restore the latest checkpoint.
+
+    Args:
+      model_fn: Model function of the estimator, e.g. transformer_main.model_fn.
+      params: hyperparameter object passed to model_fn.
+      model_dir: directory containing the model checkpoints.
+      subtokenizer: Subtokenizer object for encoding and decoding source and
+        translated strings.
+      max_batch_size: maximum number of strings translated together.
+      max_wait_secs: maximum time waited for more requests before translating
+        a batch that is not full.
+
+    Raises:
+      ValueError: if there is no checkpoint in model_dir.
+    """
+    self.subtokenizer = subtokenizer
+    self.max_batch_size = max_batch_size
+    self.max_wait_secs = max_wait_secs
+
+    checkpoint_path = tf.train.latest_checkpoint(model_dir)
+    if checkpoint_path is None:
+      raise ValueError("No checkpoint found in %s." % model_dir)
+
+    self._graph = tf.Graph()
+    with self._graph.as_default():
+      tf.train.get_or_create_global_step()
+      self._inputs = tf.placeholder(tf.int64, [None, None], name="inputs")
+      estimator_spec = model_fn(
+          self._inputs, None, tf.estimator.ModeKeys.PREDICT, params)
+      self._predictions = estimator_spec.predictions
+      self._session = tf.Session()
+      inference_checkpoint.Saver().restore(self._session, checkpoint_path)
+    self._graph.finalize()
+    tf.logging.info("Restored model from %s." % checkpoint_path)
+
+    self._queue = queue.Queue()
+    # Guards _stopped, so that no request is queued after the shutdown marker.
+    self._lock = threading.Lock()
+    self._stopped = False
+    self._worker = threading.Thread(target=self._run_worker)
+    self._worker.daemon = True
+    self._worker.start()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.shutdown()
+
+  def warm_up(self, batch_sizes=(1,)):
+    """Translate dummy batches, so that the first requests are not slowed down.
+
+    The first runs of the graph allocate memory and choose kernels for the input
+    shapes.
+
+    Args:
+      batch_sizes: sizes of the dummy batches to translate.
+    """
+    for batch_size in batch_sizes:
+      start = time.time()
+      self.translate_batch(["hello"] * batch_size)
+      tf.logging.info("Warmed up batch size %d in %.3f seconds." %
+                      (batch_size, time.time() - start))
+
+  def translate(self, txt):
+    """Translate a single string, waiting for the translation.
+
+    May be called from several threads at the same time.
+    """
+    request, = self._submit([txt])
+    return "\t".join(self._wait(request))
+
+  def translate_batch(self, txts, all_responses=False):
+    """Translate a list of strings, returning the translations in order.
+
+    Args:
+      txts: list of strings to translate.
+      all_responses: If true, the translation of each string is the list of the
+        responses generated for each latent sample. Otherwise, the responses
+        are separated by tabs, as in translate.py.
+
+    Returns:
+      List of translations.
+    """
+    requests = self._submit(txts)
+    translations = [self._wait(request) for request in requests]
+    if all_responses:
+      return translations
+    return ["\t".join(responses) for responses in translations]
+
+  def shutdown(self):
+    """Translate the queued requests, then stop the worker and the session."""
+    with self._lock:
+      if self._stopped:
+        return
+      self._stopped = True
+      self._queue.put(None)
+    self._worker.join()
+    self._session.close()
+
+  def _submit(self, txts):
+    requests = [_Request(txt) for txt in txts]
+    with self._lock:
+      if self._stopped:
+        raise RuntimeError("Translator has been shut down.")
+      self._queue.put(requests)
+    return requests
+
+  def _wait(self, request):
+    request.done.wait()
+    if request.error is not None:
+      raise request.error
+    return request.responses
+
+  def _run_worker(self):
+    """Translate batches of queued requests until shutdown is called."""
+    stopped = False
+    while not stopped:
+      requests = self._queue.get()
+      if requests is None:
+        break
+      deadline = time.time() + self.max_wait_secs
+      while len(requests) < self.max_batch_size:
+        try:
+          more_requests = self._queue.get(
+              timeout=max(0, deadline - time.time()))
+        except queue.Empty:
+          break
+        if more_requests is None:
+          stopped = True
+          break
+        requests = requests + more_requests
+      for i in range(0, len(requests), self.max_batch_size):
+        self._translate_requests(requests[i:i + self.max_batch_size])
+
+  def _translate_requests(self, requests):
+    """Translate a batch of requests, and notify the waiting threads."""
+    try:
+      for request, responses in zip(
+          requests, self._translate([r.txt for r in requests])):
+        request.responses = responses
+    except Exception as e:  # pylint: disable=broad-except
+      for request in requests:
+        request.error = e
+    for request in requests:
+      request.done.set()
+
+  def _translate(self, txts):
+    """Run the prediction graph on a padded batch of strings.
+
+    Returns:
+      The list of responses to each string.
+    """
+    encoded = [translate._encode_and_add_eos(txt, self.subtokenizer)  # pylint: disable=protected-access
+               for txt in txts]
+    inputs = translate._pad_batch(encoded)  # pylint: disable=protected-access
+
+    predictions = self._session.run(
+        self._predictions, feed_dict={self._inputs: inputs})
+    return [
+        translate._decode_responses(  # pylint: disable=protected-access
+            {k: v[i] for k, v in predictions.items()}, self.subtokenizer)
+        for i in range(len(txts))]
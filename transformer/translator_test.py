@@ -0,0 +1,120 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Test the Translator, with a model that echoes its inputs."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import threading
+
+import tensorflow as tf  # pylint: disable=g-bad-import-order
+
+from official.transformer import translator
+from official.transformer.utils import tokenizer
+
+
+def _echo_model_fn(features, labels, mode, params):
+  """Model function whose outputs are its inputs."""
+  del labels, params  # Unused
+  offset = tf.get_variable("offset", [], tf.int64,
+                           initializer=tf.zeros_initializer())
+  return tf.estimator.EstimatorSpec(
+      mode, predictions={"outputs": features + offset})
+
+
+class TranslatorTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(TranslatorTest, self).setUp()
+    temp_dir = self.get_temp_dir()
+    vocab_file = os.path.join(temp_dir, "vocab")
+    with tf.gfile.Open(vocab_file, "w") as f:
+      for subtoken in ["hello_", "how_", "are_", "you_"]:
+        f.write("'%s'\n" % subtoken)
+    self.subtokenizer = tokenizer.Subtokenizer(vocab_file)
+
+    self.model_dir = os.path.join(temp_dir, "model")
+    with tf.Graph().as_default():
+      _echo_model_fn(tf.zeros([1, 1], tf.int64), None, None, None)
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        tf.train.Saver().save(sess, os.path.join(self.model_dir, "model.ckpt"))
+
+  def _init_translator(self, **kwargs):
+    return translator.Translator(
+        _echo_model_fn, {}, self.model_dir, self.subtokenizer, **kwargs)
+
+  def test_translate(self):
+    with self._init_translator() as t:
+      t.warm_up(batch_sizes=(1, 2))
+      self.assertEqual("how are you", t.translate("how are you"))
+      self.assertEqual(["hello", "how are you"],
+                       t.translate_batch(["hello", "how are you"]))
+      self.assertEqual([["hello"], ["you"]],
+                       t.translate_batch(["hello", "you"], all_responses=True))
+
+  def test_concurrent_requests(self):
+    txts = ["hello", "how are you", "are you", "you"] * 5
+    translations = [None] * len(txts)
+
+    with self._init_translator(max_batch_size=3, max_wait_secs=0.05) as t:
+      def translate_fn(i):
+        translations[i] = t.translate(txts[i])
+      threads = [threading.Thread(target=translate_fn, args=(i,))
+                 for i in range(len(txts))]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+
+    self.assertEqual(txts, translations)
+
+  def test_shutdown(self):
+    t = self._init_translator()
+    t.shutdown()
+    with self.assertRaises(RuntimeError):
+      t.translate("hello")
+
+  def test_submit_during_shutdown(self):
+    t = self._init_translator(max_wait_secs=0.05)
+    results = []
+
+    def translate_fn():
+      # Each request is either translated or rejected, never left waiting.
+      try:
+        results.append(t.translate("hello"))
+      except RuntimeError:
+        results.append(None)
+    threads = [threading.Thread(target=translate_fn) for _ in range(20)]
+    for thread in threads:
+      thread.start()
+    t.shutdown()
+    t.shutdown()
+    for thread in threads:
+      thread.join()
+
+    self.assertEqual(20, len(results))
+    self.assertTrue(set(results).issubset(["hello", None]))
+
+  def test_missing_checkpoint(self):
+    with self.assertRaises(ValueError):
+      translator.Translator(_echo_model_fn, {}, self.get_temp_dir() + "/none",
+                            self.subtokenizer)
+
+
+if __name__ == "__main__":
+  tf.test.main()
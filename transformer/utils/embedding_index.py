@@ -0,0 +1,371 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Nearest neighbour search over memory-mapped sentence embeddings.
+
+An index directory holds the L2-normalized embeddings of a corpus of responses
+in a float32 or float16 .npy matrix, which is memory-mapped so that corpora
+larger than memory can be searched, and the responses with their offsets.
+
+top_k finds the rows with the largest inner products with each query (the
+cosine similarity of normalized embeddings) one block of rows at a time, with a
+matrix product and argpartition. For larger corpora, a ProductQuantizer
+compresses each embedding to one byte per subspace, and searches the codes
+with lookup tables of the query subvectors.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+import os
+import threading
+
+import numpy as np
+
+EMBEDDINGS_FILE = "embeddings.npy"
+RESPONSES_FILE = "responses.txt"
+OFFSETS_FILE = "response_offsets.npy"
+PQ_CODEBOOKS_FILE = "pq_codebooks.npy"
+PQ_CODES_FILE = "pq_codes.npy"
+
+# Number of rows whose scores are computed together.
+BLOCK_SIZE = 65536
+# Number of embeddings sampled to learn the product quantizer.
+PQ_TRAIN_SIZE = 65536
+_PQ_ITERATIONS = 20
+
+
+def normalize(vectors):
+  """Return the float32 rows of vectors scaled to unit L2 norm."""
+  vectors = np.asarray(vectors, dtype=np.float32)
+  norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+  return vectors / np.maximum(norms, 1e-12)
+
+
+def _blocked_top_k(score_fn, num_rows, num_queries, k, block_size):
+  """Return the top k scores and row ids, scoring block_size rows at a time.
+
+  Args:
+    score_fn: function taking the start and end of a block of rows, and
+      returning the float32 scores of the rows for each query, with shape
+      [num_queries, end - start].
+    num_rows: number of rows.
+    num_queries: number of queries.
+    k: number of rows returned for each query.
+    block_size: number of rows scored together.
+
+  Returns:
+    float32 array of scores and int64 array of row ids, with shape
+    [num_queries, min(k, num_rows)], sorted by decreasing score.
+  """
+  k = min(k, num_rows)
+  query_ids = np.arange(num_queries)[:, np.newaxis]
+  best_scores = np.zeros([num_queries, 0], dtype=np.float32)
+  best_ids = np.zeros([num_queries, 0], dtype=np.int64)
+  for start in range(0, num_rows, block_size):
+    end = min(start + block_size, num_rows)
+    scores = np.concatenate([best_scores, score_fn(start, end)], axis=1)
+    ids = np.concatenate([best_ids, np.broadcast_to(
+        np.arange(start, end, dtype=np.int64), [num_queries, end - start])],
+                         axis=1)
+    # Keep the k best rows seen so far, in no particular order.
+    if scores.shape[1] > k:
+      top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+      scores, ids = scores[query_ids, top], ids[query_ids, top]
+    best_scores, best_ids = scores, ids
+
+  order = np.argsort(-best_scores, axis=1, kind="mergesort")
+  return best_scores[query_ids, order], best_ids[query_ids, order]
+
+
+def top_k(queries, matrix, k, block_size=BLOCK_SIZE):
+  """Return the k rows of matrix with the largest inner products with queries.
+
+  Args:
+    queries: float array with shape [num_queries, dim].
+    matrix: float32 or float16 array with shape [num_rows, dim], e.g. a
+      memory-mapped matrix. Only block_size rows are read in memory at a time.
+    k: number of rows returned for each query.
+    block_size: number of rows scored together.
+
+  Returns:
+    float32 array of inner products and int64 array of row ids, with shape
+    [num_queries, min(k, num_rows)], sorted by decreasing inner product.
+  """
+  queries = np.asarray(queries, dtype=np.float32)
+
+  def score_fn(start, end):
+    return queries.dot(np.asarray(matrix[start:end], dtype=np.float32).T)
+
+  return _blocked_top_k(score_fn, len(matrix), len(queries), k, block_size)
+
+
+def _kmeans(vectors, num_centroids, num_iterations, rng):
+  """Return num_centroids centroids of vectors, learned by k-means."""
+  centroids = vectors[rng.choice(len(vectors), num_centroids, replace=False)]
+  for _ in range(num_iterations):
+    assignments = _nearest_centroids(vectors, centroids)
+    counts = np.bincount(assignments, minlength=num_centroids)
+    sums = np.zeros_like(centroids)
+    np.add.at(sums, assignments, vectors)
+    # Centroids without vectors are kept.
+    nonempty = counts > 0
+    centroids[nonempty] = sums[nonempty] / counts[nonempty, np.newaxis]
+  return centroids
+
+
+def _nearest_centroids(vectors, centroids):
+  """Return the index of the centroid nearest to each vector."""
+  # |v - c|^2 = |v|^2 - 2 v.c + |c|^2, where |v|^2 does not change the argmin.
+  distances = (np.sum(centroids ** 2, axis=1)[np.newaxis, :] -
+               2 * vectors.dot(centroids.T))
+  return np.argmin(distances, axis=1)
+
+
+class ProductQuantizer(object):
+  """Compresses vectors to one byte per subspace, for approximate search.
+
+  The dimensions are split into num_subspaces contiguous subspaces, and each
+  subvector is replaced by the index of the nearest of the num_centroids
+  centroids of its subspace. The inner product of a query with a code is the
+  sum of the inner products of the query subvectors with the centroids, which
+  are looked up in a table computed once per query.
+  """
+
+  def __init__(self, codebooks):
+    """Create a quantizer from its centroids.
+
+    Args:
+      codebooks: float32 array with shape [num_subspaces, num_centroids,
+        subspace_dim].
+    """
+    self.codebooks = np.asarray(codebooks, dtype=np.float32)
+    self.num_subspaces, self.num_centroids, self.subspace_dim = (
+        self.codebooks.shape)
+
+  @classmethod
+  def fit(cls, vectors, num_subspaces, num_centroids=256,
+          num_iterations=_PQ_ITERATIONS, seed=None):
+    """Learn the centroids of each subspace of vectors by k-means.
+
+    Args:
+      vectors: float array with shape [num_vectors, dim].
+      num_subspaces: number of subspaces, which must divide dim.
+      num_centroids: number of centroids of each subspace, at most 256 so that
+        codes fit in a byte.
+      num_iterations: number of k-means iterations.
+      seed: (optional) random seed of the initial centroids.
+
+    Returns:
+      ProductQuantizer.
+
+    Raises:
+      ValueError: if num_subspaces does not divide dim, if num_centroids is
+        larger than 256, or if there are fewer vectors than centroids.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    num_vectors, dim = vectors.shape
+    if dim % num_subspaces:
+      raise ValueError("%d subspaces do not divide the %d dimensions." %
+                       (num_subspaces, dim))
+    if num_centroids > 256:
+      raise ValueError("Codes of %d centroids do not fit in a byte." %
+                       num_centroids)
+    if num_vectors < num_centroids:
+      raise ValueError("Cannot learn %d centroids from %d vectors." %
+                       (num_centroids, num_vectors))
+
+    rng = np.random.RandomState(seed)
+    subvectors = vectors.reshape([num_vectors, num_subspaces, -1])
+    return cls(np.stack([
+        _kmeans(subvectors[:, i], num_centroids, num_iterations, rng)
+        for i in range(num_subspaces)]))
+
+  def encode(self, vectors):
+    """Return the uint8 codes of vectors, [num_vectors, num_subspaces]."""
+    subvectors = np.asarray(vectors, dtype=np.float32).reshape(
+        [len(vectors), self.num_subspaces, self.subspace_dim])
+    return np.stack([
+        _nearest_centroids(subvectors[:, i], self.codebooks[i])
+        for i in range(self.num_subspaces)], axis=1).astype(np.uint8)
+
+  def decode(self, codes):
+    """Return the vectors approximated by codes."""
+    return self.codebooks[np.arange(self.num_subspaces), codes].reshape(
+        [len(codes), -1])
+
+  def search(self, queries, codes, k, block_size=BLOCK_SIZE):
+    """Return the k codes with the largest approximate inner products.
+
+    Args:
+      queries: float array with shape [num_queries, dim].
+      codes: uint8 array with shape [num_rows, num_subspaces], e.g. a
+        memory-mapped matrix.
+      k: number of rows returned for each query.
+      block_size: number of codes scored together.
+
+    Returns:
+      float32 array of approximate inner products and int64 array of row ids,
+      with shape [num_queries, min(k, num_rows)], sorted by decreasing inner
+      product.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    # Inner products of the query subvectors with the centroids, with shape
+    # [num_subspaces, num_queries, num_centroids].
+    tables = np.einsum(
+        "qsd,scd->sqc",
+        queries.reshape([len(queries), self.num_subspaces, -1]),
+        self.codebooks)
+
+    def score_fn(start, end):
+      block = np.asarray(codes[start:end])
+      scores = np.zeros([len(queries), end - start], dtype=np.float32)
+      for i in range(self.num_subspaces):
+        scores += tables[i][:, block[:, i]]
+      return scores
+
+    return _blocked_top_k(score_fn, len(codes), len(queries), k, block_size)
+
+
+def write_index(index_dir, responses, embedding_batches, num_rows, dim,
+                dtype=np.float32, num_pq_subspaces=0,
+                pq_train_size=PQ_TRAIN_SIZE, seed=None):
+  """Write the embeddings and responses of a corpus to an index directory.
+
+  The embeddings are streamed to a memory-mapped matrix, so that the corpus
+  does not have to fit in memory.
+
+  Args:
+    index_dir: directory of the index files.
+    responses: iterable of the num_rows response strings.
+    embedding_batches: iterable of float arrays with shape [batch_size, dim],
+      the embeddings of the responses in order.
+    num_rows: number of responses.
+    dim: dimension of the embeddings.
+    dtype: numpy dtype of the stored embeddings, float32 or float16.
+    num_pq_subspaces: if positive, the embeddings are also product quantized
+      with this many subspaces.
+    pq_train_size: number of embeddings sampled to learn the quantizer.
+    seed: (optional) random seed of the quantizer.
+
+  Raises:
+    ValueError: if the number of embeddings or responses is not num_rows.
+  """
+  if not os.path.isdir(index_dir):
+    os.makedirs(index_dir)
+
+  offsets = np.zeros([num_rows], dtype=np.int64)
+  num_responses = 0
+  with io.open(os.path.join(index_dir, RESPONSES_FILE), "wb") as f:
+    for response in responses:
+      if num_responses < num_rows:
+        offsets[num_responses] = f.tell()
+      f.write(response.encode("utf-8") + b"\n")
+      num_responses += 1
+  if num_responses != num_rows:
+    raise ValueError("Got %d responses, expected %d." %
+                     (num_responses, num_rows))
+  np.save(os.path.join(index_dir, OFFSETS_FILE), offsets)
+
+  embeddings = np.lib.format.open_memmap(
+      os.path.join(index_dir, EMBEDDINGS_FILE), mode="w+", dtype=dtype,
+      shape=(num_rows, dim))
+  row = 0
+  for batch in embedding_batches:
+    if row + len(batch) > num_rows:
+      raise ValueError("Got more than %d embeddings." % num_rows)
+    embeddings[row:row + len(batch)] = normalize(batch)
+    row += len(batch)
+  if row != num_rows:
+    raise ValueError("Got %d embeddings, expected %d." % (row, num_rows))
+  embeddings.flush()
+
+  if num_pq_subspaces:
+    rng = np.random.RandomState(seed)
+    train_rows = np.sort(rng.choice(
+        num_rows, min(pq_train_size, num_rows), replace=False))
+    quantizer = ProductQuantizer.fit(
+        embeddings[train_rows], num_pq_subspaces,
+        num_centroids=min(256, len(train_rows)), seed=seed)
+    np.save(os.path.join(index_dir, PQ_CODEBOOKS_FILE), quantizer.codebooks)
+    codes = np.lib.format.open_memmap(
+        os.path.join(index_dir, PQ_CODES_FILE), mode="w+", dtype=np.uint8,
+        shape=(num_rows, num_pq_subspaces))
+    for start in range(0, num_rows, BLOCK_SIZE):
+      codes[start:start + BLOCK_SIZE] = quantizer.encode(
+          embeddings[start:start + BLOCK_SIZE])
+    codes.flush()
+
+
+class EmbeddingIndex(object):
+  """Searches the responses of an index directory written by write_index.
+
+  The embeddings and product quantization codes are memory-mapped, and the
+  responses are read from disk when they are returned. The index may be
+  searched from several threads.
+  """
+
+  def __init__(self, index_dir):
+    self.index_dir = index_dir
+    self.embeddings = np.load(
+        os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r")
+    self._offsets = np.load(os.path.join(index_dir, OFFSETS_FILE))
+    self._responses_file = io.open(
+        os.path.join(index_dir, RESPONSES_FILE), "rb")
+    self._lock = threading.Lock()
+
+    self.quantizer = None
+    self.codes = None
+    if os.path.exists(os.path.join(index_dir, PQ_CODES_FILE)):
+      self.quantizer = ProductQuantizer(
+          np.load(os.path.join(index_dir, PQ_CODEBOOKS_FILE)))
+      self.codes = np.load(
+          os.path.join(index_dir, PQ_CODES_FILE), mmap_mode="r")
+
+  def __len__(self):
+    return len(self.embeddings)
+
+  def search(self, queries, k, use_pq=True, block_size=BLOCK_SIZE):
+    """Return the k responses most similar to each query embedding.
+
+    Args:
+      queries: float array of query embeddings, with shape [num_queries, dim].
+        They are normalized, so that the scores are cosine similarities.
+      k: number of responses returned for each query.
+      use_pq: whether to search the product quantization codes, if the index
+        has them, rather than the embeddings.
+      block_size: number of rows scored together.
+
+    Returns:
+      float32 array of scores and int64 array of response ids, with shape
+      [num_queries, min(k, len(self))], sorted by decreasing score.
+    """
+    queries = normalize(queries)
+    if use_pq and self.quantizer is not None:
+      return self.quantizer.search(queries, self.codes, k, block_size)
+    return top_k(queries, self.embeddings, k, block_size)
+
+  def get_response(self, response_id):
+    """Return the response string of a response id."""
+    with self._lock:
+      self._responses_file.seek(self._offsets[response_id])
+      return self._responses_file.readline().decode("utf-8").rstrip("\n")
+
+  def close(self):
+    """Close the responses file and release the memory-mapped arrays."""
+    self._responses_file.close()
+    self.embeddings = None
+    self.codes = None
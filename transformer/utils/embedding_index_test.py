@@ -0,0 +1,134 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Test the nearest neighbour search of the embedding index."""
+
+import os
+
+import numpy as np
+import tensorflow as tf  # pylint: disable=g-bad-import-order
+
+from official.transformer.utils import embedding_index
+
+
+def _brute_force_top_k(queries, matrix, k):
+  scores = queries.dot(matrix.T)
+  ids = np.argsort(-scores, axis=1, kind="mergesort")[:, :k]
+  return ids
+
+
+class TopKTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(TopKTest, self).setUp()
+    rng = np.random.RandomState(0)
+    self.matrix = embedding_index.normalize(rng.randn(1000, 16))
+    self.queries = rng.randn(5, 16).astype(np.float32)
+
+  def test_top_k(self):
+    # Blocks of 64 rows give the same results as scoring all rows.
+    scores, ids = embedding_index.top_k(
+        self.queries, self.matrix, 10, block_size=64)
+    self.assertAllEqual(
+        _brute_force_top_k(self.queries, self.matrix, 10), ids)
+    self.assertAllClose(
+        np.sum(self.queries[:, np.newaxis] * self.matrix[ids], axis=2), scores)
+    self.assertTrue(np.all(scores[:, :-1] >= scores[:, 1:]))
+
+  def test_top_k_float16(self):
+    _, ids = embedding_index.top_k(
+        self.queries, self.matrix.astype(np.float16), 1, block_size=64)
+    self.assertAllEqual(
+        _brute_force_top_k(self.queries, self.matrix, 1), ids)
+
+  def test_k_larger_than_rows(self):
+    scores, ids = embedding_index.top_k(self.queries, self.matrix[:3], 10)
+    self.assertEqual((5, 3), scores.shape)
+    self.assertAllEqual([[0, 1, 2]] * 5, np.sort(ids, axis=1))
+
+
+class ProductQuantizerTest(tf.test.TestCase):
+
+  def test_fit_and_search(self):
+    rng = np.random.RandomState(0)
+    # Vectors near 8 cluster centers are quantized with a small error.
+    centers = rng.randn(8, 16).astype(np.float32)
+    vectors = centers[rng.randint(8, size=500)] + 0.01 * rng.randn(500, 16)
+    quantizer = embedding_index.ProductQuantizer.fit(
+        vectors, num_subspaces=4, num_centroids=16, seed=0)
+    codes = quantizer.encode(vectors)
+    self.assertEqual((500, 4), codes.shape)
+    self.assertEqual(np.uint8, codes.dtype)
+    error = np.mean((vectors - quantizer.decode(codes)) ** 2)
+    self.assertLess(error, 0.1 * np.var(vectors))
+
+    # The approximate scores are the inner products with the decoded vectors.
+    queries = rng.randn(3, 16).astype(np.float32)
+    scores, ids = quantizer.search(queries, codes, 5, block_size=64)
+    self.assertAllClose(
+        np.sum(queries[:, np.newaxis] * quantizer.decode(codes)[ids], axis=2),
+        scores, atol=1e-4)
+
+  def test_invalid_subspaces(self):
+    with self.assertRaises(ValueError):
+      embedding_index.ProductQuantizer.fit(np.zeros([300, 10]), 4)
+    with self.assertRaises(ValueError):
+      embedding_index.ProductQuantizer.fit(np.zeros([100, 16]), 4)
+
+
+class EmbeddingIndexTest(tf.test.TestCase):
+
+  def _write_index(self, **kwargs):
+    rng = np.random.RandomState(0)
+    self.embeddings = rng.randn(300, 8).astype(np.float32)
+    self.responses = ["response %d" % i for i in range(300)]
+    index_dir = os.path.join(self.get_temp_dir(), "index")
+    embedding_index.write_index(
+        index_dir, iter(self.responses),
+        (self.embeddings[i:i + 32] for i in range(0, 300, 32)), 300, 8,
+        **kwargs)
+    return embedding_index.EmbeddingIndex(index_dir)
+
+  def test_search(self):
+    index = self._write_index(dtype=np.float16)
+    self.assertEqual(300, len(index))
+    self.assertEqual(np.float16, index.embeddings.dtype)
+
+    # Each embedding is its own nearest neighbour.
+    scores, ids = index.search(self.embeddings[[5, 120]], 3)
+    self.assertAllEqual([5, 120], ids[:, 0])
+    self.assertAllClose([1., 1.], scores[:, 0], atol=1e-2)
+    self.assertEqual("response 120", index.get_response(ids[1, 0]))
+    index.close()
+
+  def test_search_pq(self):
+    index = self._write_index(num_pq_subspaces=4, seed=0)
+    self.assertEqual((300, 4), index.codes.shape)
+    _, exact_ids = index.search(self.embeddings[:10], 1, use_pq=False)
+    self.assertAllEqual(np.arange(10), exact_ids[:, 0])
+    # The quantized search finds each embedding among its top candidates.
+    _, ids = index.search(self.embeddings[:10], 20)
+    self.assertGreaterEqual(
+        np.mean([i in row for i, row in enumerate(ids)]), 0.8)
+    index.close()
+
+  def test_wrong_number_of_rows(self):
+    with self.assertRaises(ValueError):
+      embedding_index.write_index(
+          os.path.join(self.get_temp_dir(), "bad_index"), ["a", "b"],
+          [np.zeros([1, 4])], 2, 4)
+
+
+if __name__ == "__main__":
+  tf.test.main()
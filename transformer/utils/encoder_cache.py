@@ -0,0 +1,78 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""In-memory cache of encoder states, with least recently used eviction.
+
+Requests sent again, e.g. to get more responses to a prompt, decode new latent
+samples from the same encoder state. Caching the states by encoded input skips
+the encoder for these requests.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import threading
+
+MAX_ENTRIES = 1024
+
+
+class EncoderCache(object):
+  """Mapping from encoded inputs to encoder states, holding max_entries states.
+
+  The cache may be used from several threads. The states are stored as given,
+  e.g. as dictionaries of numpy arrays, and must not be modified.
+  """
+
+  def __init__(self, max_entries=MAX_ENTRIES):
+    self.max_entries = max_entries
+    self.hits = 0
+    self.misses = 0
+
+    self._lock = threading.Lock()
+    # Ordered from the least to the most recently used.
+    self._states = collections.OrderedDict()
+
+  def __len__(self):
+    return len(self._states)
+
+  def get(self, ids):
+    """Return the cached state of an input encoded as a list of ids, or None."""
+    key = tuple(ids)
+    with self._lock:
+      state = self._states.pop(key, None)
+      if state is None:
+        self.misses += 1
+        return None
+      self.hits += 1
+      self._states[key] = state
+      return state
+
+  def put(self, ids, state):
+    """Cache the state of an input, evicting the least recently used state."""
+    if self.max_entries <= 0:
+      return
+    key = tuple(ids)
+    with self._lock:
+      self._states.pop(key, None)
+      self._states[key] = state
+      while len(self._states) > self.max_entries:
+        self._states.popitem(last=False)
+
+  @property
+  def hit_rate(self):
+    """Fraction of the lookups that found a cached state."""
+    lookups = self.hits + self.misses
+    return self.hits / lookups if lookups else 0.
@@ -0,0 +1,50 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Test the encoder cache."""
+
+import tensorflow as tf  # pylint: disable=g-bad-import-order
+
+from official.transformer.utils import encoder_cache
+
+
+class EncoderCacheTest(tf.test.TestCase):
+
+  def test_get_and_put(self):
+    cache = encoder_cache.EncoderCache()
+    self.assertIsNone(cache.get([4, 5, 1]))
+    cache.put([4, 5, 1], {"prior_mu": 1.})
+    self.assertEqual({"prior_mu": 1.}, cache.get([4, 5, 1]))
+    self.assertEqual(0.5, cache.hit_rate)
+
+  def test_evict_least_recently_used(self):
+    cache = encoder_cache.EncoderCache(max_entries=2)
+    cache.put([0], "a")
+    cache.put([1], "b")
+    cache.get([0])
+    cache.put([2], "c")
+
+    self.assertEqual(2, len(cache))
+    self.assertEqual("a", cache.get([0]))
+    self.assertIsNone(cache.get([1]))
+    self.assertEqual("c", cache.get([2]))
+
+  def test_disabled(self):
+    cache = encoder_cache.EncoderCache(max_entries=0)
+    cache.put([0], "a")
+    self.assertIsNone(cache.get([0]))
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -0,0 +1,327 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Encode and decode strings with graph ops, like Subtokenizer.
+
+The ops are built from the subtoken list and the alphabet of a Subtokenizer, so
+that a model can be exported with string inputs and outputs. Strings are
+processed as UTF-8 bytes, and are split into tokens, escaped and split into
+subtokens with the same rules as Subtokenizer.encode and Subtokenizer.decode.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import six
+import tensorflow as tf
+
+from official.transformer.utils import tokenizer
+
+_MAX_CODEPOINT = 0x10FFFF
+_UNDEFINED_CODEPOINT = ord(tokenizer._UNDEFINED_UNICODE)  # pylint: disable=protected-access
+# Single byte strings, indexed by the value of the byte.
+_BYTE_STRINGS = [six.int2byte(i) for i in range(256)]
+
+_alphanumeric_ranges = None
+
+
+def _get_alphanumeric_ranges():
+  """Return the first and last code points of the alphanumeric ranges."""
+  global _alphanumeric_ranges
+  if _alphanumeric_ranges is None:
+    ranges = tokenizer.get_alphanumeric_ranges()
+    _alphanumeric_ranges = ([first for first, _ in ranges],
+                            [last for _, last in ranges])
+  return _alphanumeric_ranges
+
+
+def _is_alphanumeric(codepoints):
+  """Return whether int32 code points are letters or numbers."""
+  starts, ends = _get_alphanumeric_ranges()
+  codepoints = tf.expand_dims(codepoints, -1)
+  return tf.reduce_any(
+      tf.logical_and(codepoints >= starts, codepoints <= ends), axis=-1)
+
+
+def _decode_utf8(byte0, byte1, byte2, byte3):
+  """Return the code points of UTF-8 characters given their first 4 bytes."""
+  cont1 = byte1 - 0x80
+  cont2 = byte2 - 0x80
+  cont3 = byte3 - 0x80
+  return tf.where(
+      byte0 < 0x80, byte0, tf.where(
+          byte0 < 0xE0, (byte0 - 0xC0) * 64 + cont1, tf.where(
+              byte0 < 0xF0, (byte0 - 0xE0) * 4096 + cont1 * 64 + cont2,
+              (byte0 - 0xF0) * 262144 + cont1 * 4096 + cont2 * 64 + cont3)))
+
+
+def _encode_utf8(codepoints):
+  """Return the UTF-8 strings of int32 code points."""
+  num_bytes = (1 + tf.to_int32(codepoints >= 0x80) +
+               tf.to_int32(codepoints >= 0x800) +
+               tf.to_int32(codepoints >= 0x10000))
+  # The first byte holds the highest bits after a prefix giving the number of
+  # bytes, and each following byte holds the next 6 bits.
+  first_byte = (tf.gather([0, 0, 0xC0, 0xE0, 0xF0], num_bytes) +
+                codepoints // tf.pow(64, num_bytes - 1))
+  byte_strings = [tf.gather(_BYTE_STRINGS, first_byte)]
+  for i in range(1, 4):
+    shift = tf.pow(64, tf.maximum(num_bytes - 1 - i, 0))
+    byte_value = 0x80 + (codepoints // shift) % 64
+    byte_strings.append(tf.where(
+        i < num_bytes, tf.gather(_BYTE_STRINGS, byte_value),
+        tf.fill(tf.shape(codepoints), "")))
+  return tf.string_join(byte_strings)
+
+
+def _fill_like(x, value):
+  return tf.fill(tf.shape(x), value)
+
+
+def _escape_strings(strings, alphabet):
+  """Split strings into tokens, and escape and join the tokens.
+
+  Returns the same strings as joining _escape_token(token, alphabet) for the
+  tokens returned by _split_string_to_tokens.
+  """
+  byte_strings = tf.string_split(strings, delimiter="")
+  byte_values = tf.to_int32(
+      tf.reshape(tf.decode_raw(byte_strings.values, tf.uint8), [-1]))
+
+  # Decode the characters starting at each byte that is not a continuation
+  # byte. A character is not decoded across strings unless it is invalid.
+  padded_values = tf.concat([byte_values, tf.zeros([3], tf.int32)], 0)
+  num_values = tf.size(byte_values)
+  codepoints = _decode_utf8(*[padded_values[i:i + num_values]
+                              for i in range(4)])
+  is_char_start = tf.logical_or(byte_values < 0x80, byte_values >= 0xC0)
+  codepoints = tf.boolean_mask(codepoints, is_char_start)
+  indices = tf.boolean_mask(byte_strings.indices, is_char_start)
+
+  # A token starts at the beginning of each string, and wherever a character
+  # is alphanumeric and the previous one is not, or the reverse.
+  is_string_start = tf.equal(indices[:, 1], 0)
+  is_alnum = _is_alphanumeric(codepoints)
+  follows_alnum = tf.concat([[False], is_alnum], 0)[:-1]
+  is_token_start = tf.logical_or(
+      is_string_start, tf.not_equal(is_alnum, follows_alnum))
+  is_token_end = tf.concat([is_token_start, [True]], 0)[1:]
+  is_string_end = tf.concat([is_string_start, [True]], 0)[1:]
+  # Single spaces between tokens are dropped. The first and last tokens of a
+  # string are always kept.
+  is_dropped = tf.reduce_all([
+      tf.equal(codepoints, ord(" ")), is_token_start, is_token_end,
+      tf.logical_not(is_string_start), tf.logical_not(is_string_end)], axis=0)
+
+  alphabet_codepoints = sorted(ord(c) for c in alphabet if c != u"\n")
+  alphabet_table = tf.contrib.lookup.HashTable(
+      tf.contrib.lookup.KeyValueTensorInitializer(
+          tf.constant(alphabet_codepoints, tf.int64),
+          tf.ones([len(alphabet_codepoints)], tf.int64)), 0)
+  in_alphabet = tf.greater(alphabet_table.lookup(tf.to_int64(codepoints)), 0)
+
+  escaped_chars = tf.where(
+      in_alphabet, _encode_utf8(codepoints),
+      tf.string_join(["\\", tf.as_string(codepoints), ";"]))
+  escaped_chars = tf.where(tf.equal(codepoints, ord("\\")),
+                           _fill_like(escaped_chars, "\\\\"), escaped_chars)
+  escaped_chars = tf.where(tf.equal(codepoints, ord("_")),
+                           _fill_like(escaped_chars, "\\u"), escaped_chars)
+  escaped_chars = tf.where(
+      is_token_end, tf.string_join([escaped_chars, "_"]), escaped_chars)
+  escaped_chars = tf.where(
+      is_dropped, _fill_like(escaped_chars, ""), escaped_chars)
+
+  return tf.reduce_join(tf.sparse_tensor_to_dense(
+      tf.SparseTensor(indices, escaped_chars, byte_strings.dense_shape),
+      default_value=""), axis=1)
+
+
+def _split_to_subtoken_ids(escaped, subtoken_list):
+  """Greedily split escaped strings into the longest subtokens in the list.
+
+  All strings are split together, one subtoken at a time.
+
+  Args:
+    escaped: string tensor with shape [batch_size] of escaped tokens.
+    subtoken_list: list of subtokens. The id of a subtoken is its index.
+
+  Returns:
+    int64 tensor with shape [batch_size, length] of subtoken ids, padded with
+      PAD_ID, and int32 tensor with shape [batch_size] of the number of ids of
+      each string.
+  """
+  max_subtoken_length = max(len(tf.compat.as_bytes(s)) for s in subtoken_list)
+  subtoken_table = tf.contrib.lookup.HashTable(
+      tf.contrib.lookup.KeyValueTensorInitializer(
+          tf.constant(subtoken_list, tf.string),
+          tf.range(len(subtoken_list), dtype=tf.int64)), -1)
+
+  batch_size = tf.shape(escaped)[0]
+  byte_rows = tf.string_split(escaped, delimiter="").indices[:, 0]
+  escaped_lengths = tf.unsorted_segment_sum(
+      tf.ones_like(byte_rows, tf.int32), tf.to_int32(byte_rows), batch_size)
+
+  candidate_lengths = tf.tile(
+      tf.range(1, max_subtoken_length + 1)[tf.newaxis, :], [batch_size, 1])
+  candidate_strings = tf.tile(
+      escaped[:, tf.newaxis], [1, max_subtoken_length])
+
+  def has_remaining_bytes(positions, unused_num_ids, unused_ids):
+    return tf.reduce_any(positions < escaped_lengths)
+
+  def split_next_subtokens(positions, num_ids, ids):
+    """Find the longest subtoken starting at the position in each string."""
+    remaining_lengths = escaped_lengths - positions
+    candidates = tf.substr(
+        candidate_strings,
+        tf.tile(positions[:, tf.newaxis], [1, max_subtoken_length]),
+        candidate_lengths)
+    candidate_ids = subtoken_table.lookup(candidates)
+    is_found = tf.logical_and(
+        candidate_ids >= 0,
+        candidate_lengths <= remaining_lengths[:, tf.newaxis])
+
+    match_lengths = tf.reduce_max(
+        tf.where(is_found, candidate_lengths, tf.zeros_like(candidate_lengths)),
+        axis=1)
+    # Strings that are done get PAD_ID, since no candidate is found.
+    match_ids = tf.reduce_sum(candidate_ids * tf.one_hot(
+        match_lengths - 1, max_subtoken_length, dtype=tf.int64), axis=1)
+
+    # Escaped tokens can always be split if all characters of the alphabet are
+    # subtokens, as in vocabularies generated by Subtokenizer.
+    assert_op = tf.Assert(
+        tf.reduce_all(tf.logical_or(match_lengths > 0, remaining_lengths <= 0)),
+        ["Was unable to split a token into subtokens."])
+    with tf.control_dependencies([assert_op]):
+      return (positions + match_lengths,
+              num_ids + tf.to_int32(match_lengths > 0),
+              tf.concat([ids, match_ids[:, tf.newaxis]], axis=1))
+
+  _, num_ids, ids = tf.while_loop(
+      has_remaining_bytes, split_next_subtokens,
+      [tf.zeros([batch_size], tf.int32), tf.zeros([batch_size], tf.int32),
+       tf.zeros([batch_size, 0], tf.int64)],
+      shape_invariants=[tf.TensorShape([None]), tf.TensorShape([None]),
+                        tf.TensorShape([None, None])],
+      back_prop=False)
+  return ids, num_ids
+
+
+def encode(strings, subtokenizer, add_eos=True):
+  """Encode strings into subtoken ids, like Subtokenizer.encode.
+
+  Args:
+    strings: string tensor with shape [batch_size] of UTF-8 strings.
+    subtokenizer: Subtokenizer object providing the subtoken list and alphabet.
+    add_eos: whether to append EOS_ID to the ids of each string.
+
+  Returns:
+    int64 tensor with shape [batch_size, length] of subtoken ids, padded with
+    PAD_ID. The lookup tables used by the ops must be initialized, e.g. with
+    tf.tables_initializer().
+  """
+  escaped = _escape_strings(strings, subtokenizer.alphabet)
+  ids, num_ids = _split_to_subtoken_ids(escaped, subtokenizer.subtoken_list)
+  if add_eos:
+    ids = tf.pad(ids, [[0, 0], [0, 1]])
+    ids += tokenizer.EOS_ID * tf.one_hot(
+        num_ids, tf.shape(ids)[1], dtype=tf.int64)
+  return ids
+
+
+def _unescape_tokens(tokens):
+  """Unescape string tokens, like _unescape_token.
+
+  Escape sequences for invalid code points and for surrogates are replaced by
+  the undefined character.
+  """
+  # Put each escape sequence between newlines, which are never in escaped
+  # tokens. The escape sequences are then at odd indices of the split tokens.
+  pieces = tf.string_split(
+      tf.regex_replace(tokens, tokenizer._UNESCAPE_REGEX.pattern, "\n\\0\n"),  # pylint: disable=protected-access
+      delimiter="\n", skip_empty=False)
+  is_escape = tf.equal(pieces.indices[:, 1] % 2, 1)
+  is_underline = tf.equal(pieces.values, "\\u")
+  is_backslash = tf.equal(pieces.values, "\\\\")
+
+  numbers = tf.where(
+      tf.reduce_all([is_escape, tf.logical_not(is_underline),
+                     tf.logical_not(is_backslash)], axis=0),
+      pieces.values, _fill_like(pieces.values, "\\0;"))
+  numbers = tf.regex_replace(numbers, r"^\\0*([0-9]+);$", r"\1")
+  # Numbers of more than 7 digits are not valid code points.
+  numbers = tf.regex_replace(numbers, r"^[0-9]{8,}$", str(_MAX_CODEPOINT + 1))
+  codepoints = tf.string_to_number(numbers, tf.int32)
+  is_undefined = tf.logical_or(
+      codepoints > _MAX_CODEPOINT,
+      tf.logical_and(codepoints >= 0xD800, codepoints <= 0xDFFF))
+  codepoints = tf.where(
+      is_undefined, _fill_like(codepoints, _UNDEFINED_CODEPOINT), codepoints)
+
+  unescaped = tf.where(is_underline, _fill_like(pieces.values, "_"),
+                       _encode_utf8(codepoints))
+  unescaped = tf.where(is_backslash, _fill_like(pieces.values, "\\"),
+                       unescaped)
+  values = tf.where(is_escape, unescaped, pieces.values)
+  return tf.reduce_join(tf.sparse_tensor_to_dense(
+      tf.SparseTensor(pieces.indices, values, pieces.dense_shape),
+      default_value=""), axis=1)
+
+
+def _first_codepoints(strings):
+  """Return the code points of the first characters of non-empty strings."""
+  first_bytes = tf.substr(tf.string_join([strings, "\0\0\0"]), 0, 4)
+  byte_values = tf.reshape(
+      tf.to_int32(tf.decode_raw(first_bytes, tf.uint8)), [-1, 4])
+  return _decode_utf8(*tf.unstack(byte_values, num=4, axis=1))
+
+
+def decode(ids, subtokenizer):
+  """Decode subtoken ids into strings, like Subtokenizer.decode.
+
+  The ids of each string are decoded up to the first EOS_ID, as in
+  translate._trim_and_decode.
+
+  Args:
+    ids: int tensor with shape [batch_size, length] of subtoken ids.
+    subtokenizer: Subtokenizer object providing the subtoken list.
+
+  Returns:
+    string tensor with shape [batch_size] of UTF-8 strings.
+  """
+  vocab_size = len(subtokenizer.subtoken_list)
+  is_decoded = tf.logical_and(
+      tf.equal(tf.cumsum(tf.to_int32(tf.equal(ids, tokenizer.EOS_ID)),
+                         axis=1), 0),
+      tf.logical_and(ids >= 0, ids < vocab_size))
+  subtokens = tf.gather(tf.constant(subtokenizer.subtoken_list, tf.string),
+                        tf.where(is_decoded, ids, tf.zeros_like(ids)))
+  subtokens = tf.where(is_decoded, subtokens, _fill_like(subtokens, ""))
+
+  tokens = tf.string_split(tf.reduce_join(subtokens, axis=1), delimiter="_")
+  token_values = _unescape_tokens(tokens.values)
+
+  # Join the tokens, with a space between consecutive alphanumeric tokens.
+  is_alnum = _is_alphanumeric(_first_codepoints(token_values))
+  follows_alnum = tf.logical_and(
+      tf.concat([[False], is_alnum], 0)[:-1], tokens.indices[:, 1] > 0)
+  token_values = tf.where(
+      tf.logical_and(is_alnum, follows_alnum),
+      tf.string_join([" ", token_values]), token_values)
+  return tf.reduce_join(tf.sparse_tensor_to_dense(
+      tf.SparseTensor(tokens.indices, token_values, tokens.dense_shape),
+      default_value=""), axis=1)
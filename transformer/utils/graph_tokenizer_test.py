@@ -0,0 +1,94 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Test that the graph ops encode and decode strings like Subtokenizer."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import numpy as np
+import tensorflow as tf  # pylint: disable=g-bad-import-order
+
+from official.transformer.utils import graph_tokenizer
+from official.transformer.utils import tokenizer
+
+_STRINGS = [
+    u"hello world",
+    u"hello, world!",
+    u"  hello  world 123 ",
+    u"hi ",
+    u" ",
+    u"under_score and back\\slash",
+    u"new\nline",
+    u"hüllö €123",
+    u"",
+]
+
+
+class GraphTokenizerTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(GraphTokenizerTest, self).setUp()
+    vocab_file = os.path.join(self.get_temp_dir(), "vocab")
+    subtokens = [u"hello_", u"world_", u"wor", u"ld", u"123_", u"ü"]
+    subtokens += list(u"helowrd,!? _\\u;0123456789")
+    with tf.gfile.Open(vocab_file, "w") as f:
+      for subtoken in subtokens:
+        f.write(u"'%s'\n" % subtoken)
+    self.subtokenizer = tokenizer.Subtokenizer(vocab_file)
+
+  def _run(self, op):
+    with self.test_session() as sess:
+      sess.run(tf.tables_initializer())
+      return sess.run(op)
+
+  def test_encode(self):
+    ids = self._run(graph_tokenizer.encode(
+        tf.constant(_STRINGS), self.subtokenizer))
+
+    for s, string_ids in zip(_STRINGS, ids):
+      expected_ids = self.subtokenizer.encode(s, add_eos=True)
+      self.assertEqual(expected_ids, string_ids[:len(expected_ids)].tolist())
+      self.assertTrue(np.all(string_ids[len(expected_ids):] == 0))
+
+  def test_encode_without_eos(self):
+    ids = self._run(graph_tokenizer.encode(
+        tf.constant(["hello world"]), self.subtokenizer, add_eos=False))
+
+    self.assertAllEqual([self.subtokenizer.encode("hello world")], ids)
+
+  def test_decode(self):
+    id_lists = [self.subtokenizer.encode(s) for s in _STRINGS]
+    # Escape sequences of characters that are not in the alphabet, and of an
+    # invalid code point.
+    id_lists.append([self.subtokenizer.subtoken_to_id_dict[c]
+                     for c in u"h\\8364;_\\99999999;_\\u\\\\_"])
+    # Ids after EOS are not decoded.
+    ids = np.zeros([len(id_lists), max(len(l) for l in id_lists) + 2])
+    for i, id_list in enumerate(id_lists):
+      ids[i, :len(id_list) + 2] = id_list + [tokenizer.EOS_ID, 2]
+
+    translations = self._run(graph_tokenizer.decode(
+        tf.constant(ids, tf.int64), self.subtokenizer))
+
+    for id_list, translation in zip(id_lists, translations):
+      self.assertEqual(self.subtokenizer.decode(id_list),
+                       translation.decode("utf-8"))
+
+
+if __name__ == "__main__":
+  tf.test.main()
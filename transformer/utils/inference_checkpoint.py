@@ -0,0 +1,139 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Write and restore inference checkpoints.
+
+A training checkpoint holds the optimizer slots of every variable, and the
+variables only used in training, e.g. the target encoder and the recognition
+network. An inference checkpoint only holds the variables of the prediction
+graph, and its floating-point variables may be stored in float16.
+
+Saver restores both kinds of checkpoints. Variables stored with another type
+than in the graph are cast to the type of the graph when they are restored.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import numpy as np
+import tensorflow as tf
+
+DTYPES = ("float32", "float16")
+
+
+class Saver(tf.train.Saver):
+  """Saver casting the variables of checkpoints stored in another type.
+
+  Checkpoints whose variables have the types of the graph are restored as with
+  tf.train.Saver. Otherwise, the variables are read from the checkpoint, cast,
+  and loaded with their initializers, which adds no ops to the graph. The graph
+  may then be finalized before restore is called, as in a MonitoredSession.
+  """
+
+  def __init__(self, var_list=None, **kwargs):
+    """Create the saver.
+
+    Args:
+      var_list: list of variables, or dictionary mapping checkpoint names to
+        variables. Defaults to the global variables.
+      **kwargs: other arguments of tf.train.Saver.
+    """
+    if var_list is None:
+      var_list = tf.global_variables()
+    super(Saver, self).__init__(var_list, **kwargs)
+    if isinstance(var_list, dict):
+      self._variables = dict(var_list)
+    else:
+      self._variables = {variable.op.name: variable for variable in var_list}
+
+  def restore(self, sess, save_path):
+    if save_path is None:
+      return super(Saver, self).restore(sess, save_path)
+    reader = tf.train.NewCheckpointReader(save_path)
+    dtype_map = reader.get_variable_to_dtype_map()
+    if all(dtype_map.get(name) in (None, variable.dtype.base_dtype)
+           for name, variable in self._variables.items()):
+      # Missing variables are reported by tf.train.Saver.
+      return super(Saver, self).restore(sess, save_path)
+
+    tf.logging.info("Restoring parameters from %s, cast to the types of the "
+                    "graph." % save_path)
+    for name, variable in sorted(self._variables.items()):
+      if name not in dtype_map:
+        raise tf.errors.NotFoundError(
+            None, None, "Variable %s not found in checkpoint %s." %
+            (name, save_path))
+      value = reader.get_tensor(name)
+      variable.load(
+          np.asarray(value, dtype=variable.dtype.base_dtype.as_numpy_dtype),
+          sess)
+
+
+def write_checkpoint(checkpoint_path, output_dir, var_names, dtype=None):
+  """Write the variables var_names of a checkpoint to a new checkpoint.
+
+  Args:
+    checkpoint_path: path of the checkpoint to read, e.g. a training checkpoint.
+    output_dir: directory of the new checkpoint. It has the same basename as
+      checkpoint_path, and is the latest checkpoint of the directory.
+    var_names: names of the variables kept.
+    dtype: (optional) one of DTYPES. If set, the floating-point variables are
+      stored in this type.
+
+  Returns:
+    The path of the new checkpoint.
+
+  Raises:
+    ValueError: if dtype is invalid, or if some variables are not in the
+      checkpoint.
+  """
+  if dtype is not None and dtype not in DTYPES:
+    raise ValueError("Invalid checkpoint dtype %s, must be one of %s." %
+                     (dtype, ", ".join(DTYPES)))
+  reader = tf.train.NewCheckpointReader(checkpoint_path)
+  shape_map = reader.get_variable_to_shape_map()
+  missing = sorted(set(var_names) - set(shape_map))
+  if missing:
+    raise ValueError("Variables not found in checkpoint %s: %s" %
+                     (checkpoint_path, ", ".join(missing)))
+
+  num_values = {name: int(np.prod(shape)) for name, shape in shape_map.items()}
+  tf.logging.info(
+      "Keeping %d of the %d variables of %s (%d of %d values)." % (
+          len(var_names), len(shape_map), checkpoint_path,
+          sum(num_values[name] for name in var_names),
+          sum(num_values.values())))
+
+  output_path = os.path.join(output_dir, os.path.basename(checkpoint_path))
+  tf.gfile.MakeDirs(output_dir)
+  with tf.Graph().as_default():
+    # The values are fed to the initializers of the variables, so that they are
+    # not copied into the graph.
+    variables = {}
+    feed_dict = {}
+    for name in sorted(var_names):
+      value = reader.get_tensor(name)
+      if dtype is not None and value.dtype.kind == "f":
+        value = value.astype(dtype)
+      placeholder = tf.placeholder(tf.as_dtype(value.dtype), value.shape)
+      variables[name] = tf.Variable(placeholder, trainable=False)
+      feed_dict[placeholder] = value
+    saver = tf.train.Saver(variables)
+    with tf.Session() as sess:
+      sess.run(tf.global_variables_initializer(), feed_dict=feed_dict)
+      saver.save(sess, output_path, write_meta_graph=False)
+  return output_path
@@ -0,0 +1,99 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Test writing and restoring inference checkpoints."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import numpy as np
+import tensorflow as tf  # pylint: disable=g-bad-import-order
+
+from official.transformer.utils import inference_checkpoint
+
+
+class InferenceCheckpointTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(InferenceCheckpointTest, self).setUp()
+    self.values = {
+        "model/weights": np.arange(6, dtype=np.float32).reshape([2, 3]) / 7,
+        "model/weights/Adam": np.ones([2, 3], dtype=np.float32),
+        "model/bias": np.array([0.5, -1.25], dtype=np.float32),
+        "global_step": np.array(42, dtype=np.int64),
+    }
+    self.train_dir = os.path.join(self.get_temp_dir(), "train")
+    with tf.Graph().as_default():
+      variables = {name: tf.Variable(value, name=name)
+                   for name, value in self.values.items()}
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        self.checkpoint_path = tf.train.Saver(variables).save(
+            sess, os.path.join(self.train_dir, "model.ckpt-42"))
+
+  def _restore(self, checkpoint_path, names):
+    with tf.Graph().as_default():
+      variables = [
+          tf.Variable(tf.zeros_like(self.values[name]), name=name)
+          for name in names]
+      saver = inference_checkpoint.Saver()
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        # Restoring does not add ops to the graph.
+        sess.graph.finalize()
+        saver.restore(sess, checkpoint_path)
+        return dict(zip(names, sess.run(variables)))
+
+  def test_write_checkpoint(self):
+    names = ["model/weights", "model/bias", "global_step"]
+    export_dir = os.path.join(self.get_temp_dir(), "export")
+    output_path = inference_checkpoint.write_checkpoint(
+        self.checkpoint_path, export_dir, names, dtype="float16")
+    self.assertEqual(output_path, tf.train.latest_checkpoint(export_dir))
+
+    dtype_map = tf.train.NewCheckpointReader(
+        output_path).get_variable_to_dtype_map()
+    self.assertEqual(
+        {"model/weights": tf.float16, "model/bias": tf.float16,
+         "global_step": tf.int64}, dtype_map)
+
+    for name, value in self._restore(output_path, names).items():
+      self.assertEqual(self.values[name].dtype, value.dtype)
+      self.assertAllClose(self.values[name], value, atol=1e-3)
+
+  def test_restore_same_dtype(self):
+    names = ["model/weights", "model/bias"]
+    for name, value in self._restore(self.checkpoint_path, names).items():
+      self.assertAllEqual(self.values[name], value)
+
+  def test_invalid_arguments(self):
+    export_dir = os.path.join(self.get_temp_dir(), "export")
+    with self.assertRaises(ValueError):
+      inference_checkpoint.write_checkpoint(
+          self.checkpoint_path, export_dir, ["model/missing"])
+    with self.assertRaises(ValueError):
+      inference_checkpoint.write_checkpoint(
+          self.checkpoint_path, export_dir, ["model/bias"], dtype="int8")
+
+    output_path = inference_checkpoint.write_checkpoint(
+        self.checkpoint_path, export_dir, ["model/bias"], dtype="float16")
+    with self.assertRaises(tf.errors.NotFoundError):
+      self._restore(output_path, ["model/bias", "model/weights"])
+
+
+if __name__ == "__main__":
+  tf.test.main()
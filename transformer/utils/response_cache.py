@@ -0,0 +1,132 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""On-disk cache of generated responses, with least recently used eviction.
+
+Responses are keyed by a model key, which identifies the checkpoint and the
+decoding parameters, and by the encoded input. The cache is an SQLite database,
+so that it persists between runs and can be shared by runs over overlapping
+input files.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import json
+import sqlite3
+import threading
+
+MAX_ENTRIES = 10 ** 7
+
+
+def get_model_key(checkpoint_path, params, seed=None):
+  """Return a string identifying a model and how it decodes responses.
+
+  Args:
+    checkpoint_path: path of the checkpoint the model is restored from.
+    params: hyperparameter object of the model. The prediction parameters are
+      part of the key.
+    seed: (optional) random seed of the graph, used to draw the latent samples.
+  """
+  decoding_params = {
+      name: params[name] for name in (
+          "beam_size", "alpha", "extra_decode_length", "num_latent_samples",
+          "decoding_method", "sampling_top_k", "sampling_top_p",
+          "vocab_shortlist_size", "shortlist_source_tokens")}
+  return json.dumps([checkpoint_path, decoding_params, seed], sort_keys=True)
+
+
+class ResponseCache(object):
+  """Persistent mapping from encoded inputs to responses.
+
+  The cache may be used from several threads. Responses are written to disk
+  when flush is called, at which point the least recently used responses are
+  evicted if the cache holds more than max_entries responses.
+  """
+
+  def __init__(self, filename, model_key, max_entries=MAX_ENTRIES):
+    """Open or create the cache.
+
+    Args:
+      filename: path of the SQLite database file.
+      model_key: string identifying the model, from get_model_key.
+      max_entries: maximum number of responses kept in the cache.
+    """
+    self.model_key = model_key
+    self.max_entries = max_entries
+    self.hits = 0
+    self.misses = 0
+
+    self._lock = threading.Lock()
+    self._conn = sqlite3.connect(filename, check_same_thread=False)
+    self._conn.execute(
+        "CREATE TABLE IF NOT EXISTS responses "
+        "(key TEXT PRIMARY KEY, response TEXT, last_used INTEGER)")
+    self._conn.execute(
+        "CREATE INDEX IF NOT EXISTS responses_last_used "
+        "ON responses (last_used)")
+    self._conn.commit()
+    # Responses are ordered by the value of this counter when last used.
+    self._use_count = self._conn.execute(
+        "SELECT MAX(last_used) FROM responses").fetchone()[0] or 0
+
+  def get_key(self, ids):
+    """Return the key of an input encoded as an int32 numpy array."""
+    key = hashlib.sha1(self.model_key.encode("utf-8"))
+    key.update(ids.astype("int32").tobytes())
+    return key.hexdigest()
+
+  def get(self, key):
+    """Return the cached response for the key, or None if there is none."""
+    with self._lock:
+      row = self._conn.execute(
+          "SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+      if row is None:
+        self.misses += 1
+        return None
+      self.hits += 1
+      self._use_count += 1
+      self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?",
+                         (self._use_count, key))
+      return row[0]
+
+  def put(self, key, response):
+    with self._lock:
+      self._use_count += 1
+      self._conn.execute(
+          "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+          (key, response, self._use_count))
+
+  def flush(self):
+    """Evict the least recently used responses, and write changes to disk."""
+    with self._lock:
+      num_entries = self._conn.execute(
+          "SELECT COUNT(*) FROM responses").fetchone()[0]
+      if num_entries > self.max_entries:
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+            "ORDER BY last_used LIMIT ?)", (num_entries - self.max_entries,))
+      self._conn.commit()
+
+  def close(self):
+    self.flush()
+    self._conn.close()
+
+  @property
+  def hit_rate(self):
+    """Fraction of the lookups that found a cached response."""
+    lookups = self.hits + self.misses
+    return self.hits / lookups if lookups else 0.
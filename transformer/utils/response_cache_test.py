@@ -0,0 +1,69 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Test the response cache."""
+
+import os
+
+import numpy as np
+import tensorflow as tf  # pylint: disable=g-bad-import-order
+
+from official.transformer.model import model_params
+from official.transformer.utils import response_cache
+
+
+class ResponseCacheTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(ResponseCacheTest, self).setUp()
+    self.filename = os.path.join(self.get_temp_dir(), "cache.db")
+    if os.path.exists(self.filename):
+      os.remove(self.filename)
+    self.model_key = response_cache.get_model_key(
+        "model.ckpt-1", model_params.BASE_PARAMS)
+
+  def test_get_and_put(self):
+    cache = response_cache.ResponseCache(self.filename, self.model_key)
+    key = cache.get_key(np.array([4, 5, 1]))
+    self.assertIsNone(cache.get(key))
+    cache.put(key, "hello")
+    self.assertEqual("hello", cache.get(key))
+    self.assertEqual(0.5, cache.hit_rate)
+    cache.close()
+
+    # Responses persist, for the same model only.
+    cache = response_cache.ResponseCache(self.filename, self.model_key)
+    self.assertEqual("hello", cache.get(key))
+    other_cache = response_cache.ResponseCache(
+        self.filename, response_cache.get_model_key(
+            "model.ckpt-2", model_params.BASE_PARAMS))
+    self.assertIsNone(other_cache.get(other_cache.get_key(np.array([4, 5, 1]))))
+
+  def test_evict_least_recently_used(self):
+    cache = response_cache.ResponseCache(
+        self.filename, self.model_key, max_entries=2)
+    keys = [cache.get_key(np.array([i])) for i in range(3)]
+    cache.put(keys[0], "a")
+    cache.put(keys[1], "b")
+    cache.get(keys[0])
+    cache.put(keys[2], "c")
+    cache.flush()
+
+    self.assertEqual("a", cache.get(keys[0]))
+    self.assertIsNone(cache.get(keys[1]))
+    self.assertEqual("c", cache.get(keys[2]))
+
+
+if __name__ == "__main__":
+  tf.test.main()
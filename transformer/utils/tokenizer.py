@@ -20,14 +20,14 @@ from __future__ import print_function
 
 import collections
 import re
-import sys
-import unicodedata
 
 import numpy as np
 import six
 from six.moves import xrange  # pylint: disable=redefined-builtin
 import tensorflow as tf
 
+from official.transformer.utils import unicode_tables
+
 PAD = "<pad>"
 PAD_ID = 0
 EOS = "<EOS>"
@@ -45,11 +45,9 @@ _UNESCAPE_REGEX = re.compile(r"\\u|\\\\|\\([0-9]+);")
 
 _UNDEFINED_UNICODE = u"\u3013"
 
-# Set contains all letter and number characters.
-_ALPHANUMERIC_CHAR_SET = set(
-    six.unichr(i) for i in xrange(sys.maxunicode)
-    if (unicodedata.category(six.unichr(i)).startswith("L") or
-        unicodedata.category(six.unichr(i)).startswith("N")))
+# Set contains all letter and number characters. It is built when it is first
+# used, see _get_alphanumeric_char_set().
+_alphanumeric_char_set = None
 
 # min_count is the minimum number of times a subtoken must appear in the data
 # before before it is added to the vocabulary. The value is found using binary
@@ -226,6 +224,22 @@ def _unicode_to_native(s):
     return s
 
 
+def get_alphanumeric_ranges():
+  """Return the sorted [first, last] code point ranges of alphanumerics."""
+  return unicode_tables.merge_ranges(
+      unicode_tables.get_ranges("L"), unicode_tables.get_ranges("N"))
+
+
+def _get_alphanumeric_char_set():
+  """Return the set of letter and number characters."""
+  global _alphanumeric_char_set
+  if _alphanumeric_char_set is None:
+    _alphanumeric_char_set = set(
+        six.unichr(i) for first, last in get_alphanumeric_ranges()
+        for i in xrange(first, last + 1))
+  return _alphanumeric_char_set
+
+
 def _split_string_to_tokens(text):
   """Splits text to a list of string tokens."""
   if not text:
@@ -233,7 +247,8 @@ def _split_string_to_tokens(text):
   ret = []
   token_start = 0
   # Classify each character in the input string
-  is_alnum = [c in _ALPHANUMERIC_CHAR_SET for c in text]
+  alphanumeric_char_set = _get_alphanumeric_char_set()
+  is_alnum = [c in alphanumeric_char_set for c in text]
   for pos in xrange(1, len(text)):
     if is_alnum[pos] != is_alnum[pos - 1]:
       token = text[token_start:pos]
@@ -247,7 +262,8 @@ def _split_string_to_tokens(text):
 
 def _join_tokens_to_string(tokens):
   """Join a list of string tokens into a single string."""
-  token_is_alnum = [t[0] in _ALPHANUMERIC_CHAR_SET for t in tokens]
+  alphanumeric_char_set = _get_alphanumeric_char_set()
+  token_is_alnum = [t[0] in alphanumeric_char_set for t in tokens]
   ret = []
   for i, token in enumerate(tokens):
     if i > 0 and token_is_alnum[i - 1] and token_is_alnum[i]:
@@ -0,0 +1,166 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Timing traces of the stages of translation requests.
+
+A Tracer records timed spans, e.g. the tokenization, queueing, session run and
+detokenization of sampled batches, and values such as the number of decoding
+steps. The records are written as a Chrome trace-event JSON file, which can be
+opened in chrome://tracing or Perfetto, and summarized as percentiles through a
+benchmark logger from official.utils.logs.logger.
+
+Only sampled requests are recorded: callers check Tracer.sample() before timing
+a request, so a small sample rate keeps the overhead negligible.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import contextlib
+import json
+import os
+import random
+import threading
+import time
+
+# pylint: disable=g-bad-import-order
+import numpy as np
+import tensorflow as tf
+# pylint: enable=g-bad-import-order
+
+PERCENTILES = (50, 90, 99)
+
+
+class Tracer(object):
+  """Records spans and values of sampled requests as Chrome trace events.
+
+  Each span is drawn on the lane (a thread row of the trace viewer) given when
+  it is recorded, e.g. one lane per stage. The Tracer may be used from several
+  threads.
+  """
+
+  def __init__(self, sample_rate=1., seed=None):
+    """Create an empty trace.
+
+    Args:
+      sample_rate: fraction of the requests that are recorded.
+      seed: (optional) seed of the sampling of requests.
+    """
+    self.sample_rate = sample_rate
+    self._random = random.Random(seed)
+    self._lock = threading.Lock()
+    self._pid = os.getpid()
+    self._events = []
+    self._lanes = {}
+    # Lists of the durations of each span name, and of each value name.
+    self._durations = collections.defaultdict(list)
+    self._values = collections.defaultdict(list)
+
+  def sample(self):
+    """Return whether to record the next request."""
+    with self._lock:
+      return self._random.random() < self.sample_rate
+
+  def add_span(self, name, start, end, lane=None, args=None):
+    """Record a span.
+
+    Args:
+      name: name of the stage, e.g. "tokenize".
+      start: start time of the span, in seconds since the epoch.
+      end: end time of the span, in seconds since the epoch.
+      lane: (optional) name of the lane the span is drawn on. Defaults to name.
+      args: (optional) dictionary of values shown with the span.
+    """
+    with self._lock:
+      event = {"name": name, "ph": "X", "pid": self._pid,
+               "tid": self._get_lane(lane or name),
+               "ts": start * 1e6, "dur": max(0., end - start) * 1e6}
+      if args:
+        event["args"] = args
+      self._events.append(event)
+      self._durations[name].append(end - start)
+
+  @contextlib.contextmanager
+  def span(self, name, lane=None, args=None):
+    """Record the span of the body of a with statement."""
+    start = time.time()
+    yield
+    self.add_span(name, start, time.time(), lane, args)
+
+  def add_value(self, name, value, timestamp=None):
+    """Record a value, drawn as a counter in the trace.
+
+    Args:
+      name: name of the value, e.g. "decode_steps".
+      value: number.
+      timestamp: (optional) time of the value, in seconds since the epoch.
+        Defaults to now.
+    """
+    timestamp = time.time() if timestamp is None else timestamp
+    with self._lock:
+      self._events.append({"name": name, "ph": "C", "pid": self._pid,
+                           "ts": timestamp * 1e6, "args": {name: value}})
+      self._values[name].append(value)
+
+  def _get_lane(self, lane):
+    """Return the tid of a lane, adding its name to the trace if it is new."""
+    if lane not in self._lanes:
+      self._lanes[lane] = len(self._lanes)
+      self._events.append({"name": "thread_name", "ph": "M", "pid": self._pid,
+                           "tid": self._lanes[lane], "args": {"name": lane}})
+    return self._lanes[lane]
+
+  def percentiles(self, percentiles=PERCENTILES):
+    """Return the percentiles of the spans and values recorded so far.
+
+    Returns:
+      Dictionary mapping each span name to a dictionary {percentile: duration
+      in milliseconds}, and each value name to a dictionary {percentile: value}.
+    """
+    with self._lock:
+      series = dict(self._values)
+      series.update({name: 1000 * np.array(durations)
+                     for name, durations in self._durations.items()})
+    return {name: dict(zip(percentiles, np.percentile(values, percentiles)))
+            for name, values in series.items()}
+
+  def write_chrome_trace(self, filename):
+    """Write the recorded events as a Chrome trace-event JSON file."""
+    with self._lock:
+      trace = {"traceEvents": list(self._events), "displayTimeUnit": "ms"}
+    with tf.gfile.Open(filename, "w") as f:
+      json.dump(trace, f)
+
+  def log_summary(self, benchmark_logger, percentiles=PERCENTILES):
+    """Log the percentiles of the spans and values as benchmark metrics.
+
+    Args:
+      benchmark_logger: logger from official.utils.logs.logger, e.g. a
+        BenchmarkFileLogger.
+      percentiles: list of percentiles to log.
+    """
+    with self._lock:
+      counts = {name: len(durations)
+                for name, durations in self._durations.items()}
+      counts.update(
+          {name: len(values) for name, values in self._values.items()})
+    for name, values in sorted(self.percentiles(percentiles).items()):
+      unit = "ms" if name in self._durations else None
+      for percentile, value in sorted(values.items()):
+        benchmark_logger.log_metric(
+            "%s_p%d" % (name, percentile), value, unit=unit,
+            extras={"num_samples": counts[name],
+                    "sample_rate": self.sample_rate})
@@ -0,0 +1,83 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Test the timing traces."""
+
+import json
+import os
+
+import tensorflow as tf  # pylint: disable=g-bad-import-order
+
+from official.transformer.utils import tracing
+
+
+class _ListLogger(object):
+  """Benchmark logger keeping the logged metrics in a list."""
+
+  def __init__(self):
+    self.metrics = []
+
+  def log_metric(self, name, value, unit=None, global_step=None, extras=None):
+    del global_step, extras  # Unused
+    self.metrics.append((name, value, unit))
+
+
+class TracerTest(tf.test.TestCase):
+
+  def test_chrome_trace(self):
+    tracer = tracing.Tracer()
+    tracer.add_span("tokenize", 1., 1.5, args={"lines": 3})
+    tracer.add_span("session_run", 1.5, 2.)
+    tracer.add_span("tokenize", 2., 2.25)
+    tracer.add_value("decode_steps", 7, 2.)
+
+    filename = os.path.join(self.get_temp_dir(), "trace.json")
+    tracer.write_chrome_trace(filename)
+    with tf.gfile.Open(filename) as f:
+      events = json.load(f)["traceEvents"]
+
+    spans = [event for event in events if event["ph"] == "X"]
+    self.assertEqual(["tokenize", "session_run", "tokenize"],
+                     [span["name"] for span in spans])
+    self.assertEqual(1e6, spans[0]["ts"])
+    self.assertEqual(5e5, spans[0]["dur"])
+    self.assertEqual({"lines": 3}, spans[0]["args"])
+    # Spans of the same name are drawn on the same lane.
+    self.assertEqual(spans[0]["tid"], spans[2]["tid"])
+    self.assertNotEqual(spans[0]["tid"], spans[1]["tid"])
+    lanes = [event["args"]["name"] for event in events if event["ph"] == "M"]
+    self.assertEqual(["tokenize", "session_run"], lanes)
+
+  def test_log_summary(self):
+    tracer = tracing.Tracer()
+    for i in range(101):
+      tracer.add_span("queue", 0., i / 1000.)
+    tracer.add_value("decode_steps", 5)
+
+    benchmark_logger = _ListLogger()
+    tracer.log_summary(benchmark_logger)
+    metrics = {name: (value, unit)
+               for name, value, unit in benchmark_logger.metrics}
+    self.assertAllClose(50., metrics["queue_p50"][0])
+    self.assertAllClose(99., metrics["queue_p99"][0])
+    self.assertEqual("ms", metrics["queue_p90"][1])
+    self.assertEqual((5, None), metrics["decode_steps_p50"])
+
+  def test_sampling(self):
+    self.assertFalse(any(tracing.Tracer(0.).sample() for _ in range(10)))
+    self.assertTrue(all(tracing.Tracer(1.).sample() for _ in range(10)))
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -0,0 +1,137 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Code point ranges of the Unicode letters, numbers, punctuation and symbols.
+
+The tokenizer and the BLEU tokenization classify characters by the first letter
+of their Unicode category. Finding the characters of a category calls
+unicodedata.category on every code point, which takes about a second, so the
+ranges are only computed when they are first used, in a single pass over the
+code points for all the categories.
+
+The ranges depend on the Unicode database of the Python version. Those of some
+versions are precomputed in unicode_ranges.json, keyed by the version of the
+database and by sys.maxunicode, and are loaded instead of being computed. The
+file holds the ranges of Python 2.7 (Unicode 5.2.0), 3.6 (9.0.0), 3.7
+(11.0.0), 3.8 (12.1.0), 3.9 and 3.10 (13.0.0) and 3.11 (14.0.0), with wide
+Unicode builds. Running this file with another Python version, e.g. 3.5
+(8.0.0), adds its ranges to the file:
+  python unicode_tables.py
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import sys
+import unicodedata
+
+import six
+from six.moves import xrange  # pylint: disable=redefined-builtin
+
+# First letters of the categories whose ranges are computed.
+CATEGORIES = ("L", "N", "P", "S")
+TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "unicode_ranges.json")
+
+_ranges = None
+
+
+def get_table_key():
+  """Return the key of the ranges of the current Python version."""
+  return "%s/%d" % (unicodedata.unidata_version, sys.maxunicode)
+
+
+def compute_ranges():
+  """Return the ranges of each category, from the Unicode database.
+
+  As in the original character sets, the code points below sys.maxunicode are
+  classified.
+
+  Returns:
+    Dictionary mapping the first letter of each category in CATEGORIES to the
+    sorted list of its [first, last] code point ranges.
+  """
+  ranges = {category: [] for category in CATEGORIES}
+  for codepoint in xrange(sys.maxunicode):
+    category_ranges = ranges.get(
+        unicodedata.category(six.unichr(codepoint))[0])
+    if category_ranges is None:
+      continue
+    if category_ranges and category_ranges[-1][1] == codepoint - 1:
+      category_ranges[-1][1] = codepoint
+    else:
+      category_ranges.append([codepoint, codepoint])
+  return ranges
+
+
+def _load_ranges(filename):
+  """Return the precomputed ranges of the current Python version, or None."""
+  if not os.path.exists(filename):
+    return None
+  with open(filename) as f:
+    return json.load(f).get(get_table_key())
+
+
+def get_ranges(category):
+  """Return the [first, last] code point ranges of a category.
+
+  Args:
+    category: first letter of the categories, one of CATEGORIES.
+
+  Returns:
+    Sorted list of the ranges of the code points whose category starts with
+    category.
+  """
+  global _ranges
+  if _ranges is None:
+    _ranges = _load_ranges(TABLE_FILE) or compute_ranges()
+  return _ranges[category]
+
+
+def get_chars(category):
+  """Return the string of the characters of a category, in code point order."""
+  return u"".join(six.unichr(codepoint)
+                  for first, last in get_ranges(category)
+                  for codepoint in xrange(first, last + 1))
+
+
+def merge_ranges(*ranges_lists):
+  """Return the sorted union of lists of ranges, merging adjacent ranges."""
+  merged = []
+  for first, last in sorted(r for ranges in ranges_lists for r in ranges):
+    if merged and first <= merged[-1][1] + 1:
+      merged[-1][1] = max(merged[-1][1], last)
+    else:
+      merged.append([first, last])
+  return merged
+
+
+def write_ranges(filename=TABLE_FILE):
+  """Add the ranges of the current Python version to a table file."""
+  table = {}
+  if os.path.exists(filename):
+    with open(filename) as f:
+      table = json.load(f)
+  table[get_table_key()] = compute_ranges()
+  with open(filename, "w") as f:
+    json.dump(table, f, sort_keys=True, separators=(",", ":"))
+    f.write("\n")
+
+
+if __name__ == "__main__":
+  write_ranges()
+  print("Wrote the Unicode ranges of %s to %s." % (get_table_key(), TABLE_FILE))
@@ -0,0 +1,78 @@
+# Copyright 2018 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Test the Unicode category ranges against the Unicode database."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import sys
+import unicodedata
+
+import six
+from six.moves import xrange  # pylint: disable=redefined-builtin
+import tensorflow as tf  # pylint: disable=g-bad-import-order
+
+from official.transformer.utils import unicode_tables
+
+
+class UnicodeTablesTest(tf.test.TestCase):
+
+  def test_ranges(self):
+    ranges = unicode_tables.compute_ranges()
+    for category in unicode_tables.CATEGORIES:
+      # The ranges hold the code points of the category, as the characters
+      # sets built from the whole Unicode database.
+      self.assertEqual(
+          [i for i in xrange(sys.maxunicode)
+           if unicodedata.category(six.unichr(i)).startswith(category)],
+          [i for first, last in ranges[category]
+           for i in xrange(first, last + 1)])
+      # The ranges are sorted and not adjacent.
+      for previous, current in zip(ranges[category], ranges[category][1:]):
+        self.assertLess(previous[1] + 1, current[0])
+
+    # The precomputed ranges of the current Python version, if any, are the
+    # computed ones.
+    precomputed = unicode_tables._load_ranges(unicode_tables.TABLE_FILE)  # pylint: disable=protected-access
+    self.assertEqual(ranges, precomputed or ranges)
+
+  def test_get_chars(self):
+    self.assertIn(u",", unicode_tables.get_chars("P"))
+    self.assertIn(u"$", unicode_tables.get_chars("S"))
+    self.assertNotIn(u"a", unicode_tables.get_chars("P"))
+
+  def test_merge_ranges(self):
+    self.assertEqual(
+        [[1, 5], [7, 9], [11, 11]],
+        unicode_tables.merge_ranges([[1, 2], [7, 7], [11, 11]],
+                                    [[3, 5], [8, 9]]))
+
+  def test_write_ranges(self):
+    filename = os.path.join(self.get_temp_dir(), "ranges.json")
+    with open(filename, "w") as f:
+      json.dump({"other/1": {"L": [[0, 1]]}}, f)
+    unicode_tables.write_ranges(filename)
+    with open(filename) as f:
+      table = json.load(f)
+    self.assertEqual({"other/1", unicode_tables.get_table_key()}, set(table))
+    self.assertEqual(unicode_tables.compute_ranges(),
+                     table[unicode_tables.get_table_key()])
+
+
+if __name__ == "__main__":
+  tf.test.main()